@@ -0,0 +1,185 @@
+"""
+Connection admission control for MP3 Streamer
+Streams and control requests draw from separate budgets, so a reconnect
+storm of devices fills the stream slots and gets a quick 503 + Retry-After
+while the web UI and /status keep working. Stream writes run under a
+per-write timeout and a minimum sustained send rate, so a device that stops
+reading loses its slot instead of holding it (and, in threaded mode, a
+thread) forever. In threaded mode idle keep-alive connections give up their
+slot to new ones once the connection cap is reached.
+"""
+import random
+import socket
+import threading
+import time
+from config import (MAX_STREAMS, MAX_CONTROL_REQUESTS, KEEPALIVE_IDLE_SLOTS, STREAM_MIN_RATE,
+                    STREAM_MIN_RATE_WINDOW, RETRY_AFTER_SECONDS)
+import metrics
+
+class SlowClientError(Exception):
+    """A stream client fell below STREAM_MIN_RATE."""
+
+class Budget:
+    """A counted pool of slots."""
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+        self.rejected = 0
+
+    def acquire(self):
+        """Take a slot; False (and a counted rejection) when the budget is full."""
+        if self.take():
+            return True
+        self.reject()
+        return False
+
+    def take(self):
+        """Take a slot if one is free, without counting a rejection."""
+        with self.lock:
+            if self.active >= self.limit:
+                return False
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            return True
+
+    def reject(self):
+        with self.lock:
+            self.rejected += 1
+        metrics.admission_rejected.inc(self.name)
+
+    def release(self):
+        with self.lock:
+            self.active -= 1
+
+    def get_status(self):
+        with self.lock:
+            return {"active": self.active, "limit": self.limit, "peak": self.peak, "rejected": self.rejected}
+
+class RateGuard:
+    """
+    Minimum send rate for one stream, measured over the time the server spent
+    blocked writing to it (pauses and waits for live data don't count), so a
+    paced or idle stream is never mistaken for a slow client.
+    """
+    def __init__(self):
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def sent(self, count, seconds):
+        """Record one write; raises SlowClientError once a full window is below the minimum."""
+        if STREAM_MIN_RATE <= 0:
+            return
+        self.bytes += count
+        self.seconds += seconds
+        if self.seconds >= STREAM_MIN_RATE_WINDOW:
+            rate = self.bytes / self.seconds
+            self.bytes, self.seconds = 0, 0.0
+            if rate < STREAM_MIN_RATE:
+                raise SlowClientError(f"{rate:.0f} B/s is below the {STREAM_MIN_RATE} B/s minimum")
+
+class Admission:
+    def __init__(self):
+        self.streams = Budget('stream', MAX_STREAMS)
+        self.control = Budget('control', MAX_CONTROL_REQUESTS)
+        # Threaded mode: one thread per connection, capped before the request is even read
+        self.connections = Budget('connection', MAX_STREAMS + MAX_CONTROL_REQUESTS + KEEPALIVE_IDLE_SLOTS)
+        self.lock = threading.Lock()
+        self.evictions = {}   # reason -> count
+        self.idle = {}        # keep-alive socket waiting for its next request -> when it went idle
+        self.reclaimed = set()   # Closed idle sockets whose slot went to a new connection
+        self.idle_closed = 0
+
+    def budget_for(self, method, path, stream_routes):
+        """The budget a request draws from: streams for long-lived GETs, control for the rest."""
+        if method == 'GET' and path.split('?', 1)[0] in stream_routes:
+            return self.streams
+        return self.control
+
+    def acquire_connection(self):
+        """
+        A connection slot for a new threaded-mode connection. When all are
+        taken, the longest-idle keep-alive connection is closed and its slot
+        handed over, so idle sockets can't lock out requests that have work.
+        """
+        if self.connections.take():
+            return True
+        with self.lock:
+            sock = min(self.idle, key=self.idle.get) if self.idle else None
+            if sock is not None:
+                del self.idle[sock]
+                self.reclaimed.add(sock)
+                self.idle_closed += 1
+        if sock is None:
+            self.connections.reject()
+            return False
+        try:
+            sock.shutdown(socket.SHUT_RDWR)   # Its handler thread sees EOF and exits
+        except OSError:
+            pass
+        return True
+
+    def release_connection(self, sock):
+        """Release a finished connection's slot, unless it was handed to a new connection."""
+        with self.lock:
+            self.idle.pop(sock, None)
+            if sock in self.reclaimed:
+                self.reclaimed.discard(sock)
+                return
+        self.connections.release()
+
+    def idle_start(self, sock):
+        with self.lock:
+            self.idle[sock] = time.monotonic()
+
+    def idle_end(self, sock):
+        with self.lock:
+            self.idle.pop(sock, None)
+
+    def evict(self, reason):
+        """Count a stream dropped by the server ('timeout' or 'slow')."""
+        with self.lock:
+            self.evictions[reason] = self.evictions.get(reason, 0) + 1
+        metrics.stream_evictions.inc(reason)
+
+    def retry_after(self):
+        """Seconds to send in Retry-After, jittered so rejected devices don't come back in lockstep."""
+        return random.randint(RETRY_AFTER_SECONDS, 2 * RETRY_AFTER_SECONDS)
+
+    def busy_response(self, budget):
+        """A complete 503 response for a raw socket."""
+        body = f"Server busy ({budget.name} slots full), retry later.\n".encode('latin-1')
+        return (f"HTTP/1.0 503 Service Unavailable\r\nRetry-After: {self.retry_after()}\r\n"
+                f"Content-Type: text/plain\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+                ).encode('latin-1') + body
+
+    def get_status(self):
+        with self.lock:
+            evictions = dict(self.evictions)
+            idle = len(self.idle)
+            idle_closed = self.idle_closed
+        connections = self.connections.get_status()
+        connections.update(idle=idle, idleClosed=idle_closed)
+        return {
+            "streams": self.streams.get_status(),
+            "control": self.control.get_status(),
+            "connections": connections,
+            "evictions": evictions
+        }
+
+def turn_away(sock, response):
+    """Send a 503 on a connection whose request hasn't been read, without blocking the caller."""
+    try:
+        sock.setblocking(False)
+        try:
+            sock.recv(65536)   # Take what's arrived, so closing doesn't reset the connection under the reply
+        except BlockingIOError:
+            pass
+        sock.send(response)
+    except OSError:
+        pass
+
+# Global admission instance
+admission = Admission()
@@ -0,0 +1,280 @@
+"""
+asyncio server core for MP3 Streamer
+Long-lived /stream and /live connections live on a single event loop; short control
+requests (/status, /play, /upload, ...) are handed to a small thread pool
+running the regular MP3StreamerHandler, so blocking ffmpeg work never
+stalls the loop. Connections are HTTP/1.1 persistent: between requests an
+idle connection waits on the loop, not in a control thread.
+"""
+import asyncio
+import http
+import http.client
+import io
+import socket
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from config import CHUNK_SIZE, ASYNC_CONTROL_WORKERS, ASYNC_OPEN_WORKERS, ASYNC_HEADER_TIMEOUT, STREAM_WRITE_TIMEOUT, KEEPALIVE_TIMEOUT
+import config
+from handler import MP3StreamerHandler
+from stream_source import STREAM_ROUTES, FileRegion, Pause, WaitFor, SendBuffer, frame
+import metrics
+from metrics import StreamMeter
+from admission import admission, RateGuard, SlowClientError
+
+MAX_HEADER_SIZE = 65536
+
+class PrefixedReader:
+    """rfile replacement that replays bytes already read by the event loop."""
+    def __init__(self, prefix, rfile):
+        self.prefix = prefix
+        self.rfile = rfile
+
+    def read(self, size=-1):
+        if not self.prefix:
+            return self.rfile.read(size)
+        if size is None or size < 0:
+            data, self.prefix = self.prefix, b''
+            return data + self.rfile.read()
+
+        data, self.prefix = self.prefix[:size], self.prefix[size:]
+        if len(data) < size:
+            data += self.rfile.read(size - len(data))
+        return data
+
+    def readline(self, size=-1):
+        if not self.prefix:
+            return self.rfile.readline(size)
+
+        limited = size is not None and size >= 0
+        end = self.prefix.find(b'\n', 0, size if limited else len(self.prefix))
+        if end != -1:
+            end += 1
+        elif limited and size <= len(self.prefix):
+            end = size
+        else:
+            # Line continues past the replayed bytes
+            data, self.prefix = self.prefix, b''
+            return data + self.rfile.readline(size - len(data) if limited else -1)
+
+        data, self.prefix = self.prefix[:end], self.prefix[end:]
+        return data
+
+    def leftover(self):
+        """Bytes received but not consumed (a pipelined next request); the socket must be non-blocking."""
+        data, self.prefix = self.prefix, b''
+        return data + (self.rfile.peek() or b'')
+
+    def close(self):
+        self.rfile.close()
+
+class HandoffHandler(MP3StreamerHandler):
+    """MP3StreamerHandler for one request whose head the event loop already read."""
+    def __init__(self, request, client_address, server, prefix):
+        self.prefix = prefix
+        self.leftover = b''
+        super().__init__(request, client_address, server)
+
+    def setup(self):
+        super().setup()
+        self.rfile = PrefixedReader(self.prefix, self.rfile)
+
+    def handle(self):
+        # One request; the event loop waits for the next one on a kept-alive connection
+        self.close_connection = True
+        self.handle_one_request()
+
+    def finish(self):
+        if not self.close_connection:
+            self.connection.setblocking(False)
+            self.leftover = self.rfile.leftover()
+        super().finish()
+
+    def admit(self, budget):
+        return True   # The event loop took this request's control slot before handing it off
+
+class AsyncStreamerServer:
+    """Event-loop HTTP server with the same surface main.py uses on ThreadingSimpleServer."""
+    def __init__(self, server_address):
+        self.server_address = server_address
+        self.socket = socket.create_server(server_address, backlog=1024)
+        self.socket.setblocking(False)
+        self.executor = ThreadPoolExecutor(max_workers=ASYNC_CONTROL_WORKERS,
+                                           thread_name_prefix="control")
+        # Stream opens get their own threads, so stalled uploads can't hold them up
+        self.open_executor = ThreadPoolExecutor(max_workers=ASYNC_OPEN_WORKERS,
+                                                thread_name_prefix="stream-open")
+        self.tasks = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.server_close()
+
+    def serve_forever(self):
+        asyncio.run(self.serve())
+
+    def server_close(self):
+        self.socket.close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.open_executor.shutdown(wait=False, cancel_futures=True)
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            conn, addr = await loop.sock_accept(self.socket)
+            task = asyncio.create_task(self.handle_connection(conn, addr))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def handle_connection(self, conn, addr):
+        """Serve a connection's requests in turn: /stream here, the rest on a control thread."""
+        loop = asyncio.get_running_loop()
+        buffered = b''
+        timeout = ASYNC_HEADER_TIMEOUT
+        try:
+            while True:
+                head, buffered = await asyncio.wait_for(self.read_head(loop, conn, buffered), timeout)
+                if not head:
+                    return
+                timeout = KEEPALIVE_TIMEOUT
+
+                request_line = head.split(b'\r\n', 1)[0].decode('latin-1')
+                words = request_line.split()
+                open_stream = STREAM_ROUTES.get(words[1].split('?', 1)[0]) if len(words) == 3 and words[0] == 'GET' else None
+                budget = admission.streams if open_stream else admission.control
+                if not budget.acquire():
+                    await loop.sock_sendall(conn, admission.busy_response(budget))
+                    print(f'{addr[0]} - - "{request_line}" 503 (async, {budget.name} slots full)')
+                    return
+                try:
+                    if open_stream:
+                        keep_alive = await self.serve_stream(loop, conn, addr, request_line, head, open_stream)
+                    else:
+                        keep_alive, buffered = await loop.run_in_executor(
+                            self.executor, self.handoff, conn, addr, head + buffered)
+                finally:
+                    budget.release()
+                if not keep_alive:
+                    return
+        except asyncio.TimeoutError:
+            pass
+        except Exception as e:
+            print(f"Server Error ({addr[0]}): {e}")
+        finally:
+            try:
+                conn.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+            conn.close()
+
+    async def read_head(self, loop, conn, buffered=b''):
+        """Read until the end of the request headers; returns (head, bytes after it),
+        or (b'', b'') if the client went away."""
+        data = buffered
+        while b'\r\n\r\n' not in data:
+            if len(data) > MAX_HEADER_SIZE:
+                return b'', b''
+            chunk = await loop.sock_recv(conn, 4096)
+            if not chunk:
+                return b'', b''
+            data += chunk
+        end = data.index(b'\r\n\r\n') + 4
+        return data[:end], data[end:]
+
+    def handoff(self, conn, addr, data):
+        """Run the threaded handler for one control request (executor thread).
+        Returns (keep the connection, bytes already read past the request)."""
+        try:
+            conn.setblocking(True)
+            handler = HandoffHandler(conn, addr, self, data)
+            return not handler.close_connection, handler.leftover
+        except Exception as e:
+            print(f"Control handler error ({addr[0]}): {e}")
+            return False, b''
+        finally:
+            conn.setblocking(False)
+
+    async def serve_stream(self, loop, conn, addr, request_line, head, open_stream):
+        """Serve /stream, /live or /events on the event loop; returns whether the connection can be reused."""
+        started = time.monotonic()
+        route = request_line.split()[1].split('?', 1)[0]
+        version = request_line.split()[2]
+        request_headers = http.client.parse_headers(io.BytesIO(head.split(b'\r\n', 1)[1]))
+        params = urllib.parse.parse_qs(urllib.parse.urlsplit(request_line.split()[1]).query)
+        # Opening may scan a track for its frame index; keep that off the event loop
+        status, headers, body = await loop.run_in_executor(self.open_executor, open_stream, params, request_headers)
+        connection = request_headers.get('Connection', '').lower()
+        keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+        headers, items, close = frame(headers, body, version == 'HTTP/1.1', route)
+        if keep_alive and close:
+            keep_alive = False
+        elif not keep_alive and not close:
+            headers.append(('Connection', 'close'))
+        lines = [f"HTTP/1.1 {status} {http.HTTPStatus(status).phrase}"] + [f"{name}: {value}" for name, value in headers]
+        await loop.sock_sendall(conn, ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+        print(f'{addr[0]} - - "{request_line}" {status} (async)')
+        metrics.request_seconds.observe(time.monotonic() - started, 'GET', route)
+        if body is None:
+            return keep_alive
+
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        meter = StreamMeter(route)
+        reason = 'error'
+        try:
+            await self.write_stream_body(loop, conn, items, meter)
+            reason = 'complete'
+        except (BrokenPipeError, ConnectionResetError):
+            reason = 'client'
+            print(f"Streamer: Client disconnected while streaming (ID: {config.STREAM_ID}).")
+        except TimeoutError:
+            reason = 'evicted'
+            admission.evict('timeout')
+            print(f"Streamer: Dropped {addr[0]}, write blocked for {STREAM_WRITE_TIMEOUT}s.")
+        except SlowClientError as e:
+            reason = 'evicted'
+            admission.evict('slow')
+            print(f"Streamer: Dropped slow client {addr[0]}: {e}")
+        finally:
+            body.close()
+            meter.close(reason)
+        return keep_alive and reason == 'complete'
+
+    async def write_stream_body(self, loop, conn, items, meter):
+        """Write a framed stream_source body without blocking the loop."""
+        guard = RateGuard()
+        for item in items:
+            if isinstance(item, FileRegion):
+                sent_at = time.monotonic()
+                await asyncio.wait_for(self.send_file_region(loop, conn, item.f, item.offset, item.count),
+                                       STREAM_WRITE_TIMEOUT)
+                elapsed = time.monotonic() - sent_at
+                meter.sent(item.count, elapsed)
+                guard.sent(item.count, elapsed)
+            elif isinstance(item, Pause):
+                await asyncio.sleep(item.seconds)
+            elif isinstance(item, WaitFor):
+                await item.source.wait_async(item.cursor, item.timeout)
+            elif isinstance(item, SendBuffer):
+                conn.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, item.size)
+            else:
+                sent_at = time.monotonic()
+                await asyncio.wait_for(loop.sock_sendall(conn, item), STREAM_WRITE_TIMEOUT)
+                elapsed = time.monotonic() - sent_at
+                meter.sent(len(item), elapsed)
+                guard.sent(len(item), elapsed)
+
+    async def send_file_region(self, loop, conn, f, offset, count):
+        if config.STREAM_USE_SENDFILE:
+            await loop.sock_sendfile(conn, f, offset, count)
+            return
+
+        f.seek(offset)
+        remaining = count
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            await loop.sock_sendall(conn, chunk)
+            remaining -= len(chunk)
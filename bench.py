@@ -0,0 +1,568 @@
+#!/usr/bin/env python3
+"""
+Load test for MP3 Streamer
+Starts main.py in a scratch directory with a stand-in ffmpeg and a local
+MQTT stand-in, then holds N ESP8266-like /stream readers open (small TCP
+window, one segment per read, a 16 KB playback buffer drained at the track
+bitrate, random Wi-Fi drops) while /upload, /play and /status traffic runs
+alongside. Reports time-to-first-byte, per-client throughput, playback
+stalls and the server's RSS, threads and CPU, and compares them with a
+saved baseline so a regression shows up as a number.
+
+    python3 bench.py --clients 100 --duration 60 --mode both
+    python3 bench.py --clients 100 --duration 60 --save-baseline
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(BENCH_DIR, 'bench_baseline.json')
+
+# ESP8266 (lwIP) defaults: 1460-byte segments, a 4-segment receive window
+ESP_READ_SIZE = 1460
+ESP_RCVBUF = 4 * 1460
+ESP_BUFFER = 16 * 1024          # Decoder input buffer
+ESP_PREFILL = 8 * 1024          # Buffered before playback starts
+TRACK_KBPS = 64                 # Library tracks (matches UPLOAD_ENCODE_ARGS)
+TRACK_SECONDS = 180
+LIBRARY_TRACKS = 8
+
+# Per-metric direction and the slack allowed before it counts as a regression:
+# a fraction of the baseline, plus an absolute floor for metrics near zero
+CHECKS = {
+    "ttfbP50Ms": ('lower', 0.5, 20),
+    "ttfbP95Ms": ('lower', 0.5, 50),
+    "throughputP5Kbps": ('higher', 0.2, 4),
+    "stallsPerClientMinute": ('lower', 0.5, 0.2),
+    "streamErrors": ('lower', 0.5, 2),
+    "controlP95Ms": ('lower', 0.5, 50),
+    "controlErrors": ('lower', 0.5, 2),
+    "peakRssMb": ('lower', 0.25, 10),
+    "peakThreads": ('lower', 0.25, 10),
+    "cpuPercent": ('lower', 0.5, 10),
+}
+# Metrics where anything above zero is a regression, baseline or not
+ZERO_CHECKS = {"ffmpegJobFailures"}
+
+# --- Synthetic audio ---------------------------------------------------------
+
+BITRATE_INDEX = [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160]
+
+def mp3_frames(kbps, seconds, filler=0x11):
+    """Valid MPEG-2 layer III frames (22050 Hz mono) at kbps, about `seconds` long."""
+    header = bytes([0xFF, 0xF3, BITRATE_INDEX.index(kbps) << 4, 0xC4])
+    frame = header + bytes([filler]) * (72 * kbps * 1000 // 22050 - 4)
+    return frame * int(seconds * 22050 / 576)
+
+# Stand-in for the ffmpeg binary: reads its input, reports a duration and
+# progress the way ffmpeg does and writes every output (the argument after
+# each "-f <format>"), as frames at that output's bitrate or silent PCM WAV
+FAKE_FFMPEG = '''#!{python}
+import struct, sys, time
+sys.path.insert(0, {bench_dir!r})
+from bench import mp3_frames
+args = sys.argv[1:]
+source = args[args.index("-i") + 1]
+data = sys.stdin.buffer.read() if source == "pipe:0" else open(source, "rb").read()
+seconds = {seconds}
+outputs = []
+kbps = 64
+i = args.index("-i") + 2
+while i < len(args):
+    if args[i] == "-b:a":
+        kbps = int(args[i + 1].rstrip("k"))
+    elif args[i] == "-f" and i + 2 < len(args):
+        outputs.append((args[i + 1], kbps, args[i + 2]))
+        kbps = 64
+        i += 3
+        continue
+    i += 1
+sys.stderr.write("Duration: 00:00:%05.2f, start: 0.000000, bitrate: %d kb/s\\n" % (seconds, outputs[0][1] if outputs else 64))
+for step in range(1, 5):
+    time.sleep({encode_seconds} / 4)
+    sys.stderr.write("out_time=00:00:%09.6f\\n" % (seconds * step / 4))
+    sys.stderr.flush()
+for fmt, kbps, path in outputs:
+    with open(path, "wb") as out:
+        if fmt == "wav":
+            audio = bytes([0x80]) * int(8000 * seconds)
+            out.write(b"RIFF" + struct.pack("<I", 36 + len(audio)) + b"WAVEfmt " +
+                      struct.pack("<IHHIIHH", 16, 1, 1, 8000, 8000, 1, 8) + b"data" + struct.pack("<I", len(audio)) + audio)
+        else:
+            out.write(mp3_frames(kbps, seconds, filler=len(data) % 256))
+'''
+
+# --- MQTT stand-in -----------------------------------------------------------
+
+class FakeBroker:
+    """Just enough MQTT 3.1.1 for the server: CONNACK, SUBACK, PUBACK and PINGRESP."""
+    def __init__(self):
+        self.sock = socket.socket()
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(8)
+        self.port = self.sock.getsockname()[1]
+        self.publishes = 0
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            conn, _ = self.sock.accept()
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        try:
+            while True:
+                header, body = _read_packet(conn)
+                kind = header >> 4
+                if kind == 1:                                    # CONNECT
+                    conn.sendall(b'\x20\x02\x00\x00')
+                elif kind == 8:                                  # SUBSCRIBE
+                    conn.sendall(b'\x90\x03' + body[:2] + b'\x01')
+                elif kind == 3:                                  # PUBLISH
+                    self.publishes += 1
+                    if (header >> 1) & 0x03:
+                        offset = 2 + int.from_bytes(body[:2], 'big')
+                        conn.sendall(b'\x40\x02' + body[offset:offset + 2])
+                elif kind == 12:                                 # PINGREQ
+                    conn.sendall(b'\xd0\x00')
+                elif kind == 14:                                 # DISCONNECT
+                    break
+        except (OSError, EOFError):
+            pass
+        finally:
+            conn.close()
+
+def _read_packet(conn):
+    header = _read_exact(conn, 1)[0]
+    length, shift = 0, 0
+    while True:
+        byte = _read_exact(conn, 1)[0]
+        length |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            break
+    return header, _read_exact(conn, length)
+
+def _read_exact(conn, count):
+    data = b''
+    while len(data) < count:
+        chunk = conn.recv(count - len(data))
+        if not chunk:
+            raise EOFError
+        data += chunk
+    return data
+
+# --- Clients -----------------------------------------------------------------
+
+class Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ttfb = []              # Seconds from connect to the first audio byte
+        self.throughput = []        # Bytes/s over each connection that lasted 5s+
+        self.stalls = 0             # Playback buffer underruns
+        self.drops = 0              # Simulated Wi-Fi drops
+        self.connections = 0
+        self.stream_errors = {}     # Status code or exception name -> count
+        self.control = {}           # Endpoint -> [latency seconds]
+        self.control_errors = {}    # "endpoint status" -> count
+
+    def add(self, name, value):
+        with self.lock:
+            getattr(self, name).append(value)
+
+    def add_control(self, endpoint, latency):
+        with self.lock:
+            self.control.setdefault(endpoint, []).append(latency)
+
+    def count(self, table, key):
+        with self.lock:
+            table = getattr(self, table)
+            table[key] = table.get(key, 0) + 1
+
+class ESPReader(threading.Thread):
+    """
+    One device: connects, fills its buffer, then reads only as fast as the
+    decoder drains it. The buffer running dry after playback started is a
+    stall. Each second there is a drop_rate chance the Wi-Fi drops; the
+    device then reassociates and reconnects from scratch, as the firmware does.
+    """
+    def __init__(self, port, results, stop_at, drop_rate, kbps):
+        super().__init__(daemon=True)
+        self.port = port
+        self.results = results
+        self.stop_at = stop_at
+        self.drop_rate = drop_rate
+        self.drain_rate = kbps * 1000 / 8
+        self.level = 0          # Bytes in the decoder buffer
+        self.playing = False
+        self.last = 0
+
+    def run(self):
+        while time.monotonic() < self.stop_at:
+            try:
+                self.session()
+            except OSError as e:
+                self.results.count('stream_errors', type(e).__name__)
+                time.sleep(random.uniform(0.5, 2.0))
+
+    def play(self, now):
+        """Drain the buffer up to now; an underrun stops playback until it refills."""
+        if self.playing:
+            self.level -= (now - self.last) * self.drain_rate
+            if self.level <= 0:
+                self.level, self.playing = 0, False
+                with self.results.lock:
+                    self.results.stalls += 1
+        self.last = now
+        if not self.playing and self.level >= ESP_PREFILL:
+            self.playing = True
+
+    def session(self):
+        sock = socket.socket()
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, ESP_RCVBUF)
+        # Loopback's 64 KB MSS would let the server's send buffer autotune to
+        # megabytes and swallow whole tracks; the ESP's 1460 keeps it realistic
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_MAXSEG, ESP_READ_SIZE)
+        sock.settimeout(10)
+        started = time.monotonic()
+        try:
+            sock.connect(('127.0.0.1', self.port))
+            sock.sendall(b'GET /stream HTTP/1.0\r\nHost: bench\r\n\r\n')
+            head = b''
+            while b'\r\n\r\n' not in head:
+                chunk = sock.recv(ESP_READ_SIZE)
+                if not chunk:
+                    raise ConnectionResetError("closed before headers")
+                head += chunk
+            head, body = head.split(b'\r\n\r\n', 1)
+            status = head.split(b' ', 2)[1].decode()
+            with self.results.lock:
+                self.results.connections += 1
+            if status not in ('200', '206'):
+                self.results.count('stream_errors', status)
+                retry_after = [line.split(b':', 1)[1] for line in head.split(b'\r\n')
+                               if line.lower().startswith(b'retry-after:')]
+                time.sleep(float(retry_after[0]) if retry_after else random.uniform(1.0, 3.0))
+                return
+
+            while not body:
+                body = sock.recv(ESP_READ_SIZE)
+                if not body:
+                    return
+            first_byte = time.monotonic()
+            self.results.add('ttfb', first_byte - started)
+            self.level, self.playing, self.last = len(body), False, first_byte
+            received = len(body)
+            next_drop_check = first_byte + 1
+
+            while True:
+                now = time.monotonic()
+                if now >= self.stop_at:
+                    break
+                if now >= next_drop_check:
+                    next_drop_check += 1
+                    if random.random() < self.drop_rate:
+                        with self.results.lock:
+                            self.results.drops += 1
+                        sock.close()
+                        time.sleep(random.uniform(0.5, 3.0))   # Reassociating
+                        break
+                self.play(now)
+                # Room for one more segment? Otherwise wait for the decoder
+                excess = self.level + ESP_READ_SIZE - ESP_BUFFER
+                if excess > 0:
+                    time.sleep(excess / self.drain_rate)
+                    continue
+                chunk = sock.recv(ESP_READ_SIZE)
+                if not chunk:
+                    break     # End of track; the device reconnects
+                self.play(time.monotonic())
+                self.level += len(chunk)
+                received += len(chunk)
+
+            elapsed = time.monotonic() - first_byte
+            if elapsed >= 5:
+                self.results.add('throughput', received / elapsed)
+        finally:
+            sock.close()
+
+class ControlClient(threading.Thread):
+    """Browser/device control traffic: one endpoint about every `interval` seconds."""
+    def __init__(self, port, results, stop_at, endpoint, interval, tracks):
+        super().__init__(daemon=True)
+        self.base = f"http://127.0.0.1:{port}"
+        self.results = results
+        self.stop_at = stop_at
+        self.endpoint = endpoint
+        self.interval = interval
+        self.tracks = tracks
+
+    def run(self):
+        while time.monotonic() < self.stop_at:
+            started = time.monotonic()
+            try:
+                with urllib.request.urlopen(self.request(), timeout=15) as response:
+                    response.read()
+                self.results.add_control(self.endpoint, time.monotonic() - started)
+            except Exception as e:
+                self.results.count('control_errors', f"{self.endpoint} {getattr(e, 'code', type(e).__name__)}")
+            time.sleep(max(0, min(self.interval * random.uniform(0.5, 1.5), self.stop_at - time.monotonic())))
+
+    def request(self):
+        if self.endpoint == '/play':
+            name = urllib.parse.quote(random.choice(self.tracks))
+            return urllib.request.Request(f"{self.base}/play?file={name}", method='POST')
+        if self.endpoint == '/upload':
+            # Unique content, so every upload is a (stand-in) transcode rather than a cache hit
+            boundary = uuid.uuid4().hex
+            body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; "
+                    f"filename=\"bench {boundary[:8]}.wav\"\r\nContent-Type: audio/wav\r\n\r\n").encode()
+            body += os.urandom(32 * 1024) + f"\r\n--{boundary}--\r\n".encode()
+            return urllib.request.Request(f"{self.base}/upload", data=body, method='POST', headers={
+                'Content-Type': f'multipart/form-data; boundary={boundary}'})
+        return urllib.request.Request(self.base + self.endpoint)
+
+# --- Server ------------------------------------------------------------------
+
+class ServerSampler(threading.Thread):
+    """Samples the server's RSS, thread count and CPU time from /proc once a second."""
+    def __init__(self, pid):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.rss = []
+        self.threads = []
+        self.cpu_seconds = None
+        self.wall_seconds = None
+        self.running = True
+
+    def run(self):
+        started, cpu_start = time.monotonic(), self.cpu_time()
+        while self.running:
+            try:
+                with open(f"/proc/{self.pid}/status") as f:
+                    fields = dict(line.split(':', 1) for line in f if ':' in line)
+                self.rss.append(int(fields['VmRSS'].split()[0]) * 1024)
+                self.threads.append(int(fields['Threads']))
+            except (OSError, KeyError, ValueError):
+                break
+            time.sleep(1)
+            self.cpu_seconds = self.cpu_time() - cpu_start
+            self.wall_seconds = time.monotonic() - started
+
+    def cpu_time(self):
+        try:
+            with open(f"/proc/{self.pid}/stat") as f:
+                # utime and stime follow the parenthesised command name
+                fields = f.read().rsplit(')', 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+        except (OSError, IndexError, ValueError):
+            return 0.0
+
+def start_server(workdir, port, broker_port, mode, encode_seconds):
+    """Lay out a library and the stand-in ffmpeg in workdir and start main.py there."""
+    os.makedirs(os.path.join(workdir, 'mp3s'))
+    tracks = []
+    for i in range(LIBRARY_TRACKS):
+        name = f"bench track {i}.mp3"
+        with open(os.path.join(workdir, 'mp3s', name), 'wb') as f:
+            f.write(mp3_frames(TRACK_KBPS, TRACK_SECONDS, filler=i + 1))
+        tracks.append(name)
+
+    ffmpeg = os.path.join(workdir, 'ffmpeg')
+    with open(ffmpeg, 'w') as f:
+        f.write(FAKE_FFMPEG.format(python=sys.executable, bench_dir=BENCH_DIR,
+                                   seconds=TRACK_SECONDS / 6, encode_seconds=encode_seconds))
+    os.chmod(ffmpeg, 0o755)
+
+    env = dict(os.environ, PORT=str(port), HOST='127.0.0.1', SERVER_MODE=mode,
+               MQTT_BROKER='127.0.0.1', MQTT_PORT=str(broker_port), PYTHONUNBUFFERED='1')
+    log = open(os.path.join(workdir, 'server.log'), 'wb')
+    process = subprocess.Popen([sys.executable, os.path.join(BENCH_DIR, 'main.py')],
+                               cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    # Up once the catalog scan has found the library and the first track plays
+    play = f"http://127.0.0.1:{port}/play?file={urllib.parse.quote(tracks[0])}"
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            break
+        try:
+            urllib.request.urlopen(urllib.request.Request(play, method='POST'), timeout=2).read()
+            return process, tracks
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    with open(os.path.join(workdir, 'server.log'), 'rb') as f:
+        print(f.read().decode('utf-8', 'replace')[-3000:])
+    raise SystemExit("bench: server did not come up")
+
+def scrape_metrics(port):
+    """The server's /metrics text, or None if it didn't answer."""
+    try:
+        return urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5).read().decode()
+    except OSError:
+        return None
+
+def counter_total(text, name):
+    """Sum of a counter over all its label sets in a /metrics scrape."""
+    if text is None:
+        return None
+    return sum(float(line.rsplit(' ', 1)[1]) for line in text.splitlines()
+               if line.startswith(name + '{') or line.startswith(name + ' '))
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+# --- Run and report ----------------------------------------------------------
+
+def run(mode, args):
+    """One benchmark run against a fresh server; returns the summary dict."""
+    broker = FakeBroker()
+    port = free_port()
+    with tempfile.TemporaryDirectory(prefix='mp3bench-') as workdir:
+        process, tracks = start_server(workdir, port, broker.port, mode, args.encode_seconds)
+        try:
+            sampler = ServerSampler(process.pid)
+            sampler.start()
+
+            results = Results()
+            stop_at = time.monotonic() + args.duration
+            clients = [ESPReader(port, results, stop_at, args.drop_rate, TRACK_KBPS) for _ in range(args.clients)]
+            clients += [ControlClient(port, results, stop_at, '/status', args.status_interval, tracks),
+                        ControlClient(port, results, stop_at, '/play', args.play_interval, tracks),
+                        ControlClient(port, results, stop_at, '/upload', args.upload_interval, tracks)]
+            for client in clients:
+                client.start()
+                time.sleep(args.ramp / len(clients))
+            time.sleep(max(0, stop_at - time.monotonic()))
+            sampler.running = False
+            sampler.join()
+            for client in clients:
+                client.join(15)
+            metrics_text = scrape_metrics(port)
+        finally:
+            process.terminate()
+            try:
+                process.wait(5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+    server_stalls = counter_total(metrics_text, 'mp3streamer_stream_stalls_total')   # Chunk writes that blocked
+    job_failures = counter_total(metrics_text, 'mp3streamer_ffmpeg_job_failures_total')
+    return summarize(mode, args, results, sampler, server_stalls, job_failures, broker.publishes)
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def summarize(mode, args, results, sampler, server_stalls, job_failures, mqtt_publishes):
+    control = [latency for latencies in results.control.values() for latency in latencies]
+    throughput = [rate * 8 / 1000 for rate in results.throughput]
+    ms = lambda seconds: round(seconds * 1000, 1) if seconds is not None else None
+    return {
+        "scenario": scenario(mode, args),
+        "connections": results.connections,
+        "ttfbP50Ms": ms(percentile(results.ttfb, 0.5)),
+        "ttfbP95Ms": ms(percentile(results.ttfb, 0.95)),
+        "ttfbMaxMs": ms(max(results.ttfb)) if results.ttfb else None,
+        "throughputP5Kbps": round(percentile(throughput, 0.05), 1) if throughput else None,
+        "throughputP50Kbps": round(percentile(throughput, 0.5), 1) if throughput else None,
+        "stalls": results.stalls,
+        "stallsPerClientMinute": round(results.stalls / args.clients / (args.duration / 60), 3),
+        "serverStalls": server_stalls,
+        "drops": results.drops,
+        "streamErrors": sum(results.stream_errors.values()),
+        "streamErrorKinds": results.stream_errors,
+        "controlP50Ms": ms(percentile(control, 0.5)),
+        "controlP95Ms": ms(percentile(control, 0.95)),
+        "controlByEndpointP95Ms": {endpoint: ms(percentile(latencies, 0.95))
+                                   for endpoint, latencies in sorted(results.control.items())},
+        "controlErrors": sum(results.control_errors.values()),
+        "controlErrorKinds": results.control_errors,
+        "ffmpegJobFailures": job_failures,
+        "mqttPublishes": mqtt_publishes,
+        "peakRssMb": round(max(sampler.rss) / 1e6, 1) if sampler.rss else None,
+        "finalRssMb": round(sampler.rss[-1] / 1e6, 1) if sampler.rss else None,
+        "peakThreads": max(sampler.threads, default=None),
+        "cpuPercent": round(sampler.cpu_seconds / sampler.wall_seconds * 100, 1) if sampler.wall_seconds else None,
+    }
+
+def scenario(mode, args):
+    return f"{mode}-c{args.clients}-d{args.duration}-drop{args.drop_rate}"
+
+def report(summary, baseline):
+    """Print a summary, with the change against baseline; returns the regressed metrics."""
+    print(f"\n=== {summary['scenario']} ===")
+    regressions = []
+    for key, value in summary.items():
+        if key == 'scenario':
+            continue
+        line = f"  {key:24} {value}"
+        old = baseline.get(key) if baseline else None
+        if key in CHECKS and isinstance(value, (int, float)) and isinstance(old, (int, float)):
+            direction, fraction, floor = CHECKS[key]
+            slack = max(abs(old) * fraction, floor)
+            worse = value > old + slack if direction == 'lower' else value < old - slack
+            line += f"   (baseline {old}{', REGRESSION' if worse else ''})"
+            if worse:
+                regressions.append(key)
+        elif key in ZERO_CHECKS and value:
+            line += "   (must be 0, REGRESSION)"
+            regressions.append(key)
+        print(line)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test MP3 Streamer with simulated ESP8266 clients")
+    parser.add_argument('--clients', type=int, default=50, help="concurrent /stream readers")
+    parser.add_argument('--duration', type=int, default=30, help="seconds of load")
+    parser.add_argument('--mode', choices=['asyncio', 'threaded', 'both'], default='asyncio', help="server core")
+    parser.add_argument('--drop-rate', type=float, default=0.01, help="chance per client per second of a Wi-Fi drop")
+    parser.add_argument('--ramp', type=float, default=5.0, help="seconds over which clients connect")
+    parser.add_argument('--status-interval', type=float, default=0.5)
+    parser.add_argument('--play-interval', type=float, default=5.0)
+    parser.add_argument('--upload-interval', type=float, default=5.0)
+    parser.add_argument('--encode-seconds', type=float, default=0.5, help="time the stand-in ffmpeg takes per job")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="baseline file to compare against / save to")
+    parser.add_argument('--save-baseline', action='store_true', help="store this run's numbers as the baseline")
+    args = parser.parse_args()
+
+    try:
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+    except (OSError, ValueError):
+        baselines = {}
+
+    regressions = []
+    for mode in (['asyncio', 'threaded'] if args.mode == 'both' else [args.mode]):
+        print(f"bench: {args.clients} clients on the {mode} core for {args.duration}s...")
+        summary = run(mode, args)
+        regressions += [f"{summary['scenario']}: {key}" for key in report(summary, baselines.get(summary['scenario']))]
+        if args.save_baseline:
+            baselines[summary['scenario']] = summary
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"\nbench: baseline saved to {args.baseline}")
+    elif regressions:
+        print("\nbench: regressions against baseline:\n  " + "\n  ".join(regressions))
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+"""
+Content-addressed transcode cache for MP3 Streamer
+Each converted MP3 is stored once in mp3s/.blobs/, keyed by a hash of the
+source bytes plus the encode arguments. Library names are hard links to
+the blob and are reference counted, so a repeat upload costs a link
+instead of an ffmpeg run and /delete only frees a blob when no names
+point to it. A track's /stream?br= renditions are blobs too, referenced
+as "<name>@<kbps>k" without a library file of their own, and so are its
+/stream?format= device renditions ("<name>@adpcm", WAV blobs).
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+from config import UPLOAD_DIR, RENDITION_BITRATES, DEVICE_FORMATS
+from frame_index import warm_index, remove_index
+from catalog import catalog
+from track_cache import track_cache
+from jobs import scheduler, TranscodeJob, PRIORITY_RENDITION
+from transcode import rendition_args, DEVICE_FORMAT_ARGS
+
+BLOB_DIR = os.path.join(UPLOAD_DIR, '.blobs')
+REFS_PATH = os.path.join(BLOB_DIR, 'refs.json')
+
+class BlobStore:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.refs = None   # library filename -> blob key, loaded lazily
+
+    def _load(self):
+        if self.refs is None:
+            try:
+                with open(REFS_PATH, 'r', encoding='utf-8') as f:
+                    self.refs = json.load(f)
+            except (OSError, ValueError):
+                self.refs = {}
+        return self.refs
+
+    def _save(self):
+        os.makedirs(BLOB_DIR, exist_ok=True)
+        temp = REFS_PATH + '.tmp'
+        with open(temp, 'w', encoding='utf-8') as f:
+            json.dump(self.refs, f)
+        os.replace(temp, REFS_PATH)
+
+    def cache_key(self, source_digest, args):
+        """Key for a source hash encoded with the given ffmpeg arguments; keys
+        of outputs other than MP3 carry their container as an extension."""
+        key = hashlib.sha256((source_digest + '\0' + ' '.join(args)).encode('utf-8')).hexdigest()
+        container = args[args.index('-f') + 1] if '-f' in args else 'mp3'
+        return key if container == 'mp3' else f"{key}.{container}"
+
+    def blob_path(self, key):
+        return os.path.join(BLOB_DIR, key if '.' in key else key + '.mp3')
+
+    def ref_count(self, key):
+        with self.lock:
+            return self._ref_count(key)
+
+    def _ref_count(self, key):
+        return sum(1 for k in self._load().values() if k == key)
+
+    def link_name(self, key, name_path):
+        """Point a library name at a blob (replacing whatever the name held before)."""
+        name = os.path.basename(name_path)
+        temp = name_path + '.linking'
+        with self.lock:
+            blob = self.blob_path(key)
+            if not os.path.exists(blob):
+                raise FileNotFoundError(blob)
+            if not (os.path.exists(name_path) and os.path.samefile(blob, name_path)):
+                try:
+                    os.link(blob, temp)
+                except OSError:
+                    shutil.copyfile(blob, temp)   # Filesystem without hard links
+                os.replace(temp, name_path)
+
+            refs = self._load()
+            old_key = refs.get(name)
+            refs[name] = key
+            if old_key and old_key != key:
+                self._drop_renditions(name)   # They were made from the old content
+                self._collect(old_key)
+            self._save()
+        remove_index(name_path)
+        track_cache.invalidate(name_path)
+
+    def link_rendition(self, key, name_path, label, track_key):
+        """Record blob key as name_path's rendition `label` ("48k", "adpcm"), if the name still holds track_key."""
+        name = os.path.basename(name_path)
+        with self.lock:
+            refs = self._load()
+            if refs.get(name) != track_key:
+                self._collect(key)   # Deleted or replaced while the rendition was encoding
+                return False
+            ref = f"{name}@{label}"
+            old_key = refs.get(ref)
+            refs[ref] = key
+            self._save()
+            if old_key and old_key != key:
+                self._collect(old_key)
+        return True
+
+    def rendition_paths(self, name_path):
+        """{kbps: blob path} for the renditions of a library track."""
+        prefix = os.path.basename(name_path) + '@'
+        with self.lock:
+            return {int(ref[len(prefix):-1]): self.blob_path(key)
+                    for ref, key in self._load().items()
+                    if ref.startswith(prefix) and ref.endswith('k') and ref[len(prefix):-1].isdigit()}
+
+    def format_path(self, name_path, fmt):
+        """Blob path of a library track's device-format rendition, or None if it has none (yet)."""
+        with self.lock:
+            key = self._load().get(f"{os.path.basename(name_path)}@{fmt}")
+        return self.blob_path(key) if key else None
+
+    def _drop_renditions(self, name):
+        """Unreference a name's renditions (call with self.lock held, then _save)."""
+        refs = self._load()
+        for ref in [ref for ref in refs if ref.startswith(name + '@')]:
+            self._collect(refs.pop(ref))
+
+    def release_name(self, name_path):
+        """
+        Delete a library name and free its blob once nothing else references it.
+        Returns False if the name was already gone from disk (its references
+        and catalog row are dropped all the same).
+        """
+        removed = True
+        with self.lock:
+            try:
+                os.remove(name_path)
+            except FileNotFoundError:
+                removed = False
+            key = self._load().pop(os.path.basename(name_path), None)
+            self._drop_renditions(os.path.basename(name_path))
+            self._save()
+            if key:
+                self._collect(key)
+        remove_index(name_path)
+        track_cache.invalidate(name_path)
+        catalog.remove(name_path)
+        return removed
+
+    def _collect(self, key):
+        """Remove a blob nothing references any more (call with self.lock held)."""
+        if self._ref_count(key) == 0:
+            try:
+                os.remove(self.blob_path(key))
+                print(f"Blob store: Freed {key[:12]}")
+            except OSError:
+                pass
+            remove_index(self.blob_path(key))
+            track_cache.invalidate(self.blob_path(key))
+
+    def transcode(self, kind, name_path, args, source_digest, priority,
+                  input_path=None, input_data=None, cleanup_input=False):
+        """
+        Produce name_path from a source, reusing a cached blob when possible.
+        Returns the queued TranscodeJob, or None if the cache already had it.
+        """
+        key = self.cache_key(source_digest, args)
+        try:
+            self.link_name(key, name_path)
+        except FileNotFoundError:
+            pass   # Not cached yet
+        else:
+            handed_off = self.make_renditions(name_path, key, source_digest, input_path, input_data, cleanup_input)
+            if cleanup_input and input_path and not handed_off:
+                os.remove(input_path)
+            catalog.update(name_path)
+            print(f"Blob store: Cache hit for '{name_path}' ({key[:12]})")
+            return None
+
+        os.makedirs(BLOB_DIR, exist_ok=True)
+        job = TranscodeJob(kind, None, args, input_path=input_path, input_data=input_data,
+                           priority=priority, cleanup_input=cleanup_input,
+                           name=os.path.basename(name_path))
+        job.output_path = f"{self.blob_path(key)}.{job.id}.tmp"
+
+        def on_done(job):
+            os.replace(job.output_path, self.blob_path(key))
+            self.link_name(key, name_path)
+            catalog.update(name_path)
+            if self.make_renditions(name_path, key, source_digest, job.input_path, job.input_data, job.cleanup_input):
+                job.cleanup_input = False   # The rendition job owns the input now
+
+        job.on_done = on_done
+        return scheduler.submit(job)
+
+    def make_renditions(self, name_path, track_key, source_digest, input_path=None, input_data=None, cleanup_input=False):
+        """
+        Link cached renditions of a source and queue one low-priority ffmpeg
+        run (one decode, several outputs) for the rest. Returns True if a job
+        was queued; it then owns the input and its cleanup.
+        """
+        wanted = [(f"{kbps}k", rendition_args(kbps)) for kbps in RENDITION_BITRATES]
+        wanted += [(fmt, DEVICE_FORMAT_ARGS[fmt]) for fmt in DEVICE_FORMATS if fmt in DEVICE_FORMAT_ARGS]
+        missing = []
+        for label, args in wanted:
+            key = self.cache_key(source_digest, args)
+            if os.path.exists(self.blob_path(key)):
+                self.link_rendition(key, name_path, label, track_key)
+            else:
+                missing.append((label, args, key))
+        if not missing:
+            return False
+
+        job = TranscodeJob("rendition", None, [], input_path=input_path, input_data=input_data,
+                           priority=PRIORITY_RENDITION, cleanup_input=cleanup_input,
+                           name=os.path.basename(name_path))
+        outputs = [f"{self.blob_path(key)}.{job.id}.tmp" for _, _, key in missing]
+        for (_, args, _), output in zip(missing, outputs):
+            job.args += args + [output]
+        job.args.pop()                    # The last output goes through output_path
+        job.output_path = outputs[-1]
+        job.extra_outputs = outputs[:-1]
+
+        def on_done(job):
+            for (label, _, key), output in zip(missing, outputs):
+                os.replace(output, self.blob_path(key))
+                if self.link_rendition(key, name_path, label, track_key):
+                    warm_index(self.blob_path(key))
+
+        job.on_done = on_done
+        scheduler.submit(job)
+        return True
+
+# Global blob store instance
+blob_store = BlobStore()
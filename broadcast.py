@@ -0,0 +1,173 @@
+"""
+Shared broadcast ("radio") engine for MP3 Streamer
+One producer reads the current track into a ring buffer, every listener is a cursor into it.
+"""
+import asyncio
+import threading
+import time
+import os
+from config import CHUNK_SIZE, BROADCAST_BUFFER_CHUNKS, BROADCAST_BURST_CHUNKS
+import config
+from frame_index import get_index
+from utils import wake_async_waiters, Pacer
+
+class Broadcaster:
+    def __init__(self):
+        self.slots = [None] * BROADCAST_BUFFER_CHUNKS
+        self.head = 0            # Sequence number of the next chunk to be written
+        self.cond = threading.Condition()
+        self.async_waiters = []  # (loop, future) pairs parked in wait_async()
+        self.listener_count = 0
+        self.running = False
+        self.thread = None
+        self.track_path = None
+
+    def start(self):
+        """Start the producer thread."""
+        with self.cond:
+            if self.running:
+                return
+            self.running = True
+
+        self.thread = threading.Thread(target=self._run, name="broadcaster", daemon=True)
+        self.thread.start()
+        print("Broadcast: Producer started")
+
+    def stop(self):
+        """Stop the producer and wake up every waiting listener."""
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+            self._wake_async_waiters()
+
+    def join(self):
+        """Register a listener and return its starting cursor (a short burst behind live)."""
+        with self.cond:
+            self.listener_count += 1
+            oldest = self.head - len(self.slots) + 1
+            cursor = max(0, oldest, self.head - BROADCAST_BURST_CHUNKS)
+            print(f"Broadcast: Listener joined (Total: {self.listener_count})")
+            return cursor
+
+    def leave(self):
+        """Unregister a listener."""
+        with self.cond:
+            self.listener_count -= 1
+            print(f"Broadcast: Listener left (Total: {self.listener_count})")
+
+    def read(self, cursor):
+        """
+        Return (chunks, next_cursor) for everything published since cursor.
+        A listener that fell more than a full ring behind skips ahead to the
+        oldest buffered chunk.
+        """
+        with self.cond:
+            oldest = self.head - len(self.slots)
+            if cursor < oldest:
+                cursor = oldest
+
+            size = len(self.slots)
+            chunks = [self.slots[seq % size] for seq in range(cursor, self.head)]
+            return chunks, self.head
+
+    def wait(self, cursor, timeout=None):
+        """Block until a chunk past cursor is published (or the broadcast stops)."""
+        with self.cond:
+            self.cond.wait_for(lambda: self.head > cursor or not self.running, timeout)
+
+    async def wait_async(self, cursor, timeout=None):
+        """Event-loop version of wait()."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self.cond:
+            if self.head > cursor or not self.running:
+                return
+            self.async_waiters.append((loop, future))
+
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self.cond:
+                if (loop, future) in self.async_waiters:
+                    self.async_waiters.remove((loop, future))
+
+    def get_status(self):
+        """Get current broadcast status."""
+        with self.cond:
+            return {
+                "running": self.running,
+                "track": os.path.basename(self.track_path) if self.track_path else None,
+                "listener_count": self.listener_count,
+                "head": self.head
+            }
+
+    def _publish(self, chunk):
+        with self.cond:
+            self.slots[self.head % len(self.slots)] = chunk
+            self.head += 1
+            self.cond.notify_all()
+            self._wake_async_waiters()
+
+    def _wake_async_waiters(self):
+        """Resolve parked event-loop waiters (call with self.cond held)."""
+        if self.async_waiters:
+            wake_async_waiters(self.async_waiters)
+            self.async_waiters = []
+
+    def _run(self):
+        """Producer loop: follow config.CURRENT_TRACK and read it at playback rate, whole frames at a time."""
+        f = None
+        index = None
+        frame = 0
+        pacer = None
+
+        try:
+            while self.running:
+                track = config.CURRENT_TRACK
+                if track != self.track_path:
+                    if f:
+                        f.close()
+                        f = None
+                    self.track_path = track
+                    if track and os.path.exists(track):
+                        f = open(track, 'rb')
+                        index = get_index(track)
+                        print(f"Broadcast: Now playing '{track}'")
+                    frame = 0
+                    pacer = Pacer(0)
+
+                if f is None or not index.frame_count:
+                    time.sleep(0.2)
+                    continue
+
+                if frame >= index.frame_count:
+                    # Loop the current track (from its first frame, past any ID3 tag) until the selection changes
+                    frame = 0
+
+                # About CHUNK_SIZE of whole frames, so a track switch never splits one
+                end = max(frame + 1, index.frame_at_offset(index.offsets[frame] + CHUNK_SIZE))
+                f.seek(index.offsets[frame])
+                chunk = f.read(index.offsets[end] - index.offsets[frame])
+                if not chunk:
+                    time.sleep(0.2)
+                    continue
+
+                self._publish(chunk)
+
+                # Keep the producer at real-time rate (the frames' own durations) so the ring holds "now"
+                pacer.advance(index.times[end] - index.times[frame])
+                frame = end
+                delay = pacer.delay()
+                if delay > 0:
+                    time.sleep(delay)
+        except Exception as e:
+            print(f"Broadcast Error: {e}")
+        finally:
+            if f:
+                f.close()
+            self.stop()
+
+# Global broadcaster instance
+broadcaster = Broadcaster()
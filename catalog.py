@@ -0,0 +1,189 @@
+"""
+Persistent track catalog for MP3 Streamer
+Keeps name, size, duration, bitrate and frame count for every MP3 in
+UPLOAD_DIR in SQLite, so page loads, /library and /play never list or
+probe the directory. Ingest updates rows directly; anything else (files
+copied in by hand, removed behind our back) is picked up by an incremental
+background rescan whenever the directory's mtime changes, which only probes
+files whose size or mtime differ from their row; requests only ever read.
+The database lives in its own subdirectory, so its journal files don't
+touch UPLOAD_DIR's mtime.
+"""
+import os
+import sqlite3
+import threading
+import time
+from config import UPLOAD_DIR
+from frame_index import get_index
+from events import event_bus
+
+CATALOG_PATH = os.path.join(UPLOAD_DIR, '.catalog', 'catalog.db')
+
+COLUMNS = "name, size, duration, bitrate, frames, added"
+
+SORT_COLUMNS = {
+    'name': 'name COLLATE NOCASE',
+    'added': 'added',
+    'duration': 'duration',
+    'size': 'size',
+    'bitrate': 'bitrate',
+}
+
+class Catalog:
+    def __init__(self):
+        self.lock = threading.Lock()          # Guards the connection
+        self.scan_lock = threading.Lock()     # One rescan at a time
+        self.db = None
+        self.dir_mtime_ns = None              # UPLOAD_DIR mtime at the last rescan
+
+    def _connect(self):
+        """Open the database on first use (call with self.lock held)."""
+        if self.db is None:
+            os.makedirs(os.path.dirname(CATALOG_PATH), exist_ok=True)
+            self.db = sqlite3.connect(CATALOG_PATH, check_same_thread=False)
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS tracks (
+                    name TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    duration REAL NOT NULL,
+                    bitrate INTEGER NOT NULL,
+                    frames INTEGER NOT NULL,
+                    added REAL NOT NULL
+                )""")
+            self.db.execute("CREATE INDEX IF NOT EXISTS tracks_added ON tracks (added)")
+            self.db.commit()
+        return self.db
+
+    def start(self):
+        """Reconcile the catalog with the directory in the background."""
+        self.refresh()
+
+    def update(self, path):
+        """Probe one track and store its row (ingest hook)."""
+        try:
+            row = self._probe(path)
+        except OSError as e:
+            print(f"Catalog: Could not probe '{path}': {e}")
+            return
+        with self.lock:
+            db = self._connect()
+            db.execute("""
+                INSERT INTO tracks (name, size, mtime_ns, duration, bitrate, frames, added)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns,
+                    duration = excluded.duration, bitrate = excluded.bitrate, frames = excluded.frames
+                """, row + (time.time(),))
+            db.commit()
+        event_bus.publish('library', {"name": row[0]})
+
+    def remove(self, path):
+        """Drop a track's row (delete hook)."""
+        with self.lock:
+            db = self._connect()
+            db.execute("DELETE FROM tracks WHERE name = ?", (os.path.basename(path),))
+            db.commit()
+        event_bus.publish('library', {"name": os.path.basename(path)})
+
+    def get(self, name):
+        """Row dict for a track name, or None if it isn't in the library (or no longer on disk)."""
+        self.refresh()
+        with self.lock:
+            db = self._connect()
+            cursor = db.execute(f"SELECT {COLUMNS} FROM tracks WHERE name = ?", (name,))
+            row = cursor.fetchone()
+            row = _row_dict(cursor, row) if row else None
+        if row and not os.path.exists(os.path.join(UPLOAD_DIR, name)):
+            # Removed behind our back and the background rescan hasn't caught up
+            self.remove(name)
+            return None
+        return row
+
+    def next_name(self, name=None):
+        """Track after `name` in name order, wrapping to the first (None if the library is empty)."""
+        self.refresh()
+        with self.lock:
+            db = self._connect()
+            row = None
+            if name:
+                row = db.execute("SELECT name FROM tracks WHERE name COLLATE NOCASE > ? "
+                                 "ORDER BY name COLLATE NOCASE LIMIT 1", (name,)).fetchone()
+            if row is None:
+                row = db.execute("SELECT name FROM tracks ORDER BY name COLLATE NOCASE LIMIT 1").fetchone()
+            return row[0] if row else None
+
+    def count(self):
+        self.refresh()
+        with self.lock:
+            return self._connect().execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+
+    def query(self, offset=0, limit=50, sort='name', descending=False, search=''):
+        """Return (total, [row dict]) for one page of the library."""
+        self.refresh()
+        where = ""
+        args = []
+        if search:
+            where = "WHERE name LIKE ? ESCAPE '\\'"
+            args.append('%' + search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        order = SORT_COLUMNS.get(sort, SORT_COLUMNS['name']) + (" DESC" if descending else "")
+
+        with self.lock:
+            db = self._connect()
+            total = db.execute(f"SELECT COUNT(*) FROM tracks {where}", args).fetchone()[0]
+            cursor = db.execute(f"SELECT {COLUMNS} FROM tracks {where} ORDER BY {order}, name LIMIT ? OFFSET ?",
+                                args + [limit, offset])
+            return total, [_row_dict(cursor, row) for row in cursor.fetchall()]
+
+    def refresh(self):
+        """Start a background rescan if the directory changed since the last one (never waits for it)."""
+        try:
+            dir_mtime_ns = os.stat(UPLOAD_DIR).st_mtime_ns
+        except OSError:
+            return
+        if dir_mtime_ns == self.dir_mtime_ns or not self.scan_lock.acquire(blocking=False):
+            return
+        threading.Thread(target=self._scan, args=(dir_mtime_ns,), name="catalog-scan", daemon=True).start()
+
+    def _scan(self, dir_mtime_ns):
+        try:
+            self._rescan()
+            self.dir_mtime_ns = dir_mtime_ns
+        finally:
+            self.scan_lock.release()
+
+    def _rescan(self):
+        on_disk = {}
+        with os.scandir(UPLOAD_DIR) as entries:
+            for entry in entries:
+                if entry.name.endswith('.mp3') and entry.is_file():
+                    st = entry.stat()
+                    on_disk[entry.name] = (st.st_size, st.st_mtime_ns)
+
+        with self.lock:
+            known = {name: (size, mtime_ns) for name, size, mtime_ns
+                     in self._connect().execute("SELECT name, size, mtime_ns FROM tracks")}
+
+        changed = [name for name, stat in on_disk.items() if known.get(name) != stat]
+        gone = [name for name in known if name not in on_disk]
+        for name in changed:
+            self.update(os.path.join(UPLOAD_DIR, name))
+        if gone:
+            with self.lock:
+                db = self._connect()
+                db.executemany("DELETE FROM tracks WHERE name = ?", [(name,) for name in gone])
+                db.commit()
+            event_bus.publish('library', {"removed": len(gone)})
+        if changed or gone:
+            print(f"Catalog: Rescanned ({len(changed)} updated, {len(gone)} removed, {len(on_disk)} tracks)")
+
+    def _probe(self, path):
+        st = os.stat(path)
+        index = get_index(path)
+        return (os.path.basename(path), st.st_size, st.st_mtime_ns,
+                round(index.duration, 2), index.bitrate(), index.frame_count)
+
+def _row_dict(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+# Global catalog instance
+catalog = Catalog()
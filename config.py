@@ -7,15 +7,71 @@ import os
 PORT = int(os.environ.get('PORT', 8080))
 HOST = os.environ.get('HOST', '0.0.0.0')
 UPLOAD_DIR = "mp3s"
+LIBRARY_PAGE_MAX = 200          # Largest page /library returns
+UPLOAD_CHUNK_SIZE = 64 * 1024   # Bytes read from the socket at a time while parsing uploads
+UPLOAD_MEMORY_SPOOL = 4 * 1024 * 1024   # Uploads up to this size are piped to ffmpeg from memory
 CHUNK_SIZE = 2048
+SERVER_MODE = os.environ.get('SERVER_MODE', 'asyncio')  # 'asyncio' (event loop for /stream) or 'threaded'
+ASYNC_CONTROL_WORKERS = 16      # Threads for control/upload requests in asyncio mode
+ASYNC_OPEN_WORKERS = 4          # Threads that open /stream responses (index lookups) in asyncio mode, apart from control
+ASYNC_HEADER_TIMEOUT = 30       # Seconds a client has to send its request headers
+STREAM_USE_SENDFILE = os.environ.get('STREAM_USE_SENDFILE', '1') == '1'  # Zero-copy /stream; '0' uses the read/write loop
+STREAM_PACING = os.environ.get('STREAM_PACING', '0') == '1'  # Send /stream at playback rate instead of as fast as TCP allows
+STREAM_LEAD_SECONDS = float(os.environ.get('STREAM_LEAD_SECONDS', 3.0))  # Audio sent ahead of real time when pacing
+STREAM_AUTO_MIN_LEAD = 1.0      # ?br=auto steps down when less than this much audio is queued ahead of playback
+STREAM_AUTO_WINDOW = 3.0        # Seconds of streaming before (and between) ?br=auto switches
+STREAM_AUTO_SNDBUF = 16384      # Socket send buffer for ?br=auto, so send timing follows the client
+METRICS_STALL_SECONDS = 2.0     # A chunk write blocked this long counts as a client stall in /metrics
+ICY_METAINT = int(os.environ.get('ICY_METAINT', 16000))  # Audio bytes between in-band title blocks for Icy-MetaData: 1 clients (0 disables)
+ICY_NAME = os.environ.get('ICY_NAME', 'MP3 Streamer')   # Station name sent in icy-name
+TRACK_CACHE_MB = float(os.environ.get('TRACK_CACHE_MB', 64))  # Memory for hot tracks served without disk reads (0 disables)
+
+# Admission Control - bounded connections, stuck clients dropped
+MAX_STREAMS = int(os.environ.get('MAX_STREAMS', 64))   # Concurrent /stream, /live and /events connections
+MAX_CONTROL_REQUESTS = int(os.environ.get('MAX_CONTROL_REQUESTS', 16))  # Concurrent UI/API requests, a separate budget so control works when streams are full
+KEEPALIVE_TIMEOUT = float(os.environ.get('KEEPALIVE_TIMEOUT', 15))  # Seconds an idle HTTP/1.1 connection is kept for the client's next request
+KEEPALIVE_IDLE_SLOTS = int(os.environ.get('KEEPALIVE_IDLE_SLOTS', 16))  # Threaded mode: connection slots beyond the two budgets for idle keep-alive sockets; past them the longest-idle is closed
+STREAM_CHUNKED = os.environ.get('STREAM_CHUNKED', '1') == '1'  # Open-ended /live and /events use chunked encoding for HTTP/1.1 clients ('0': end by closing)
+STREAM_WRITE_TIMEOUT = float(os.environ.get('STREAM_WRITE_TIMEOUT', 10))  # Seconds one socket write (or read) may block before the client is dropped
+STREAM_WRITE_SLICE = 8 * 1024   # Largest single stream write; keep below STREAM_WRITE_TIMEOUT x STREAM_MIN_RATE
+STREAM_MIN_RATE = int(os.environ.get('STREAM_MIN_RATE', 1000))  # Bytes/s a stream client must sustain while the server waits on it (0 disables)
+STREAM_MIN_RATE_WINDOW = 30     # Seconds of blocked writes the minimum rate is judged over
+RETRY_AFTER_SECONDS = 5         # 503 Retry-After; clients are told 1-2x this so a reconnect storm spreads out
+
+# Broadcast ("radio") Mode - one reader shared by every /stream client
+BROADCAST_MODE = os.environ.get('BROADCAST_MODE', '0') == '1'
+BROADCAST_BUFFER_CHUNKS = 256   # Ring buffer size in CHUNK_SIZE slots (~512 KB)
+BROADCAST_BURST_CHUNKS = 32     # Recent chunks sent to a late joiner to fill its buffer
+
+# Live Streaming
+LIVE_CLIENT_QUEUE_CHUNKS = 64   # Per-listener backlog of encoded chunks before the oldest is dropped
+LIVE_TIMESLICE_MS = 250         # Browser microphone chunk length pushed to /live/push
+
+# Server-Sent Events (/events)
+EVENTS_HEARTBEAT = 15           # Seconds between keep-alive comments on an idle /events connection
+EVENTS_RETRY_MS = 3000          # Reconnect delay suggested to EventSource
+EVENT_HISTORY_SIZE = 64         # Recent events kept for Last-Event-ID resume
 
 # MQTT Configuration
 MQTT_BROKER_IP = os.environ.get('MQTT_BROKER', "broker.emqx.io")
 MQTT_PORT = int(os.environ.get('MQTT_PORT', 1883))
 MQTT_TOPIC = "jukebox/control/stream_id"
+MQTT_COMMAND_TOPIC = os.environ.get('MQTT_COMMAND_TOPIC', "jukebox/control/command")  # Devices publish to <topic>/play (payload: file name), /stop, /next
+MQTT_QOS = int(os.environ.get('MQTT_QOS', 1))   # QoS for state publishes (1 = broker-acknowledged, measured latency)
+MQTT_COALESCE_SECONDS = 0.25    # State changes within this window reach devices as one publish of the final value
+MQTT_RATE_WINDOW = 60           # Seconds of publish history behind the per-topic rate metric
 
 # Global State
 CURRENT_TRACK = None
 STREAM_ID = 0
 
+# Transcoding
+TRANSCODE_WORKERS = int(os.environ.get('TRANSCODE_WORKERS', 2))  # Concurrent ffmpeg conversions
+JOB_HISTORY_SIZE = 100          # Finished jobs kept for /jobs/<id>
+ENCODER_POOL_SIZE = int(os.environ.get('ENCODER_POOL_SIZE', 1))  # Warm ffmpeg processes per output profile (0 disables)
+ENCODER_POOL_MAX_INPUT = 8 * 1024 * 1024   # Larger inputs get a regular ffmpeg run
+ENCODER_POOL_MAX_IDLE = 600     # Seconds before an idle warm encoder is recycled
+RENDITION_BITRATES = [int(kbps) for kbps in os.environ.get('RENDITION_BITRATES', '24,48,96').split(',') if kbps.strip()]  # Extra encodes per track for /stream?br= (empty disables)
+DEVICE_FORMATS = [fmt.strip() for fmt in os.environ.get('DEVICE_FORMATS', '').split(',') if fmt.strip()]  # Low-CPU WAV renditions per track for /stream?format= ('adpcm', 'ulaw', 'pcm8'; empty disables)
+
 FFMPEG_PATH = "./ffmpeg"  # <-- Make sure ffmpeg binary is in your project folder
\ No newline at end of file
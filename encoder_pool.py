@@ -0,0 +1,174 @@
+"""
+Warm ffmpeg encoder pool for MP3 Streamer
+ffmpeg reads its input on stdin, so a process can be started (binary loaded,
+libraries mapped) before the job it will run exists. The pool keeps a few
+such processes per output profile; a short clip is piped into an idle one
+instead of paying process startup, and a replacement is spawned off the
+critical path. An ffmpeg process converts exactly one input, so every warm
+encoder is single-use; stale or dead ones are recycled.
+"""
+import os
+import subprocess
+import threading
+import time
+import uuid
+from config import UPLOAD_DIR, ENCODER_POOL_SIZE, ENCODER_POOL_MAX_INPUT, ENCODER_POOL_MAX_IDLE
+from transcode import ffmpeg_command, run_ffmpeg, wait_ffmpeg, SEEKABLE_INPUT_EXTS
+
+POOL_DIR = os.path.join(UPLOAD_DIR, '.encoder')
+
+class EncoderPool:
+    def __init__(self, size=ENCODER_POOL_SIZE):
+        self.size = size
+        self.lock = threading.Lock()
+        self.idle = {}    # tuple(args) -> [(process, temp_output, spawned_at)]
+        self.refilling = set()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.recycled = 0
+        self.failures = 0
+        self.hit_seconds = 0.0
+        self.miss_seconds = 0.0
+        self.spawn_seconds = 0.0
+        self.spawns = 0
+
+    def start(self, profiles):
+        """Keep `size` warm encoders for each list of ffmpeg output args."""
+        if self.size <= 0:
+            return
+        os.makedirs(POOL_DIR, exist_ok=True)
+        with self.lock:
+            for args in profiles:
+                self.idle.setdefault(tuple(args), [])
+        for args in profiles:
+            self._refill(tuple(args))
+        print(f"Encoder pool: {self.size} warm ffmpeg per profile ({len(profiles)} profiles)")
+
+    def accepts(self, args, input_path=None, input_data=None):
+        """Whether a job can run on a warm encoder (short, pipe-readable, known profile)."""
+        if tuple(args) not in self.idle:
+            return False
+        if input_data is not None:
+            return len(input_data) <= ENCODER_POOL_MAX_INPUT
+        try:
+            size = os.path.getsize(input_path)
+        except OSError:
+            return False
+        return size <= ENCODER_POOL_MAX_INPUT and not input_path.lower().endswith(SEEKABLE_INPUT_EXTS)
+
+    def encode(self, input_path, args, output_path, input_data=None, on_progress=None):
+        """run_ffmpeg() replacement that uses a warm encoder when it can."""
+        if not self.accepts(args, input_path, input_data):
+            with self.lock:
+                self.bypassed += 1
+            run_ffmpeg(input_path, args, output_path, input_data=input_data, on_progress=on_progress)
+            return
+
+        key = tuple(args)
+        started = time.monotonic()
+        entry = self._checkout(key)
+        threading.Thread(target=self._refill, args=(key,), name="encoder-refill", daemon=True).start()
+
+        if entry is None:
+            try:
+                run_ffmpeg(input_path, args, output_path, input_data=input_data, on_progress=on_progress)
+            finally:
+                with self.lock:
+                    self.misses += 1
+                    self.miss_seconds += time.monotonic() - started
+            return
+
+        process, temp_output, _ = entry
+        try:
+            if input_data is not None:
+                wait_ffmpeg(process, input_data, on_progress)
+            else:
+                with open(input_path, 'rb') as source:
+                    wait_ffmpeg(process, source, on_progress)
+            os.replace(temp_output, output_path)
+        except Exception:
+            with self.lock:
+                self.failures += 1
+            if os.path.exists(temp_output):
+                os.remove(temp_output)
+            raise
+        # Only jobs a warm encoder actually finished count as hits
+        with self.lock:
+            self.hits += 1
+            self.hit_seconds += time.monotonic() - started
+
+    def get_status(self):
+        """Get pool hit/miss counters and average job latency."""
+        with self.lock:
+            return {
+                "size": self.size,
+                "idle": sum(len(entries) for entries in self.idle.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "recycled": self.recycled,
+                "failures": self.failures,
+                "avgHitSeconds": round(self.hit_seconds / self.hits, 3) if self.hits else None,
+                "avgMissSeconds": round(self.miss_seconds / self.misses, 3) if self.misses else None,
+                "avgSpawnSeconds": round(self.spawn_seconds / self.spawns, 3) if self.spawns else None
+            }
+
+    def _spawn(self, key):
+        temp_output = os.path.join(POOL_DIR, uuid.uuid4().hex + '.mp3')
+        started = time.monotonic()
+        # ffmpeg opens the output only once it has read input, so an idle encoder leaves no file
+        process = subprocess.Popen(ffmpeg_command(None, key, temp_output),
+                                   stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        with self.lock:
+            self.spawns += 1
+            self.spawn_seconds += time.monotonic() - started
+        return process, temp_output, time.monotonic()
+
+    def _checkout(self, key):
+        """Take an idle, live, fresh encoder for key (None on a miss)."""
+        stale = []
+        entry = None
+        with self.lock:
+            entries = self.idle[key]
+            while entries:
+                candidate = entries.pop(0)
+                process, _, spawned_at = candidate
+                if process.poll() is None and time.monotonic() - spawned_at < ENCODER_POOL_MAX_IDLE:
+                    entry = candidate
+                    break
+                stale.append(candidate)
+            self.recycled += len(stale)
+        for process, _, _ in stale:
+            self._discard(process)
+        return entry
+
+    def _refill(self, key):
+        """Top the profile back up to `size` idle encoders."""
+        with self.lock:
+            if key in self.refilling:
+                return
+            self.refilling.add(key)
+        try:
+            while True:
+                with self.lock:
+                    if len(self.idle[key]) >= self.size:
+                        return
+                entry = self._spawn(key)
+                with self.lock:
+                    self.idle[key].append(entry)
+        except OSError as e:
+            print(f"Encoder pool: Failed to start ffmpeg: {e}")
+        finally:
+            with self.lock:
+                self.refilling.discard(key)
+
+    def _discard(self, process):
+        try:
+            process.kill()
+            process.communicate(timeout=2)
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+
+# Global encoder pool instance
+encoder_pool = EncoderPool()
@@ -0,0 +1,95 @@
+"""
+Server-Sent Events for MP3 Streamer
+State changes are published to a small ring of recent events; every /events
+listener is a cursor into it, like broadcast listeners, so an idle browser
+tab costs one parked connection. Event ids are sequence numbers, which is
+what lets a reconnecting EventSource resume with Last-Event-ID.
+"""
+import asyncio
+import json
+import os
+import threading
+from collections import deque
+import config
+from config import EVENT_HISTORY_SIZE
+from utils import wake_async_waiters
+
+class EventBus:
+    def __init__(self, size=EVENT_HISTORY_SIZE):
+        self.events = deque(maxlen=size)   # (id, name, data)
+        self.head = 1                      # Id of the next event to be published
+        self.cond = threading.Condition()
+        self.async_waiters = []            # (loop, future) pairs parked in wait_async()
+        self.listener_count = 0
+
+    def publish(self, name, data):
+        """Publish an event to every listener."""
+        with self.cond:
+            self.events.append((self.head, name, json.dumps(data)))
+            self.head += 1
+            self.cond.notify_all()
+            if self.async_waiters:
+                wake_async_waiters(self.async_waiters)
+                self.async_waiters = []
+
+    def join(self, last_event_id=None):
+        """
+        Register a listener. Returns (cursor, resumed): resumed is False when
+        the listener needs a fresh snapshot because it is new or the events
+        it missed have already left the ring.
+        """
+        with self.cond:
+            self.listener_count += 1
+            oldest = self.events[0][0] if self.events else self.head
+            if last_event_id is not None and oldest - 1 <= last_event_id < self.head:
+                return last_event_id + 1, True
+            return self.head, False
+
+    def leave(self):
+        with self.cond:
+            self.listener_count -= 1
+
+    def read(self, cursor):
+        """Return (events, next_cursor) for everything published since cursor."""
+        with self.cond:
+            return [event for event in self.events if event[0] >= cursor], self.head
+
+    def wait(self, cursor, timeout=None):
+        """Block until an event past cursor is published."""
+        with self.cond:
+            self.cond.wait_for(lambda: self.head > cursor, timeout)
+
+    async def wait_async(self, cursor, timeout=None):
+        """Event-loop version of wait()."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self.cond:
+            if self.head > cursor:
+                return
+            self.async_waiters.append((loop, future))
+
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self.cond:
+                if (loop, future) in self.async_waiters:
+                    self.async_waiters.remove((loop, future))
+
+    def get_status(self):
+        with self.cond:
+            return {"listener_count": self.listener_count, "last_event_id": self.head - 1}
+
+def current_state():
+    """The player state shown by the UI (same fields as /status)."""
+    return {
+        "currentTrack": os.path.basename(config.CURRENT_TRACK) if config.CURRENT_TRACK else "None",
+        "streamId": config.STREAM_ID
+    }
+
+def format_event(event_id, name, data):
+    return f"id: {event_id}\nevent: {name}\ndata: {data}\n\n".encode('utf-8')
+
+# Global event bus instance
+event_bus = EventBus()
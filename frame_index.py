@@ -0,0 +1,164 @@
+"""
+MP3 frame index for MP3 Streamer
+Maps byte offsets and playback time to frame boundaries so /stream can seek
+and resume without the decoder ever seeing a partial frame. Indexes are
+cached as sidecar files in <track dir>/.index and rebuilt when the track's
+mtime or size changes. WAV device-format renditions are indexed by their
+fixed-size audio blocks instead.
+"""
+import os
+import struct
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from mp3 import iter_frames
+from wav import is_wav, iter_blocks
+
+INDEX_MAGIC = b'MP3IDX1\0'
+INDEX_HEADER = struct.Struct('<8sqQI')   # magic, mtime_ns, size, frame count
+MEMORY_CACHE_SIZE = 32
+
+class FrameIndex:
+    """
+    offsets[i] is where frame i starts and times[i] when it starts playing.
+    Both carry one extra entry: the end of the last complete frame and the
+    total duration.
+    """
+    def __init__(self, offsets, times):
+        self.offsets = offsets
+        self.times = times
+
+    @property
+    def frame_count(self):
+        return len(self.offsets) - 1
+
+    @property
+    def duration(self):
+        return self.times[-1]
+
+    @property
+    def data_end(self):
+        return self.offsets[-1]
+
+    def bitrate(self):
+        """Average bitrate in kbps (0 for an empty index)."""
+        if self.duration <= 0:
+            return 0
+        return int((self.offsets[-1] - self.offsets[0]) * 8 / self.duration / 1000)
+
+    def frame_at_time(self, seconds):
+        """Index of the frame playing at `seconds`."""
+        i = bisect_right(self.times, seconds, 0, self.frame_count) - 1
+        return max(0, i)
+
+    def frame_at_offset(self, offset):
+        """Index of the first frame starting at or after byte `offset`."""
+        return bisect_left(self.offsets, offset, 0, self.frame_count)
+
+def build_index(path):
+    """Scan path and return a FrameIndex."""
+    offsets = array('I')
+    times = array('f')
+    elapsed = 0.0
+    end = 0
+    with open(path, 'rb') as f:
+        units = iter_blocks(path) if is_wav(f.read(12)) else iter_frames(path)
+    for offset, length, duration in units:
+        offsets.append(offset)
+        times.append(elapsed)
+        elapsed += duration
+        end = offset + length
+    offsets.append(end)
+    times.append(elapsed)
+    return FrameIndex(offsets, times)
+
+def sidecar_path(path):
+    return os.path.join(os.path.dirname(path), '.index', os.path.basename(path) + '.idx')
+
+def _load_sidecar(path, st):
+    try:
+        with open(sidecar_path(path), 'rb') as f:
+            magic, mtime_ns, size, count = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+            if magic != INDEX_MAGIC or mtime_ns != st.st_mtime_ns or size != st.st_size:
+                return None
+            offsets = array('I')
+            times = array('f')
+            offsets.fromfile(f, count + 1)
+            times.fromfile(f, count + 1)
+            return FrameIndex(offsets, times)
+    except (OSError, EOFError, struct.error):
+        return None
+
+def _save_sidecar(path, st, index):
+    target = sidecar_path(path)
+    temp = target + '.tmp'
+    try:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(temp, 'wb') as f:
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, st.st_mtime_ns, st.st_size, index.frame_count))
+            index.offsets.tofile(f)
+            index.times.tofile(f)
+        os.replace(temp, target)
+    except OSError as e:
+        print(f"Index: Could not write sidecar for '{path}': {e}")
+
+_cache = OrderedDict()   # path -> (mtime_ns, size, FrameIndex)
+_cache_lock = threading.Lock()
+_building = set()   # Paths being scanned in the background
+
+def get_index(path, build=True):
+    """
+    Return the FrameIndex for path, from memory, sidecar or a fresh scan.
+    With build=False a needed scan runs in the background instead and None
+    is returned, for callers (the event loop) that mustn't block on it.
+    """
+    st = os.stat(path)
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            _cache.move_to_end(path)
+            return cached[2]
+
+    index = _load_sidecar(path, st)
+    if index is None and not build:
+        with _cache_lock:
+            if path in _building:
+                return None
+            _building.add(path)
+        threading.Thread(target=_build_in_background, args=(path,), name="index", daemon=True).start()
+        return None
+    if index is None:
+        index = build_index(path)
+        _save_sidecar(path, st, index)
+        print(f"Index: Built {index.frame_count} frames for '{path}' ({index.duration:.1f}s)")
+
+    with _cache_lock:
+        _cache[path] = (st.st_mtime_ns, st.st_size, index)
+        _cache.move_to_end(path)
+        while len(_cache) > MEMORY_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return index
+
+def warm_index(path):
+    """Build and cache a track's index ahead of the first /stream request (ingest hook)."""
+    try:
+        get_index(path)
+    except Exception as e:
+        print(f"Index: Could not index '{path}': {e}")
+
+def _build_in_background(path):
+    try:
+        warm_index(path)
+    finally:
+        with _cache_lock:
+            _building.discard(path)
+
+def remove_index(path):
+    """Forget a track's index (call when the track is deleted)."""
+    with _cache_lock:
+        _cache.pop(path, None)
+    try:
+        os.remove(sidecar_path(path))
+    except OSError:
+        pass
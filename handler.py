@@ -8,76 +8,285 @@ import json
 import urllib.parse
 from email.parser import Parser
 from io import BytesIO
-from config import UPLOAD_DIR, CHUNK_SIZE, FFMPEG_PATH
+from config import UPLOAD_DIR, CHUNK_SIZE, LIBRARY_PAGE_MAX, STREAM_WRITE_TIMEOUT, KEEPALIVE_TIMEOUT
 import config
 from mqtt_client import mqtt_manager
-from templates import generate_html_page
+from templates import index_page
 from recorder import recorder
+from stream_source import STREAM_ROUTES, FileRegion, Pause, WaitFor, SendBuffer, frame
+from multipart import MultipartReader, get_boundary, iter_request_body
+from streamer import audio_streamer
+from transcode import spool_upload, UPLOAD_ENCODE_ARGS
+from jobs import scheduler, PRIORITY_UPLOAD
+from encoder_pool import encoder_pool
+from blob_store import blob_store
+from catalog import catalog
+from playlist import playlist
+from track_cache import track_cache
+from events import event_bus, current_state
+import metrics
+from metrics import StreamMeter
+from admission import admission, RateGuard, SlowClientError
 
 import re
+import socket
+import time
 
-import subprocess
+# Endpoints labelled individually in request metrics; any other path is "other"
+METRIC_ENDPOINTS = {
+    '/', '/list', '/status', '/metrics', '/library', '/playlist', '/play', '/next', '/stop',
+    '/upload', '/delete', '/record/save', '/live/start', '/live/push', '/live/stop',
+    '/playlist/add', '/playlist/remove', '/playlist/clear', '/playlist/mode',
+} | set(STREAM_ROUTES)
+
+# POST endpoints that read the request body; on the others it is discarded
+BODY_ENDPOINTS = {'/upload', '/record/save', '/live/push'}
+DISCARD_BODY_MAX = 64 * 1024   # Larger unread bodies close the connection instead
+
+def endpoint_label(path):
+    """Bounded-cardinality endpoint name for a request path."""
+    path = path.split('?', 1)[0]
+    if path.startswith('/jobs/'):
+        return '/jobs/<id>'
+    return path if path in METRIC_ENDPOINTS else 'other'
+
+# Scrape-time values read from the subsystems' own state
+metrics.Gauge('mp3streamer_track_cache_resident_bytes', 'Track bytes held in the memory cache',
+              fn=lambda: track_cache.resident)
+metrics.Gauge('mp3streamer_track_cache_hit_ratio', 'Track cache hits per lookup',
+              fn=lambda: track_cache.get_status()["hitRatio"] or 0)
+metrics.Gauge('mp3streamer_encoder_pool_idle', 'Warm ffmpeg encoders waiting for a job',
+              fn=lambda: encoder_pool.get_status()["idle"])
+metrics.Gauge('mp3streamer_transcode_queue_depth', 'Transcode jobs waiting for a worker',
+              fn=lambda: scheduler.queue.qsize())
+metrics.Gauge('mp3streamer_event_listeners', 'Open /events connections',
+              fn=lambda: event_bus.listener_count)
+metrics.Gauge('mp3streamer_mqtt_connected', '1 while connected to the MQTT broker',
+              fn=lambda: int(mqtt_manager.connected))
+metrics.Gauge('mp3streamer_mqtt_pending_publishes', 'State publishes waiting for the coalescing window or a reconnect',
+              fn=lambda: len(mqtt_manager.pending))
 
 class MP3StreamerHandler(http.server.SimpleHTTPRequestHandler):
-    
-    def handle_audio_stream(self):
-        """Stream audio file to client."""
-        current_path = config.CURRENT_TRACK
-        if not current_path or not os.path.exists(current_path):
-            self.send_response(404)
-            self.end_headers()
-            print("Streamer: No track selected or file not found. Closing connection.")
-            return
+    # Persistent connections: every response is framed by Content-Length or chunked encoding
+    protocol_version = 'HTTP/1.1'
+    # Socket timeout: a client that stops reading (or sending) is dropped instead of holding this thread
+    timeout = STREAM_WRITE_TIMEOUT
+    requests_handled = 0   # On this connection; later waits for a request are keep-alive idle time
 
-        f = None
+    def handle_one_request(self):
+        """Handle one request and record its latency (streams record their own, up to the headers)."""
+        self.request_started = time.monotonic()
+        self.latency_recorded = False
+        self.budget = None
+        # An idle keep-alive connection waits this long for its next request,
+        # and can be closed sooner if a new connection needs its slot
+        self.connection.settimeout(KEEPALIVE_TIMEOUT)
+        if self.requests_handled:
+            admission.idle_start(self.connection)
+        # Set again only if a request line arrives (not on EOF or an idle timeout)
+        self.command = None
         try:
-            f = open(current_path, 'rb')
-            file_size = os.path.getsize(current_path)
+            super().handle_one_request()
+        finally:
+            admission.idle_end(self.connection)
+            if self.budget:
+                self.budget.release()
+        if self.command:
+            self.requests_handled += 1
+            if not self.latency_recorded:
+                metrics.request_seconds.observe(time.monotonic() - self.request_started, self.command, endpoint_label(self.path))
+    
+    def log_error(self, format, *args):
+        if format.startswith('Request timed out'):
+            return   # An idle keep-alive connection reaching KEEPALIVE_TIMEOUT is routine
+        super().log_error(format, *args)
 
-            self.send_response(200)
-            self.send_header('Content-type', 'audio/mp3')
-            self.send_header('Content-Length', str(file_size))
-            self.end_headers()
-            
-            while True:
-                chunk = f.read(CHUNK_SIZE)
-                if not chunk:
-                    break
-                try:
-                    self.wfile.write(chunk)
-                except BrokenPipeError:
-                    print(f"Streamer: Client disconnected abruptly while streaming '{current_path}'.")
-                    break
+    def parse_request(self):
+        """Parse the request, then take a slot from its budget (stream or control); 503 when it is full."""
+        admission.idle_end(self.connection)
+        if not super().parse_request():
+            return False
+        self.connection.settimeout(self.timeout)
+        self.request_started = time.monotonic()   # Latency from the request line, not the idle wait
+        budget = admission.budget_for(self.command, self.path, STREAM_ROUTES)
+        if not self.admit(budget):
+            self.send_busy(budget)
+            return False
+        return True
+
+    def admit(self, budget):
+        if not budget.acquire():
+            return False
+        self.budget = budget
+        return True
+
+    def send_busy(self, budget):
+        """Fast 503 with a jittered Retry-After."""
+        body = f"Server busy ({budget.name} slots full), retry later.\n".encode('utf-8')
+        self.send_response(503)
+        self.send_header('Retry-After', str(admission.retry_after()))
+        self.send_header('Content-type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+        self.close_connection = True
+
+    def send_body(self, status, body, content_type='text/plain; charset=utf-8'):
+        """Send a complete response; Content-Length lets the client reuse the connection."""
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, status, data):
+        self.send_body(status, json.dumps(data), 'application/json')
 
-            print(f"Streamer: Finished streaming '{current_path}' (ID: {config.STREAM_ID}).")
+    def discard_body(self):
+        """Read and drop a request body the endpoint doesn't use, so the next request starts cleanly."""
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            length = 0
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked' or length > DISCARD_BODY_MAX:
+            self.close_connection = True
+        elif length > 0:
+            self.rfile.read(length)
 
+    def handle_audio_stream(self, open_stream):
+        """Stream audio to client."""
+        params = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+        status, headers, body = open_stream(params, self.headers)
+        route = self.path.split('?', 1)[0]
+        headers, items, close = frame(headers, body, self.request_version == 'HTTP/1.1', route)
+        if close:
+            self.close_connection = True
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        metrics.request_seconds.observe(time.monotonic() - self.request_started, 'GET', route)
+        self.latency_recorded = True
+        if body is None:
+            return
+
+        # Frames are small and latency matters more than packet count
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        meter = StreamMeter(route)
+        reason = 'error'
+        try:
+            self.write_stream_body(items, meter)
+            reason = 'complete'
+        except BrokenPipeError:
+            reason = 'client'
+            print(f"Streamer: Client disconnected abruptly while streaming (ID: {config.STREAM_ID}).")
         except ConnectionResetError:
-            print(f"Streamer: Client disconnected while streaming '{current_path}' (ID: {config.STREAM_ID}).")
+            reason = 'client'
+            print(f"Streamer: Client disconnected while streaming (ID: {config.STREAM_ID}).")
+        except TimeoutError:
+            reason = 'evicted'
+            admission.evict('timeout')
+            print(f"Streamer: Dropped {self.client_address[0]}, write blocked for {STREAM_WRITE_TIMEOUT}s.")
+        except SlowClientError as e:
+            reason = 'evicted'
+            admission.evict('slow')
+            print(f"Streamer: Dropped slow client {self.client_address[0]}: {e}")
         except Exception as e:
             print(f"Streamer Error: {e}")
         finally:
-            if f:
-                f.close()
-    
+            body.close()
+            meter.close(reason)
+            if reason != 'complete':
+                self.close_connection = True
+
+    def write_stream_body(self, items, meter):
+        """Write a framed stream_source body to the socket, blocking this thread."""
+        guard = RateGuard()
+        for item in items:
+            if isinstance(item, FileRegion):
+                started = time.monotonic()
+                self.send_file_region(item.f, item.offset, item.count)
+                elapsed = time.monotonic() - started
+                meter.sent(item.count, elapsed)
+                guard.sent(item.count, elapsed)
+            elif isinstance(item, Pause):
+                time.sleep(item.seconds)
+            elif isinstance(item, WaitFor):
+                item.source.wait(item.cursor, item.timeout)
+            elif isinstance(item, SendBuffer):
+                self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, item.size)
+            else:
+                started = time.monotonic()
+                self.wfile.write(item)
+                elapsed = time.monotonic() - started
+                meter.sent(len(item), elapsed)
+                guard.sent(len(item), elapsed)
+
+    def send_file_region(self, f, offset, count):
+        """Send count bytes of f from offset, zero-copy via sendfile when the socket supports it."""
+        if config.STREAM_USE_SENDFILE:
+            try:
+                self.wfile.flush()
+                self.connection.sendfile(f, offset, count)
+                return
+            except (AttributeError, ValueError, NotImplementedError) as e:
+                print(f"Streamer: sendfile unavailable ({e}), falling back to copy loop.")
+
+        f.seek(offset)
+        remaining = count
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            self.wfile.write(chunk)
+            remaining -= len(chunk)
+
     def do_GET(self):
         """Handle GET requests."""
-        if self.path == '/stream':
-            self.handle_audio_stream()
+        open_stream = STREAM_ROUTES.get(self.path.split('?', 1)[0])
+        if open_stream:
+            self.handle_audio_stream(open_stream)
+            return
+
+        if self.path == '/metrics':
+            self.send_body(200, metrics.render(), 'text/plain; version=0.0.4; charset=utf-8')
             return
 
         if self.path == '/status':
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            
-            track_name = os.path.basename(config.CURRENT_TRACK) if config.CURRENT_TRACK else "None"
             response = {
-                "currentTrack": track_name,
-                "streamId": config.STREAM_ID
+                **current_state(),
+                "live": audio_streamer.get_stream_status(),
+                "transcoder": scheduler.get_status(),
+                "encoderPool": encoder_pool.get_status(),
+                "events": event_bus.get_status(),
+                "trackCache": track_cache.get_status(),
+                "admission": admission.get_status(),
+                "mqtt": mqtt_manager.get_status()
             }
-            self.wfile.write(json.dumps(response).encode('utf-8'))
+            self.send_json(200, response)
             return
             
+        if self.path.startswith('/jobs/'):
+            job = scheduler.get(self.path[len('/jobs/'):].split('?', 1)[0])
+            if not job:
+                self.send_error(404, 'Job not found.')
+                return
+            self.send_json(200, job.to_dict())
+            return
+            
+        if self.path.split('?', 1)[0] == '/library':
+            self.handle_library()
+            return
+
+        if self.path == '/playlist':
+            self.send_json(200, playlist.get_status())
+            return
+
         if self.path == '/' or self.path == '/list':
             self.send_html_page()
             return
@@ -86,27 +295,32 @@ class MP3StreamerHandler(http.server.SimpleHTTPRequestHandler):
 
     def do_POST(self):
         """Handle POST requests."""
+        if self.path.split('?', 1)[0] not in BODY_ENDPOINTS:
+            self.discard_body()
+
         # Play Track
-        if self.path.startswith('/play'):
+        if self.path.split('?', 1)[0] == '/play':
             params = urllib.parse.parse_qs(self.path.split('?', 1)[1])
             filename = params.get('file', [''])[0]
             track_path = os.path.join(UPLOAD_DIR, filename)
             
-            if os.path.exists(track_path):
+            if catalog.get(filename):
                 mqtt_manager.update_state(track_path)
-                self.send_response(200)
-                self.end_headers()
-                self.wfile.write(b'OK: Play started.')
+                self.send_body(200, 'OK: Play started.')
             else:
                 self.send_error(404, 'File not found.')
             return
 
+        # Skip to the next track (playlist order, else library order)
+        if self.path == '/next':
+            name = mqtt_manager.skip()
+            self.send_body(200 if name else 404, f'OK: Playing {name}.' if name else 'No tracks.')
+            return
+
         # Stop/Clear Selection
         if self.path == '/stop':
             mqtt_manager.update_state(None)
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(b'OK: Selection cleared.')
+            self.send_body(200, 'OK: Selection cleared.')
             return
         
         # Save Recording (receive audio from browser)
@@ -117,128 +331,98 @@ class MP3StreamerHandler(http.server.SimpleHTTPRequestHandler):
             try:
                 content_length = int(self.headers.get('Content-Length', 0))
                 audio_data = self.rfile.read(content_length)
+                metrics.upload_bytes.observe(len(audio_data), 'recording')
                 
-                success, message = recorder.save_recording(audio_data, filename)
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({
+                success, message, job_id = recorder.save_recording(audio_data, filename)
+                self.send_json(200, {
                     "success": success,
-                    "message": message
-                }).encode('utf-8'))
+                    "message": message,
+                    "job_id": job_id
+                })
             except Exception as e:
                 print(f"Save recording error: {e}")
-                self.send_response(500)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({
+                self.close_connection = True   # The body may be partly unread
+                self.send_json(500, {
                     "success": False,
                     "message": f"Error: {str(e)}"
-                }).encode('utf-8'))
+                })
             return
             
+        # Live microphone broadcast: start, push encoded timeslices, stop
+        if self.path.startswith('/live/'):
+            self.handle_live_control()
+            return
+
+        # Playlist: add, remove, clear, shuffle/repeat mode
+        if self.path.startswith('/playlist/'):
+            self.handle_playlist_control()
+            return
+
         # Handle File Upload
         if self.path == '/upload':
             try:
                 content_type = self.headers.get('Content-Type', '')
-                if 'multipart/form-data' in content_type:
-                    # Extract boundary
-                    boundary = content_type.split('boundary=')[1].strip()
-                    boundary_bytes = ('--' + boundary).encode()
-                    # Parsing multipart body
+                boundary = get_boundary(content_type)
+                if 'multipart/form-data' in content_type and boundary:
+                    # Parse the multipart body incrementally, never holding the whole file
                     content_length = int(self.headers.get('Content-Length', 0))
-                    body = self.rfile.read(content_length)
+                    reader = MultipartReader(self.rfile, boundary, content_length)
                     
-                    parts = body.split(boundary_bytes)
-                    
-                    for part in parts:
-                        if b'Content-Disposition' in part and b'filename=' in part:
-                            # Extract filename
-                            lines = part.split(b'\r\n')
-                            for line in lines:
-                                if b'Content-Disposition' in line:
-                                    disposition = line.decode('utf-8', errors='ignore')
-                                    if 'filename=' in disposition:
-                                        original_filename = disposition.split('filename=')[1].strip().strip('"')
-                                        
-                                        # --- FILENAME SANITIZATION START ---
-                                        # Split name and extension
-                                        base_name, original_ext = os.path.splitext(original_filename)
-                                        if not original_ext:
-                                            original_ext = "" # Handle files without extension
-                                            
-                                        # Replace special chars with space, keep alphanumeric
-                                        sanitized_base = re.sub(r'[^a-zA-Z0-9]', ' ', base_name)
-                                        # Remove double spaces and strip
-                                        sanitized_base = re.sub(r'\s+', ' ', sanitized_base).strip()
-                                        
-                                        # Fallback if filename becomes empty
-                                        if not sanitized_base:
-                                            sanitized_base = "uploaded_track"
-
-                                        # Create new filename with .mp3 extension
-                                        filename_safe = f"{sanitized_base}.mp3"
-                                        # --- FILENAME SANITIZATION END ---
-
-                                        # Find file data (after headers)
-                                        data_start = part.find(b'\r\n\r\n') + 4
-                                        data_end = part.rfind(b'\r\n')
-                                        file_data = part[data_start:data_end]
-                                        
-                                        # Save TEMP file (with original extension to help ffmpeg detect format)
-                                        temp_filename = f"temp_{original_filename}"
-                                        temp_filepath = os.path.join(UPLOAD_DIR, temp_filename)
-                                        
-                                        with open(temp_filepath, 'wb') as f:
-                                            f.write(file_data)
-                                        
-                                        # Define Final MP3 Path
-                                        final_mp3_path = os.path.join(UPLOAD_DIR, filename_safe)
-
-                                        # --- CONVERT ANY FORMAT TO MP3 (64 kbps MONO) ---
-                                        try:
-                                            print(f"Converting {temp_filepath} to {final_mp3_path}...")
-                                            subprocess.run([
-                                                FFMPEG_PATH,
-                                                "-y",               # overwrite if exists
-                                                "-i", temp_filepath,# input file (any format)
-                                                "-ac", "1",         # mono
-                                                "-ar", "22050",     # sample rate
-                                                "-b:a", "64k",      # 64 kbps bitrate
-                                                "-f", "mp3",        # Force mp3 format
-                                                final_mp3_path
-                                            ], check=True)
-
-                                            print(f"Conversion successful: {final_mp3_path}")
-                                            
-                                            # Clean up temp file
-                                            if os.path.exists(temp_filepath):
-                                                os.remove(temp_filepath)
-
-                                        except Exception as e:
-                                            print(f"FFmpeg conversion failed: {e}")
-                                            # Clean up temp file on failure
-                                            if os.path.exists(temp_filepath):
-                                                os.remove(temp_filepath)
-                                            raise e # Re-raise to send error response
-                                        
-                                        self.send_response(200)
-                                        self.end_headers()
-                                        self.wfile.write(json.dumps({"success": True, "filename": filename_safe}).encode('utf-8'))
-                                        return
+                    for part_headers, chunks in reader.parts():
+                        original_filename = part_headers.get_filename()
+                        if not original_filename:
+                            continue
+                        
+                        # --- FILENAME SANITIZATION START ---
+                        # Split name and extension
+                        base_name, original_ext = os.path.splitext(os.path.basename(original_filename))
+                        
+                        # Replace special chars with space, keep alphanumeric
+                        sanitized_base = re.sub(r'[^a-zA-Z0-9]', ' ', base_name)
+                        # Remove double spaces and strip
+                        sanitized_base = re.sub(r'\s+', ' ', sanitized_base).strip()
+                        
+                        # Fallback if filename becomes empty
+                        if not sanitized_base:
+                            sanitized_base = "uploaded_track"
+
+                        # Create new filename with .mp3 extension
+                        filename_safe = f"{sanitized_base}.mp3"
+                        # --- FILENAME SANITIZATION END ---
+
+                        final_mp3_path = os.path.join(UPLOAD_DIR, filename_safe)
+
+                        # Small uploads are piped to ffmpeg from memory, large ones spool to
+                        # an anonymous temp file (keeping the extension for ffmpeg's probe)
+                        temp_path, upload_data, source_digest = spool_upload(chunks, original_ext)
+                        metrics.upload_bytes.observe(len(upload_data) if upload_data is not None
+                                                     else os.path.getsize(temp_path), 'upload')
+
+                        # --- CONVERT TO MP3 (64 kbps MONO), OR REUSE A CACHED CONVERSION ---
+                        job = blob_store.transcode(
+                            "upload", final_mp3_path, UPLOAD_ENCODE_ARGS, source_digest, PRIORITY_UPLOAD,
+                            input_path=temp_path, input_data=upload_data, cleanup_input=True
+                        )
+                        
+                        # Any parts after the file are left unread
+                        self.close_connection = reader.remaining > 0
+                        self.send_json(202 if job else 200, {
+                            "success": True,
+                            "filename": filename_safe,
+                            "job_id": job.id if job else None
+                        })
+                        return
                         
             except Exception as e:
                 print(f"Upload error: {e}")
                 import traceback
                 traceback.print_exc()
-                self.send_response(500)
-                self.end_headers()
-                self.wfile.write(json.dumps({"success": False, "error": str(e)}).encode('utf-8'))
+                self.close_connection = True
+                self.send_json(500, {"success": False, "error": str(e)})
                 return
             
-            self.send_response(400)
-            self.end_headers()
-            self.wfile.write(json.dumps({"success": False, "error": "No file selected or invalid request."}).encode('utf-8'))
+            self.close_connection = True
+            self.send_json(400, {"success": False, "error": "No file selected or invalid request."})
             return
 
         # Handle File Delete
@@ -247,24 +431,120 @@ class MP3StreamerHandler(http.server.SimpleHTTPRequestHandler):
             filename = params.get('file', [''])[0]
             track_path = os.path.join(UPLOAD_DIR, filename)
 
-            if os.path.exists(track_path):
+            if catalog.get(filename):
                 if config.CURRENT_TRACK == track_path:
                     mqtt_manager.update_state(None)
                 
-                os.remove(track_path)
-                self.send_response(200)
-                self.end_headers()
-                self.wfile.write(b'OK: File deleted.')
+                playlist.remove(filename)
+                if blob_store.release_name(track_path):
+                    self.send_body(200, 'OK: File deleted.')
+                else:
+                    self.send_error(404, 'File not found.')
             else:
                 self.send_error(404, 'File not found.')
             return
 
         self.send_error(404, 'Unknown POST endpoint.')
 
+    def handle_library(self):
+        """GET /library?offset=&limit=&sort=name|added|duration|size|bitrate&order=asc|desc&q="""
+        params = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+        try:
+            offset = max(0, int(params.get('offset', ['0'])[0]))
+            limit = min(LIBRARY_PAGE_MAX, max(1, int(params.get('limit', ['50'])[0])))
+        except ValueError:
+            self.send_error(400, 'offset and limit must be integers.')
+            return
+        sort = params.get('sort', ['name'])[0]
+        descending = params.get('order', ['asc'])[0] == 'desc'
+        search = params.get('q', [''])[0]
+
+        total, tracks = catalog.query(offset, limit, sort, descending, search)
+        self.send_json(200, {
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "tracks": tracks
+        })
+
+    def handle_live_control(self):
+        """POST /live/start?name=, /live/push (Content-Length or chunked body) and /live/stop."""
+        action = self.path[len('/live/'):].split('?', 1)[0]
+        if action == 'start':
+            params = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+            success, message = audio_streamer.start_stream(params.get('name', ['live'])[0])
+        elif action == 'push':
+            if not audio_streamer.is_streaming:
+                success, message = False, "Not streaming"
+                self.close_connection = True   # Body left unread
+            else:
+                received = 0
+                # A chunked body is pushed piece by piece as it arrives
+                try:
+                    for chunk in iter_request_body(self.rfile, self.headers):
+                        audio_streamer.push_audio_chunk(chunk)
+                        received += len(chunk)
+                except ValueError:
+                    self.close_connection = True   # Can't find the end of a malformed body
+                    self.send_error(400, 'Malformed chunked body.')
+                    return
+                success, message = True, f"{received} bytes"
+        elif action == 'stop':
+            success, message = audio_streamer.stop_stream()
+        else:
+            self.send_error(404, 'Unknown live action.')
+            return
+
+        self.send_json(200 if success else 409, {"success": success, "message": message})
+
+    def handle_playlist_control(self):
+        """POST /playlist/add?file=, /playlist/remove?file=, /playlist/clear and /playlist/mode?shuffle=0|1&repeat=off|all|one."""
+        action = self.path[len('/playlist/'):].split('?', 1)[0]
+        params = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+        filename = params.get('file', [''])[0]
+        if action == 'add':
+            if not catalog.get(filename):
+                self.send_error(404, 'File not found.')
+                return
+            playlist.add(filename)
+        elif action == 'remove':
+            playlist.remove(filename)
+        elif action == 'clear':
+            playlist.clear()
+        elif action == 'mode':
+            shuffle = params.get('shuffle', [None])[0]
+            try:
+                playlist.set_mode(shuffle=None if shuffle is None else shuffle == '1',
+                                  repeat=params.get('repeat', [None])[0])
+            except ValueError as e:
+                self.send_error(400, str(e))
+                return
+        else:
+            self.send_error(404, 'Unknown playlist action.')
+            return
+
+        self.send_json(200, playlist.get_status())
+
     def send_html_page(self):
-        """Send the HTML page to the client."""
-        html_content = generate_html_page(config.CURRENT_TRACK)
+        """Send the pre-rendered HTML page, compressed, or 304 if the client's copy is current."""
+        encoding, body, etag = index_page.negotiate(self.headers.get('Accept-Encoding', ''))
+        if_none_match = self.headers.get('If-None-Match', '')
+        if if_none_match.strip() == '*' or etag in [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Vary', 'Accept-Encoding')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
         self.send_response(200)
-        self.send_header("Content-type", "text/html")
+        self.send_header("Content-type", "text/html; charset=utf-8")
+        if encoding != 'identity':
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')   # Revalidate every load; usually a 304
+        self.send_header('Vary', 'Accept-Encoding')
         self.end_headers()
-        self.wfile.write(html_content.encode('utf-8'))
\ No newline at end of file
+        self.wfile.write(body)
\ No newline at end of file
@@ -0,0 +1,175 @@
+"""
+Background transcoding scheduler for MP3 Streamer
+A fixed pool of worker threads runs ffmpeg jobs from a priority queue, so
+HTTP threads never wait on a conversion and ffmpeg can't take every core.
+Only jobs that start straight away keep their input in memory; queued ones
+spill it to a temp file, so a burst of uploads can't pin their bytes.
+"""
+import itertools
+import os
+import queue
+import tempfile
+import threading
+import time
+import uuid
+from config import TRANSCODE_WORKERS, JOB_HISTORY_SIZE
+from frame_index import warm_index
+from encoder_pool import encoder_pool
+import metrics
+
+# Lower runs first; within a priority, smaller inputs go first
+PRIORITY_RECORDING = 0
+PRIORITY_UPLOAD = 1
+PRIORITY_RENDITION = 2
+
+class TranscodeJob:
+    def __init__(self, kind, output_path, args, input_path=None, input_data=None,
+                 priority=PRIORITY_UPLOAD, cleanup_input=False, name=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.name = name
+        self.output_path = output_path
+        self.args = args
+        self.input_path = input_path
+        self.input_data = input_data
+        self.priority = priority
+        self.cleanup_input = cleanup_input
+        self.on_done = None      # Called with the job after a successful conversion
+        self.extra_outputs = []  # Other files the command writes (removed on failure)
+        self.status = "queued"
+        self.progress = 0.0
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.done = threading.Event()
+
+    def input_size(self):
+        if self.input_data is not None:
+            return len(self.input_data)
+        try:
+            return os.path.getsize(self.input_path)
+        except OSError:
+            return 0
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "filename": self.name or os.path.basename(self.output_path),
+            "status": self.status,
+            "progress": round(self.progress, 3),
+            "error": self.error,
+            "queuedSeconds": round((self.started or time.time()) - self.created, 2),
+            "runSeconds": round((self.finished or time.time()) - self.started, 2) if self.started else None
+        }
+
+class TranscodeScheduler:
+    def __init__(self, worker_count=TRANSCODE_WORKERS):
+        self.worker_count = worker_count
+        self.queue = queue.PriorityQueue()
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.counter = itertools.count()   # FIFO tie-breaker
+        self.workers = []
+        self.running = 0
+        self.spilled = 0
+
+    def start(self):
+        """Start the worker threads (idempotent)."""
+        with self.lock:
+            if self.workers:
+                return
+            for i in range(self.worker_count):
+                worker = threading.Thread(target=self._work, name=f"transcode-{i}", daemon=True)
+                worker.start()
+                self.workers.append(worker)
+        print(f"Transcoder: {self.worker_count} ffmpeg workers ready")
+
+    def submit(self, job):
+        """Queue a job and return it immediately."""
+        self.start()
+        with self.lock:
+            self.jobs[job.id] = job
+            self._prune()
+            waits = self.running + self.queue.qsize() >= self.worker_count
+        if job.input_data is not None and waits:
+            self._spill(job)
+        self.queue.put((job.priority, job.input_size(), next(self.counter), job))
+        print(f"Transcoder: Queued {job.kind} job {job.id} -> {job.output_path}")
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def get_status(self):
+        """Get scheduler status."""
+        with self.lock:
+            running = sum(1 for job in self.jobs.values() if job.status == "running")
+            spilled = self.spilled
+        return {
+            "workers": self.worker_count,
+            "running": running,
+            "queued": self.queue.qsize(),
+            "spilledInputs": spilled
+        }
+
+    def _spill(self, job):
+        """Move a waiting job's in-memory input to a temp file (the job then removes it)."""
+        try:
+            fd, path = tempfile.mkstemp(suffix='.input')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(job.input_data)
+        except OSError as e:
+            print(f"Transcoder: Could not spill job {job.id} input to disk, keeping it in memory: {e}")
+            return
+        job.input_path, job.input_data = path, None
+        job.cleanup_input = True
+        with self.lock:
+            self.spilled += 1
+
+    def _prune(self):
+        finished = [job for job in self.jobs.values() if job.finished]
+        finished.sort(key=lambda job: job.finished)
+        for job in finished[:max(0, len(finished) - JOB_HISTORY_SIZE)]:
+            del self.jobs[job.id]
+
+    def _work(self):
+        while True:
+            _, _, _, job = self.queue.get()
+            with self.lock:
+                self.running += 1
+            job.status = "running"
+            job.started = time.time()
+            try:
+                encoder_pool.encode(job.input_path, job.args, job.output_path,
+                                    input_data=job.input_data, on_progress=lambda p: setattr(job, 'progress', p))
+                if job.on_done:
+                    job.on_done(job)
+                else:
+                    warm_index(job.output_path)
+                job.progress = 1.0
+                job.status = "done"
+                metrics.ffmpeg_job_seconds.observe(time.time() - job.started, job.kind)
+                print(f"Transcoder: Job {job.id} done in {time.time() - job.started:.1f}s ({job.output_path})")
+            except Exception as e:
+                job.status = "failed"
+                job.error = getattr(e, 'stderr', None) or str(e)
+                metrics.ffmpeg_job_failures.inc(job.kind)
+                print(f"Transcoder: Job {job.id} failed: {e}")
+                for path in [job.output_path] + job.extra_outputs:
+                    if os.path.exists(path):
+                        os.remove(path)   # Partial output
+            finally:
+                job.finished = time.time()
+                job.input_data = None
+                if job.cleanup_input and job.input_path and os.path.exists(job.input_path):
+                    os.remove(job.input_path)
+                job.done.set()
+                with self.lock:
+                    self.running -= 1
+                self.queue.task_done()
+
+# Global scheduler instance
+scheduler = TranscodeScheduler()
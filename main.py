@@ -8,13 +8,35 @@ from config import PORT, HOST, UPLOAD_DIR
 import config
 from mqtt_client import mqtt_manager
 from handler import MP3StreamerHandler
+from async_server import AsyncStreamerServer
 from recorder import recorder
+from broadcast import broadcaster
+from jobs import scheduler
+from encoder_pool import encoder_pool
+from catalog import catalog
+from transcode import UPLOAD_ENCODE_ARGS, RECORDING_ENCODE_ARGS
 from utils import get_local_ip
+from admission import admission, turn_away
 
 class ThreadingSimpleServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
     """Threading server to handle multiple simultaneous connections."""
     allow_reuse_address = True
     daemon_threads = True
+    request_queue_size = 128
+
+    def process_request(self, request, client_address):
+        """Start a handler thread, unless every slot already has one (then a 503, no thread)."""
+        if not admission.acquire_connection():
+            turn_away(request, admission.busy_response(admission.connections))
+            self.shutdown_request(request)
+            return
+        super().process_request(request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            admission.release_connection(request)
 
 def main():
     """Main entry point for the server."""
@@ -25,26 +47,44 @@ def main():
     # Connect to MQTT broker
     mqtt_manager.connect()
     
+    # Start ffmpeg worker pool and pre-start encoders for our standard outputs
+    scheduler.start()
+    encoder_pool.start([RECORDING_ENCODE_ARGS, UPLOAD_ENCODE_ARGS])
+
+    # Pick up tracks added or removed while the server was down
+    catalog.start()
+    
     # Initialize server
     socketserver.TCPServer.allow_reuse_address = True
     
-    with ThreadingSimpleServer((HOST, PORT), MP3StreamerHandler) as httpd:
+    if config.SERVER_MODE == 'asyncio':
+        server = AsyncStreamerServer((HOST, PORT))
+    else:
+        server = ThreadingSimpleServer((HOST, PORT), MP3StreamerHandler)
+    
+    with server as httpd:
         print(f"--- ESP8266 DJ Station (MQTT Control) ---")
         print(f"1. Put MP3s in the '{UPLOAD_DIR}' folder OR upload via web.")
         print(f"2. Web UI: http://{get_local_ip()}:{PORT}")
         print(f"3. MQTT Broker: {config.MQTT_BROKER_IP}:{config.MQTT_PORT} | Topic: {config.MQTT_TOPIC}")
         print(f"4. Recording enabled: Start/stop via web interface")
+        print(f"5. Server core: {config.SERVER_MODE}")
         print("-" * 50)
         
         # Initialize state
         mqtt_manager.update_state(config.CURRENT_TRACK)
         
+        if config.BROADCAST_MODE:
+            broadcaster.start()
+            print("Broadcast mode: all /stream clients share one live feed")
+        
         try:
             httpd.serve_forever()
         except KeyboardInterrupt:
             print("\nShutting down server.")
             if recorder.recording_active:  # Fixed: Use attribute instead of method
                 recorder.stop_recording()
+            broadcaster.stop()
             mqtt_manager.disconnect()
 
 if __name__ == '__main__':
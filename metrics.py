@@ -0,0 +1,165 @@
+"""
+Prometheus-style metrics for MP3 Streamer
+A handful of counters, gauges and histograms kept in plain dicts behind one
+lock each, rendered in the Prometheus text format on GET /metrics. Updating
+one is a dict lookup and an add, cheap enough to leave on in the streaming
+loops; rates (bytes per second and so on) are left to the scraper.
+"""
+import threading
+import time
+from bisect import bisect_left
+from config import METRICS_STALL_SECONDS, CHUNK_SIZE
+
+REGISTRY = []
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.lock = threading.Lock()
+        self.values = {}   # label values tuple -> value
+        REGISTRY.append(self)
+
+    def samples(self):
+        """[(suffix, label pairs, value)] for rendering."""
+        with self.lock:
+            return [('', list(zip(self.labels, key)), value) for key, value in self.values.items()]
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+class Gauge(Metric):
+    """A settable value, or one read from fn() at scrape time."""
+    kind = 'gauge'
+
+    def __init__(self, name, help, labels=(), fn=None):
+        super().__init__(name, help, labels)
+        self.fn = fn
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value, *labels):
+        with self.lock:
+            self.values[labels] = value
+
+    def samples(self):
+        if self.fn is not None:
+            return [('', [], self.fn())]
+        return super().samples()
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets, labels=()):
+        super().__init__(name, help, labels)
+        self.buckets = sorted(buckets)
+
+    def observe(self, value, *labels):
+        with self.lock:
+            entry = self.values.get(labels)
+            if entry is None:
+                # Per-bucket (not cumulative) counts, then sum and count
+                entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        with self.lock:
+            values = [(key, list(counts), total, count) for key, (counts, total, count) in self.values.items()]
+        samples = []
+        for key, counts, total, count in values:
+            pairs = list(zip(self.labels, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + [float('inf')], counts):
+                cumulative += bucket_count
+                samples.append(('_bucket', pairs + [('le', _format_value(bound))], cumulative))
+            samples.append(('_sum', pairs, total))
+            samples.append(('_count', pairs, count))
+        return samples
+
+class StreamMeter:
+    """Accounting for one streaming connection, fed by the server cores' write loops."""
+    def __init__(self, route):
+        self.route = route
+        self.started = time.monotonic()
+        self.bytes = 0
+        stream_connections.inc(route)
+
+    def sent(self, count, seconds):
+        """Record one write of count bytes that took seconds."""
+        self.bytes += count
+        stream_bytes.inc(self.route, amount=count)
+        # A chunk-sized write blocking this long means the client stopped reading
+        if seconds > METRICS_STALL_SECONDS and count <= STALL_MAX_WRITE:
+            stream_stalls.inc(self.route)
+
+    def close(self, reason):
+        """Record the end of the connection: 'complete', 'client' (went away), 'evicted' or 'error'."""
+        stream_connections.dec(self.route)
+        stream_disconnects.inc(self.route, reason)
+        duration = time.monotonic() - self.started
+        if duration > 0 and self.bytes:
+            stream_send_rate.observe(self.bytes / duration, self.route)
+
+# Writes up to this size count as stalls when slow; larger ones (a whole file via sendfile) are slow by design
+STALL_MAX_WRITE = 32 * CHUNK_SIZE
+
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+stream_connections = Gauge('mp3streamer_stream_connections', 'Open streaming connections', ('route',))
+stream_bytes = Counter('mp3streamer_stream_bytes_total', 'Bytes written to streaming clients', ('route',))
+stream_send_rate = Histogram('mp3streamer_stream_send_rate_bytes', 'Average send rate per client connection, bytes/s',
+                             [1000, 2000, 4000, 8000, 16000, 32000, 64000, 256000, 1000000, 10000000], ('route',))
+stream_disconnects = Counter('mp3streamer_stream_disconnects_total', 'Finished streaming connections by reason',
+                             ('route', 'reason'))
+stream_stalls = Counter('mp3streamer_stream_stalls_total',
+                        f'Chunk writes that blocked for over {METRICS_STALL_SECONDS}s', ('route',))
+stream_evictions = Counter('mp3streamer_stream_evictions_total',
+                           'Streams dropped by the server: write timeout or below the minimum send rate', ('reason',))
+admission_rejected = Counter('mp3streamer_admission_rejected_total', 'Requests turned away with 503, by budget',
+                             ('budget',))
+request_seconds = Histogram('mp3streamer_request_seconds',
+                            'Time to respond per endpoint (streams: time to response headers)',
+                            LATENCY_BUCKETS, ('method', 'endpoint'))
+ffmpeg_job_seconds = Histogram('mp3streamer_ffmpeg_job_seconds', 'Transcode job run time',
+                               [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300], ('kind',))
+ffmpeg_job_failures = Counter('mp3streamer_ffmpeg_job_failures_total', 'Failed transcode jobs', ('kind',))
+upload_bytes = Histogram('mp3streamer_upload_bytes', 'Size of uploaded files and recordings',
+                         [64 * 1024, 256 * 1024, 1 << 20, 4 << 20, 16 << 20, 64 << 20, 256 << 20], ('kind',))
+mqtt_publish_seconds = Histogram('mp3streamer_mqtt_publish_latency_seconds',
+                                 'State change to broker acknowledgement', LATENCY_BUCKETS + [30, 60], ('topic',))
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for suffix, pairs, value in metric.samples():
+            label_text = ','.join(f'{name}="{_escape(value)}"' for name, value in pairs)
+            lines.append(f"{metric.name}{suffix}{{{label_text}}} {_format_value(value)}" if label_text
+                         else f"{metric.name}{suffix} {_format_value(value)}")
+    return '\n'.join(lines) + '\n'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return str(value)
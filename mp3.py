@@ -0,0 +1,129 @@
+"""
+MP3 frame header parsing for MP3 Streamer
+"""
+
+# Bitrates in kbps, indexed by [mpeg1][layer][bitrate_index]
+BITRATES = {
+    True: {
+        1: [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+        2: [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+        3: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    },
+    False: {
+        1: [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+        2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+        3: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    },
+}
+
+# Sample rates indexed by version bits (0 = MPEG 2.5, 2 = MPEG 2, 3 = MPEG 1)
+SAMPLE_RATES = {
+    0: [11025, 12000, 8000],
+    2: [22050, 24000, 16000],
+    3: [44100, 48000, 32000],
+}
+
+MAX_FRAME_SIZE = 2881
+SCAN_BLOCK = 64 * 1024
+
+def parse_frame_header(header):
+    """
+    Parse a 4-byte MP3 frame header.
+    Returns (frame_length, duration_seconds, bitrate_kbps) or None if it is not a valid header.
+    """
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+
+    version = (header[1] >> 3) & 0x03
+    layer_bits = (header[1] >> 1) & 0x03
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 0x03
+    padding = (header[2] >> 1) & 0x01
+
+    if version == 1 or layer_bits == 0 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    layer = 4 - layer_bits
+    mpeg1 = version == 3
+    bitrate = BITRATES[mpeg1][layer][bitrate_index]
+    sample_rate = SAMPLE_RATES[version][rate_index]
+
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate * 1000 // sample_rate + padding) * 4
+    else:
+        samples = 1152 if (layer == 2 or mpeg1) else 576
+        length = samples // 8 * bitrate * 1000 // sample_rate + padding
+
+    return length, samples / sample_rate, bitrate
+
+def id3v2_size(data):
+    """Return the size of an ID3v2 tag at the start of data (0 if there is none)."""
+    if len(data) < 10 or data[:3] != b'ID3':
+        return 0
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+def is_info_frame(frame):
+    """Whether a frame is a Xing/Info/VBRI header (encoder metadata that decodes as silence)."""
+    # The tag sits right after the side info, at most 36 bytes into the frame
+    head = frame[:64]
+    return b'Xing' in head or b'Info' in head or b'VBRI' in head
+
+def iter_frames(path):
+    """Yield (offset, length, duration) for every complete MP3 frame in path."""
+    with open(path, 'rb') as f:
+        offset = id3v2_size(f.read(10))
+        f.seek(offset)
+
+        buf = b''
+        base = offset    # File offset of buf[0]
+        pos = 0
+        eof = False
+
+        while True:
+            if len(buf) - pos < MAX_FRAME_SIZE and not eof:
+                more = f.read(SCAN_BLOCK)
+                eof = not more
+                base += pos
+                buf = buf[pos:] + more
+                pos = 0
+
+            if len(buf) - pos < 4:
+                return
+
+            info = parse_frame_header(buf[pos:pos + 4])
+            if info is None:
+                # Resync on the next possible frame start
+                nxt = buf.find(b'\xff', pos + 1)
+                pos = nxt if nxt != -1 else len(buf)
+                continue
+
+            length, duration, _ = info
+            if pos + length > len(buf):
+                if eof:
+                    return   # Truncated final frame
+                continue
+
+            yield base + pos, length, duration
+            pos += length
+
+def split_complete_frames(buf):
+    """
+    Split a growing MP3 byte stream into (complete, rest) where complete ends
+    on a frame boundary. Bytes that are not frames (tags, junk) pass through.
+    """
+    pos = 0
+    while pos < len(buf):
+        if len(buf) - pos < 4:
+            break
+        info = parse_frame_header(buf[pos:pos + 4])
+        if info is None:
+            nxt = buf.find(b'\xff', pos + 1)
+            pos = nxt if nxt != -1 else len(buf)
+            continue
+        if pos + info[0] > len(buf):
+            break
+        pos += info[0]
+    return buf[:pos], buf[pos:]
@@ -1,50 +1,223 @@
 """
 MQTT client management for MP3 Streamer
+State publishes are coalesced per topic: a change arms a short timer and
+later changes only replace the pending payload, so a burst of /play clicks
+reaches devices as one retained publish of the final state. The pending
+table doubles as the offline queue - while the broker is unreachable it
+keeps the latest payload per topic and is flushed on reconnect. Devices can
+also drive playback by publishing to the command topics.
 """
+import os
+import threading
+import time
+from collections import deque
 import paho.mqtt.client as mqtt
-from config import MQTT_BROKER_IP, MQTT_PORT, MQTT_TOPIC
+from config import (MQTT_BROKER_IP, MQTT_PORT, MQTT_TOPIC, MQTT_COMMAND_TOPIC, MQTT_QOS,
+                    MQTT_COALESCE_SECONDS, MQTT_RATE_WINDOW, UPLOAD_DIR)
 import config
+from catalog import catalog
+from playlist import playlist
+from events import event_bus, current_state
+import metrics
 
 class MQTTManager:
     def __init__(self):
         self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
         self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
+        self.client.on_publish = self.on_publish
+        self.client.on_message = self.on_message
         self.connected = False
-        
+        self.lock = threading.Lock()
+        self.pending = {}       # topic -> (payload, retain, changed_at); latest value only
+        self.inflight = {}      # mid -> (topic, changed_at), until the broker acknowledges
+        self.early_acks = set()  # mids acknowledged before flush() recorded them
+        self.flush_timer = None
+        self.topic_stats = {}   # topic -> publish counters
+        self.commands = {}      # command -> count
+        self.reconnects = 0
+
     def on_connect(self, client, userdata, flags, rc, properties):
         if rc == 0:
             self.connected = True
             print(f"MQTT: Connected successfully to broker at {MQTT_BROKER_IP}:{MQTT_PORT}")
+            client.subscribe(f"{MQTT_COMMAND_TOPIC}/#", qos=1)
+            # Send whatever changed while we were offline
+            self.flush()
         else:
             print(f"MQTT: Connection failed with code {rc}. Trying to reconnect...")
-    
+
+    def on_disconnect(self, client, userdata, flags, rc, properties):
+        self.connected = False
+        with self.lock:
+            self.reconnects += 1
+        print(f"MQTT: Disconnected ({rc}). Queuing publishes until the broker is back")
+
     def connect(self):
-        """Connect to MQTT broker."""
+        """Connect to MQTT broker (in the background, retrying until it is reachable)."""
         try:
-            self.client.connect(MQTT_BROKER_IP, MQTT_PORT, 60)
+            self.client.reconnect_delay_set(min_delay=1, max_delay=30)
+            self.client.connect_async(MQTT_BROKER_IP, MQTT_PORT, 60)
             self.client.loop_start()
         except Exception as e:
             print(f"MQTT Error: Could not connect to broker. Check your network: {e}")
-    
+
+    def publish(self, topic, payload, retain=True):
+        """Queue a publish; it goes out after the coalescing window, or on reconnect."""
+        with self.lock:
+            stats = self._stats(topic)
+            if topic in self.pending:
+                stats["coalesced"] += 1
+            elif not self.connected:
+                stats["queuedOffline"] += 1
+            self.pending[topic] = (payload, retain, time.monotonic())
+            if self.connected and self.flush_timer is None:
+                self.flush_timer = threading.Timer(MQTT_COALESCE_SECONDS, self.flush)
+                self.flush_timer.daemon = True
+                self.flush_timer.start()
+
+    def flush(self):
+        """Send every pending publish now."""
+        with self.lock:
+            if self.flush_timer is not None:
+                self.flush_timer.cancel()
+                self.flush_timer = None
+            if not self.connected:
+                return
+            pending, self.pending = self.pending, {}
+        # Not under self.lock: publish() takes paho's message mutex, which is
+        # held while on_publish runs (and on_publish takes self.lock)
+        for topic, (payload, retain, changed_at) in pending.items():
+            info = self.client.publish(topic, payload, qos=MQTT_QOS, retain=retain)
+            latency = None
+            with self.lock:
+                stats = self.topic_stats[topic]
+                if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                    stats["failed"] += 1
+                    self.pending.setdefault(topic, (payload, retain, changed_at))
+                    continue
+                stats["published"] += 1
+                stats["recent"].append(time.monotonic())
+                if info.mid in self.early_acks:
+                    # Acknowledged before we got to record it
+                    self.early_acks.discard(info.mid)
+                    latency = self._acked(topic, changed_at)
+                else:
+                    self.inflight[info.mid] = (topic, changed_at)
+            if latency is not None:
+                metrics.mqtt_publish_seconds.observe(latency, topic)
+            print(f"MQTT: Published {payload!r} to topic '{topic}'")
+
+    def on_publish(self, client, userdata, mid, reason_code, properties):
+        # QoS 0: written to the socket; QoS 1: acknowledged by the broker
+        with self.lock:
+            entry = self.inflight.pop(mid, None)
+            if entry is None:
+                self.early_acks.add(mid)   # flush() records it once publish() returns
+                return
+            topic, changed_at = entry
+            latency = self._acked(topic, changed_at)
+        metrics.mqtt_publish_seconds.observe(latency, topic)
+
+    def _acked(self, topic, changed_at):
+        """Count an acknowledged publish (call with self.lock held); returns its latency."""
+        latency = time.monotonic() - changed_at
+        stats = self.topic_stats[topic]
+        stats["acked"] += 1
+        stats["latencyTotal"] += latency
+        stats["maxLatency"] = max(stats["maxLatency"], latency)
+        return latency
+
+    def on_message(self, client, userdata, message):
+        # A retained command would replay on every reconnect; only act on live ones
+        if message.retain:
+            return
+        command = message.topic[len(MQTT_COMMAND_TOPIC) + 1:]
+        argument = message.payload.decode('utf-8', 'replace').strip()
+        with self.lock:
+            self.commands[command] = self.commands.get(command, 0) + 1
+        try:
+            self.handle_command(command, argument)
+        except Exception as e:
+            print(f"MQTT: Command '{command}' failed: {e}")
+
+    def handle_command(self, command, argument=''):
+        """Apply a device command: play <file name>, stop or next (playlist order, else library order)."""
+        if command == 'play':
+            if not catalog.get(argument):
+                print(f"MQTT: Ignoring play for unknown track '{argument}'")
+                return
+            self.update_state(os.path.join(UPLOAD_DIR, argument))
+        elif command == 'stop':
+            self.update_state(None)
+        elif command == 'next':
+            self.skip()
+        else:
+            print(f"MQTT: Unknown command '{command}'")
+
+    def skip(self):
+        """Select the next track: the playlist's if one is set up, otherwise the next in the library."""
+        current = os.path.basename(config.CURRENT_TRACK) if config.CURRENT_TRACK else None
+        name = playlist.following(current) if playlist.engaged() else None
+        if name is None or name == current:
+            name = catalog.next_name(current)
+        if name:
+            self.update_state(os.path.join(UPLOAD_DIR, name))
+        return name
+
     def publish_stream_id(self, stream_id):
         """Publish stream ID to MQTT topic."""
-        payload = str(stream_id)
-        self.client.publish(MQTT_TOPIC, payload, qos=0, retain=True)
-        print(f"MQTT: Published ID {stream_id} to topic '{MQTT_TOPIC}'")
-    
+        self.publish(MQTT_TOPIC, str(stream_id))
+
     def disconnect(self):
         """Disconnect from MQTT broker."""
+        self.flush()
         self.client.loop_stop()
         self.client.disconnect()
-        
+
+    def get_status(self):
+        """Connection state, offline queue and per-topic publish metrics."""
+        now = time.monotonic()
+        with self.lock:
+            topics = {}
+            for topic, stats in self.topic_stats.items():
+                while stats["recent"] and now - stats["recent"][0] > MQTT_RATE_WINDOW:
+                    stats["recent"].popleft()
+                topics[topic] = {
+                    "published": stats["published"],
+                    "coalesced": stats["coalesced"],
+                    "queuedOffline": stats["queuedOffline"],
+                    "failed": stats["failed"],
+                    "acked": stats["acked"],
+                    "perMinute": round(len(stats["recent"]) * 60 / MQTT_RATE_WINDOW, 1),
+                    "avgLatencyMs": round(stats["latencyTotal"] / stats["acked"] * 1000, 1) if stats["acked"] else None,
+                    "maxLatencyMs": round(stats["maxLatency"] * 1000, 1) if stats["acked"] else None
+                }
+            return {
+                "connected": self.connected,
+                "reconnects": self.reconnects,
+                "pending": len(self.pending),
+                "inflight": len(self.inflight),
+                "commands": dict(self.commands),
+                "topics": topics
+            }
+
+    def _stats(self, topic):
+        """Counters for a topic (call with self.lock held)."""
+        if topic not in self.topic_stats:
+            self.topic_stats[topic] = {"published": 0, "coalesced": 0, "queuedOffline": 0, "failed": 0,
+                                       "acked": 0, "latencyTotal": 0.0, "maxLatency": 0.0, "recent": deque()}
+        return self.topic_stats[topic]
+
     def update_state(self, track_path):
         """Update global state and notify via MQTT."""
         config.CURRENT_TRACK = track_path
         config.STREAM_ID += 1
-        
+
         self.publish_stream_id(config.STREAM_ID)
-        
+        event_bus.publish('state', current_state())
+
         print(f"State Updated: Track={config.CURRENT_TRACK}, New ID={config.STREAM_ID}")
 
 # Global MQTT manager instance
-mqtt_manager = MQTTManager()
\ No newline at end of file
+mqtt_manager = MQTTManager()
@@ -0,0 +1,122 @@
+"""
+Incremental request body parsing for MP3 Streamer (multipart uploads, chunked pushes)
+Reads the request body in bounded chunks so an upload is never held in RAM.
+"""
+from email.parser import Parser
+from config import UPLOAD_CHUNK_SIZE
+
+MAX_PART_HEADER_SIZE = 16384
+
+class MultipartReader:
+    def __init__(self, rfile, boundary, content_length):
+        self.rfile = rfile
+        self.remaining = content_length
+        self.delimiter = b'\r\n--' + boundary.encode('latin-1')
+        self.buf = bytearray(b'\r\n')   # So the first boundary looks like every other one
+
+    def _fill(self):
+        """Read the next chunk of the body into the buffer; False at end of body."""
+        if self.remaining <= 0:
+            return False
+        data = self.rfile.read(min(UPLOAD_CHUNK_SIZE, self.remaining))
+        if not data:
+            self.remaining = 0
+            return False
+        self.remaining -= len(data)
+        self.buf += data
+        return True
+
+    def _read_until_delimiter(self):
+        """Yield bytes up to the next delimiter and consume the delimiter."""
+        keep = len(self.delimiter) - 1   # Tail that may hold a split delimiter
+        while True:
+            idx = self.buf.find(self.delimiter)
+            if idx != -1:
+                if idx:
+                    yield bytes(self.buf[:idx])
+                del self.buf[:idx + len(self.delimiter)]
+                return
+
+            if len(self.buf) > keep:
+                yield bytes(self.buf[:-keep])
+                del self.buf[:-keep]
+            if not self._fill():
+                raise ValueError("Multipart body ended before closing boundary")
+
+    def _read_part_headers(self):
+        """Parse the header block after a delimiter; None at the closing boundary."""
+        while len(self.buf) < 2 and self._fill():
+            pass
+        if self.buf[:2] == b'--':
+            return None
+
+        while True:
+            end = self.buf.find(b'\r\n\r\n')
+            if end != -1:
+                break
+            if len(self.buf) > MAX_PART_HEADER_SIZE:
+                raise ValueError("Multipart part headers too large")
+            if not self._fill():
+                raise ValueError("Multipart body ended inside part headers")
+
+        header_text = bytes(self.buf[:end]).decode('utf-8', errors='ignore').strip()
+        del self.buf[:end + 4]
+        return Parser().parsestr(header_text, headersonly=True)
+
+    def parts(self):
+        """
+        Yield (headers, chunks) for each part. headers is an email Message
+        (use get_filename() / get_param('name', header='content-disposition'));
+        chunks is a generator of body bytes that must be consumed before
+        moving to the next part.
+        """
+        for _ in self._read_until_delimiter():
+            pass  # Preamble
+
+        while True:
+            headers = self._read_part_headers()
+            if headers is None:
+                return
+
+            chunks = self._read_until_delimiter()
+            yield headers, chunks
+            for _ in chunks:
+                pass  # Drain whatever the caller left unread
+
+def get_boundary(content_type):
+    """Extract the boundary parameter from a multipart Content-Type header."""
+    if 'boundary=' not in content_type:
+        return None
+    return content_type.split('boundary=', 1)[1].split(';', 1)[0].strip().strip('"')
+
+def iter_request_body(rfile, headers):
+    """
+    Yield a request body as it arrives, for Content-Length and
+    Transfer-Encoding: chunked requests alike (each HTTP chunk is yielded
+    as soon as it is complete).
+    """
+    if 'chunked' in headers.get('Transfer-Encoding', '').lower():
+        while True:
+            size_line = rfile.readline(1024)
+            if not size_line:
+                return   # Client went away mid-body
+            size = int(size_line.split(b';', 1)[0].strip(), 16)
+            if size == 0:
+                # Skip trailers up to the final blank line
+                while rfile.readline(1024) not in (b'\r\n', b'\n', b''):
+                    pass
+                return
+            data = rfile.read(size)
+            rfile.readline(1024)   # CRLF after the chunk data
+            if len(data) < size:
+                return
+            if data:
+                yield data
+    else:
+        remaining = int(headers.get('Content-Length', 0))
+        while remaining > 0:
+            data = rfile.read(min(UPLOAD_CHUNK_SIZE, remaining))
+            if not data:
+                return
+            remaining -= len(data)
+            yield data
@@ -0,0 +1,141 @@
+"""
+Server-side playlist for MP3 Streamer
+When a track ends, /stream asks the playlist what comes next and keeps
+sending on the same connection. The next track is pre-read into the track
+cache while the current one plays and sent trimmed to its audio frames (no
+ID3 tags, no Xing/Info header), so the decoder sees one continuous run of
+frames across the boundary instead of a disconnect and a fresh buffer fill.
+"""
+import os
+import random
+import threading
+from config import UPLOAD_DIR
+import config
+from events import event_bus, current_state
+from track_cache import track_cache
+from frame_index import get_index
+
+REPEAT_MODES = ('off', 'all', 'one')
+
+class Playlist:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tracks = []          # Track names in the order they were added
+        self.order = []           # Play order: tracks, or a shuffled copy of them
+        self.shuffle = False
+        self.repeat = 'off'
+        self.transitions = 0      # Track boundaries crossed on an open connection
+
+    def add(self, name):
+        with self.lock:
+            if name in self.tracks:
+                return
+            self.tracks.append(name)
+            if self.shuffle:
+                self.order.insert(random.randint(0, len(self.order)), name)
+            else:
+                self.order.append(name)
+        self._changed()
+
+    def remove(self, name):
+        with self.lock:
+            if name not in self.tracks:
+                return
+            self.tracks.remove(name)
+            self.order.remove(name)
+        self._changed()
+
+    def clear(self):
+        with self.lock:
+            self.tracks = []
+            self.order = []
+        self._changed()
+
+    def set_mode(self, shuffle=None, repeat=None):
+        """Change shuffle and/or repeat ('off', 'all' or 'one'); raises ValueError on a bad mode."""
+        if repeat is not None and repeat not in REPEAT_MODES:
+            raise ValueError(f"repeat must be one of {', '.join(REPEAT_MODES)}")
+        with self.lock:
+            if repeat is not None:
+                self.repeat = repeat
+            if shuffle is not None and shuffle != self.shuffle:
+                self.shuffle = shuffle
+                self.order = list(self.tracks)
+                if shuffle:
+                    random.shuffle(self.order)
+        self._changed()
+
+    def engaged(self):
+        """Whether /stream should carry on past the end of a track."""
+        with self.lock:
+            return bool(self.order) or self.repeat != 'off'
+
+    def following(self, name):
+        """
+        Name of the track to play after `name`, or None when playback should
+        stop. A track that isn't in the playlist is followed by the first one.
+        """
+        with self.lock:
+            if self.repeat == 'one':
+                return name
+            order = self.order
+            start = order.index(name) + 1 if name in order else 0
+            candidates = order[start:]
+            if self.repeat == 'all':
+                candidates += order[:start]
+            repeat_all = self.repeat == 'all'
+
+        for candidate in candidates:
+            if candidate == name and not repeat_all:
+                continue
+            if os.path.exists(os.path.join(UPLOAD_DIR, candidate)):
+                return candidate
+        return None
+
+    def next_for(self, name):
+        """
+        What a stream that just finished `name` should play: the new selection
+        if someone picked a different track meanwhile, otherwise following(name).
+        """
+        selected = os.path.basename(config.CURRENT_TRACK) if config.CURRENT_TRACK else None
+        if selected is None:
+            return None
+        if selected != name:
+            return selected
+        return self.following(name)
+
+    def advance(self, name, next_name):
+        """Move the selection on from name to next_name (first stream over the boundary wins)."""
+        with self.lock:
+            self.transitions += 1
+            if not config.CURRENT_TRACK or os.path.basename(config.CURRENT_TRACK) != name or next_name == name:
+                return
+            # Listeners are already receiving it, so the stream ID (reconnect signal) stays
+            config.CURRENT_TRACK = os.path.join(UPLOAD_DIR, next_name)
+        event_bus.publish('state', current_state())
+        print(f"Playlist: Advanced to '{next_name}'")
+
+    def prepare(self, path):
+        """Pre-read an upcoming track into memory, and index it, in the background."""
+        track_cache.prefetch(path)
+        if os.path.exists(path):
+            get_index(path, build=False)
+
+    def get_status(self):
+        current = os.path.basename(config.CURRENT_TRACK) if config.CURRENT_TRACK else None
+        upcoming = self.following(current) if current else None
+        with self.lock:
+            return {
+                "tracks": list(self.tracks),
+                "order": list(self.order),
+                "shuffle": self.shuffle,
+                "repeat": self.repeat,
+                "next": upcoming,
+                "transitions": self.transitions
+            }
+
+    def _changed(self):
+        event_bus.publish('playlist', self.get_status())
+
+# Global playlist instance
+playlist = Playlist()
@@ -2,9 +2,12 @@
 Audio recording receiver for MP3 Streamer
 Handles audio data sent from browser and converts to MP3
 """
-import subprocess
+import hashlib
 import os
-from config import FFMPEG_PATH, UPLOAD_DIR
+from config import UPLOAD_DIR
+from jobs import PRIORITY_RECORDING
+from blob_store import blob_store
+from transcode import RECORDING_ENCODE_ARGS
 
 class AudioRecorder:
     def __init__(self):
@@ -12,9 +15,10 @@ class AudioRecorder:
     
     def save_recording(self, audio_data, filename):
         """
-        Receive raw audio data from browser and convert to MP3.
+        Queue conversion of raw audio from the browser to MP3.
         audio_data: raw WAV or audio bytes from browser
         filename: desired output filename
+        Returns (success, message, job_id); poll /jobs/<job_id> for the result.
         """
         if not filename.endswith('.mp3'):
             filename += '.mp3'
@@ -22,40 +26,19 @@ class AudioRecorder:
         filename_safe = os.path.basename(filename)
         output_path = os.path.join(UPLOAD_DIR, f"rec_{filename_safe}")
         
-        try:
-            # Save temporary WAV file
-            temp_wav = os.path.join(UPLOAD_DIR, "temp_recording.wav")
-            with open(temp_wav, 'wb') as f:
-                f.write(audio_data)
-            
-            # Convert WAV to MP3 with 48kbps mono
-            subprocess.run([
-                FFMPEG_PATH,
-                "-i", temp_wav,
-                "-ac", "1",              # Mono
-                "-ar", "22050",          # Sample rate
-                "-b:a", "48k",           # 48 kbps bitrate
-                "-y",                    # Overwrite
-                output_path
-            ], capture_output=True, check=True)
-            
-            # Clean up temp file
-            if os.path.exists(temp_wav):
-                os.remove(temp_wav)
-            
-            if os.path.exists(output_path):
-                file_size = os.path.getsize(output_path)
-                print(f"Recording saved: {output_path} ({file_size} bytes)")
-                return True, f"Recording saved as '{filename_safe}'"
-            else:
-                return False, "Failed to create MP3 file"
+        if not audio_data:
+            return False, "No audio data received", None
         
-        except Exception as e:
-            print(f"Recording Error: {e}")
-            # Clean up temp file on error
-            if os.path.exists(temp_wav):
-                os.remove(temp_wav)
-            return False, f"Error saving recording: {str(e)}"
+        # Recordings are short, so they jump ahead of queued uploads.
+        # Audio goes to ffmpeg over stdin - no temp file needed.
+        job = blob_store.transcode(
+            "recording", output_path, RECORDING_ENCODE_ARGS,
+            hashlib.sha256(audio_data).hexdigest(), PRIORITY_RECORDING,
+            input_data=audio_data
+        )
+        if not job:
+            return True, f"Recording saved as '{filename_safe}'", None
+        return True, f"Recording '{filename_safe}' is being converted", job.id
 
 # Global recorder instance
 recorder = AudioRecorder()
\ No newline at end of file
@@ -0,0 +1,616 @@
+"""
+Long-lived response sources for /stream, /live and /events, shared by the threaded handler and the asyncio server.
+A body is a generator of bytes, FileRegion, Pause, WaitFor and SendBuffer items;
+each server core frames it for the connection (frame()) and decides how to write,
+sleep, wait or tune the socket for them.
+"""
+import json
+import os
+import queue
+import config
+from config import CHUNK_SIZE, UPLOAD_DIR, STREAM_WRITE_SLICE
+from broadcast import broadcaster
+from streamer import audio_streamer
+from blob_store import blob_store
+from events import event_bus, current_state, format_event
+from frame_index import get_index
+from mp3 import is_info_frame
+from playlist import playlist
+from track_cache import track_cache
+from transcode import DEVICE_FORMAT_ARGS
+from utils import advise_sequential, Pacer
+from wav import sized_header
+
+class FileRegion:
+    """count bytes of an open file starting at offset (eligible for sendfile)."""
+    def __init__(self, f, offset, count):
+        self.f = f
+        self.offset = offset
+        self.count = count
+
+class Pause:
+    """Sleep before sending the next item (pacing)."""
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+class WaitFor:
+    """Block until source has data past cursor; source provides wait() and wait_async().
+    cursor is whatever the source uses to track a listener (sequence number, queue)."""
+    def __init__(self, source, cursor, timeout=None):
+        self.source = source
+        self.cursor = cursor
+        self.timeout = timeout
+
+class SendBuffer:
+    """Set the socket send buffer size (so send timing follows the client's download rate)."""
+    def __init__(self, size):
+        self.size = size
+
+class Title:
+    """Start of a track, for icy_metadata(); never reaches a server core."""
+    def __init__(self, text):
+        self.text = text
+
+def sliced(body):
+    """body with large bytes and FileRegion items split into STREAM_WRITE_SLICE
+    pieces, so no single write outlasts the write timeout on a slow client."""
+    for item in body:
+        if isinstance(item, FileRegion) and item.count > STREAM_WRITE_SLICE:
+            for offset in range(0, item.count, STREAM_WRITE_SLICE):
+                yield FileRegion(item.f, item.offset + offset, min(STREAM_WRITE_SLICE, item.count - offset))
+        elif isinstance(item, (bytes, memoryview)) and len(item) > STREAM_WRITE_SLICE:
+            view = memoryview(item)
+            for offset in range(0, len(view), STREAM_WRITE_SLICE):
+                yield view[offset:offset + STREAM_WRITE_SLICE]
+        else:
+            yield item
+
+def chunked(items):
+    """items in chunked transfer encoding, ending with the last-chunk marker.
+    File regions are read into memory, as sendfile can't carry the framing."""
+    for item in items:
+        if isinstance(item, FileRegion):
+            item = os.pread(item.f.fileno(), item.count, item.offset)
+        if isinstance(item, (bytes, memoryview)):
+            if len(item):
+                yield b'%x\r\n' % len(item) + item + b'\r\n'
+        else:
+            yield item
+    yield b'0\r\n\r\n'
+
+ICY_TITLE_MAX = 255 * 16 - len("StreamTitle='';")   # Title bytes that fit in the largest metadata block
+
+def icy_block(title):
+    """One ICY metadata block: a length byte (in 16-byte units) and the padded
+    StreamTitle, or a lone zero byte when the title hasn't changed."""
+    if title is None:
+        return b'\x00'
+    # A quote would end the field early; truncate the title (never mid-character), not the wrapper
+    title = title.replace("'", "\u2019").encode('utf-8')[:ICY_TITLE_MAX].decode('utf-8', 'ignore')
+    text = f"StreamTitle='{title}';".encode('utf-8')
+    blocks = -(-len(text) // 16)
+    return bytes([blocks]) + text.ljust(blocks * 16, b'\x00')
+
+def _split(item, count):
+    """(first count bytes, the rest) of a bytes or FileRegion item."""
+    if isinstance(item, FileRegion):
+        return FileRegion(item.f, item.offset, count), FileRegion(item.f, item.offset + count, item.count - count)
+    view = memoryview(item)
+    return view[:count], view[count:]
+
+def icy_metadata(body, metaint):
+    """
+    body with a metadata block after every metaint bytes of audio (Shoutcast
+    Icy-MetaData), splitting file regions and buffers at the boundaries. The
+    block after a Title carries it as StreamTitle; the rest are empty.
+    """
+    title = None
+    left = metaint
+    try:
+        for item in body:
+            if isinstance(item, Title):
+                title = os.path.splitext(item.text)[0]
+                continue
+            if not isinstance(item, (bytes, memoryview, FileRegion)):
+                yield item
+                continue
+            size = item.count if isinstance(item, FileRegion) else len(item)
+            while size >= left:
+                head, item = _split(item, left)
+                yield head
+                yield icy_block(title)
+                title = None
+                size -= left
+                left = metaint
+            if size:
+                yield item
+                left -= size
+    finally:
+        body.close()
+
+def frame(headers, body, http11, route):
+    """
+    Delimit a stream response for the connection: returns (headers, items,
+    close). Responses with a Content-Length leave the connection reusable;
+    open-ended /live and /events responses are chunked for HTTP/1.1 clients
+    (STREAM_CHUNKED) and everything else ends by closing it - /stream bodies
+    stay raw MP3, as devices read them straight off the socket.
+    """
+    headers = list(headers)
+    has_length = any(name.lower() == 'content-length' for name, _ in headers)
+    if body is None:
+        if not has_length:
+            headers.append(('Content-Length', '0'))
+        return headers, None, False
+    if has_length:
+        return headers, sliced(body), False
+    if http11 and config.STREAM_CHUNKED and route in CHUNKED_ROUTES:
+        headers.append(('Transfer-Encoding', 'chunked'))
+        return headers, chunked(sliced(body)), False
+    headers.append(('Connection', 'close'))
+    return headers, sliced(body), True
+
+def parse_range(value, file_size):
+    """
+    Parse a single 'bytes=' Range header into (start, end), end exclusive.
+    Returns None for anything we choose to ignore (other units, multiple ranges).
+    """
+    unit, _, spec = value.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+
+    first, _, last = spec.strip().partition('-')
+    try:
+        if not first:
+            suffix = int(last)
+            return max(0, file_size - suffix), file_size
+        start = int(first)
+        end = int(last) + 1 if last else file_size
+    except ValueError:
+        return None
+
+    if last and end <= start:
+        return None
+    # start >= end from here on means the range is unsatisfiable (416)
+    return start, min(end, file_size)
+
+def open_audio_stream(params=None, headers=None):
+    """
+    Return (status, headers, body) for a /stream request; body is None on error.
+    Honours Range (206) and ?t=SECONDS. Ranges are served byte-exact; an
+    open-ended one from a player (?snap=1, or with ?t=) and time seeks start on
+    a frame boundary. ?br=KBPS serves the closest
+    rendition at or below KBPS, ?br=auto steps down as the client falls behind.
+    Without a Range, and while a playlist is set up, the response carries on
+    into the following tracks (no Content-Length). So does an Icy-MetaData: 1
+    request, which also switches to a newly selected track in-band and gets
+    the title every ICY_METAINT bytes. ?format=adpcm|ulaw|pcm8 serves the
+    track's WAV device rendition instead (single track; 400 for any other
+    format, 404 if it isn't in DEVICE_FORMATS or not encoded yet).
+    """
+    params = params or {}
+    current_path = config.CURRENT_TRACK
+    if not current_path or not os.path.exists(current_path):
+        print("Streamer: No track selected or file not found. Closing connection.")
+        return 404, [], None
+
+    fmt = params.get('format', ['mp3'])[0]
+    if fmt != 'mp3':
+        if fmt not in DEVICE_FORMAT_ARGS:
+            print(f"Streamer: Unknown format '{fmt}'. Closing connection.")
+            return 400, [], None
+        if fmt not in config.DEVICE_FORMATS:
+            print(f"Streamer: Format '{fmt}' is not enabled (DEVICE_FORMATS). Closing connection.")
+            return 404, [], None
+        path = blob_store.format_path(current_path, fmt)
+        if path is None or not os.path.exists(path):
+            print(f"Streamer: No {fmt} rendition of '{os.path.basename(current_path)}'. Closing connection.")
+            return 404, [], None
+        return open_file_stream(path, 'audio/wav', params, headers)
+
+    if config.BROADCAST_MODE:
+        response_headers = [('Content-type', 'audio/mp3'), ('Cache-Control', 'no-cache')]
+        return 200, response_headers, broadcast_body()
+
+    br = params.get('br', [''])[0]
+    if br == 'auto':
+        ladder = rendition_ladder(current_path)
+        indexes = [get_index(path) for _, path in ladder]
+        return 200, [('Content-type', 'audio/mp3'), ('Cache-Control', 'no-cache')], \
+            auto_rendition_body(ladder, indexes, _seek_seconds(params))
+    kbps = int(br) if br.isdigit() else None
+    name = os.path.basename(current_path)
+    if kbps is not None:
+        current_path = pick_rendition(rendition_ladder(current_path), kbps)
+
+    icy = config.ICY_METAINT > 0 and headers is not None and headers.get('Icy-MetaData', '').strip() == '1'
+    if (icy or playlist.engaged()) and not (headers and headers.get('Range')):
+        start = 0
+        index = get_index(current_path)   # Now, so the body finds it in memory
+        seconds = _seek_seconds(params)
+        if seconds > 0:
+            start = index.offsets[index.frame_at_time(seconds)]
+        response_headers = [('Content-type', 'audio/mp3'), ('Cache-Control', 'no-cache')]
+        body = playlist_body(name, current_path, start, kbps, follow=icy)
+        if icy:
+            response_headers += [('icy-metaint', str(config.ICY_METAINT)), ('icy-name', config.ICY_NAME)]
+            body = icy_metadata(body, config.ICY_METAINT)
+        return 200, response_headers, body
+
+    return open_file_stream(current_path, 'audio/mp3', params, headers)
+
+def open_file_stream(path, content_type, params, headers):
+    """(status, headers, body) for one whole file, a Range of it or the rest from ?t=."""
+    file_size = os.path.getsize(path)
+    start, end = 0, file_size
+    status = 200
+    prefix = b''
+    range_header = headers.get('Range') if headers else None
+    byte_range = parse_range(range_header, file_size) if range_header else None
+
+    if byte_range:
+        start, end = byte_range
+        status = 206
+        if start > 0 and range_header.strip().endswith('-') and _wants_snap(params):
+            # Open-ended range from a player resuming: snap to the next frame start
+            index = get_index(path)
+            if start < index.data_end:
+                start = index.offsets[index.frame_at_offset(start)]
+        if start >= end:
+            return 416, [('Content-Range', f'bytes */{file_size}')], None
+    elif 't' in params:
+        seconds = _seek_seconds(params)
+        if seconds > 0:
+            index = get_index(path)
+            start = index.offsets[index.frame_at_time(seconds)]
+            if content_type == 'audio/wav' and index.frame_count:
+                # Blocks carry no format of their own: resend the header, sized for what follows
+                end = min(end, index.data_end)
+                with open(path, 'rb') as f:
+                    prefix = sized_header(f.read(index.offsets[0]), end - start)
+
+    response_headers = [
+        ('Content-type', content_type),
+        ('Accept-Ranges', 'bytes'),
+        ('Content-Length', str(len(prefix) + end - start)),
+    ]
+    if status == 206:
+        response_headers.append(('Content-Range', f'bytes {start}-{end - 1}/{file_size}'))
+
+    source = open_track(path, end)
+    index = get_index(path) if config.STREAM_PACING else None
+    return status, response_headers, file_body(source, path, start, end, prefix, index)
+
+def _wants_snap(params):
+    """Whether a resuming client asked for a frame-aligned start (?snap=1, or alongside ?t=)."""
+    return params.get('snap', ['0'])[0] == '1' or 't' in params
+
+def _seek_seconds(params):
+    try:
+        return max(0.0, float(params.get('t', ['0'])[0]))
+    except ValueError:
+        return 0.0
+
+def rendition_ladder(path, build=True):
+    """[(kbps, path)] for a track and its renditions, highest bitrate first.
+    build=False doesn't wait for a missing index; the track then ranks on top."""
+    index = get_index(path, build)
+    ladder = [(index.bitrate() if index else float('inf'), path)]
+    ladder += [(kbps, rendition) for kbps, rendition in blob_store.rendition_paths(path).items()
+               if os.path.exists(rendition)]
+    ladder.sort(reverse=True)
+    return ladder
+
+def pick_rendition(ladder, kbps):
+    """Path of the highest rendition at or below kbps (the lowest one if none is)."""
+    for rendition_kbps, path in ladder:
+        if rendition_kbps <= kbps:
+            return path
+    return ladder[-1][1]
+
+def open_track(path, length=0):
+    """A track's bytes from the track cache when it holds them, otherwise the open file."""
+    data = track_cache.get(path)
+    if data is not None:
+        return data
+    f = open(path, 'rb')
+    advise_sequential(f, length)
+    return f
+
+def close_track(source):
+    if not isinstance(source, bytes):
+        source.close()
+
+def region(source, offset, count):
+    """Body item for count bytes of an open_track() source from offset."""
+    if isinstance(source, bytes):
+        return memoryview(source)[offset:offset + count]
+    return FileRegion(source, offset, count)
+
+def audio_start(source, index):
+    """Offset of the first frame that carries audio (skips a Xing/Info/VBRI header frame)."""
+    if index.frame_count > 1:
+        first, second = index.offsets[0], index.offsets[1]
+        if isinstance(source, bytes):
+            frame = source[first:second]
+        else:
+            source.seek(first)
+            frame = source.read(second - first)
+        if is_info_frame(frame):
+            return second
+    return index.offsets[0]
+
+def file_body(source, path, start, end, prefix=b'', index=None):
+    """Body for prefix, then bytes [start, end) of a track, paced along index when one is given."""
+    try:
+        if prefix:
+            yield prefix
+        if index is not None:
+            yield from paced_file_body(source, index, start, end, Pacer(config.STREAM_LEAD_SECONDS))
+        else:
+            yield region(source, start, end - start)
+
+        print(f"Streamer: Finished streaming '{path}' (ID: {config.STREAM_ID}).")
+    finally:
+        close_track(source)
+
+def frame_chunks(index, start, end):
+    """(offset, count, seconds) for runs of whole frames of at least CHUNK_SIZE from start up to end."""
+    offsets = index.offsets
+    times = index.times
+    first = index.frame_at_offset(start)
+    sent = start
+    chunk_time = times[first] if index.frame_count else 0.0
+
+    for i in range(first, index.frame_count):
+        frame_end = offsets[i + 1]
+        if frame_end > end:
+            break
+        if frame_end - sent < CHUNK_SIZE:
+            continue
+
+        yield sent, frame_end - sent, times[i + 1] - chunk_time
+        sent = frame_end
+        chunk_time = times[i + 1]
+
+def paced_file_body(source, index, start, end, pacer=None):
+    """Frame-aligned chunks, at playback rate plus the pacer's lead when one is given."""
+    sent = start
+    for offset, count, seconds in frame_chunks(index, start, end):
+        yield region(source, offset, count)
+        sent = offset + count
+        if pacer is None:
+            continue
+        pacer.advance(seconds)
+
+        delay = pacer.delay()
+        if delay > 0:
+            yield Pause(delay)
+
+    # Trailing tag bytes, a truncated last frame or the end of a bounded range
+    if sent < end:
+        yield region(source, sent, end - sent)
+
+def track_file(name, kbps=None):
+    """Path to stream for a track name: the track itself or its rendition closest to kbps."""
+    path = os.path.join(UPLOAD_DIR, name)
+    if kbps is not None and os.path.exists(path):
+        path = pick_rendition(rendition_ladder(path, build=False), kbps)
+    return path
+
+def playlist_body(name, path, start, kbps=None, follow=False):
+    """
+    Body that plays a track from byte `start`, then whatever the playlist
+    plays next, on the same connection. Tracks end at their last complete
+    frame and the following ones start at their first audio frame, read
+    ahead into the track cache while the previous one plays, so the decoder
+    never sees a tag, header frame or pause at a boundary. With follow, a
+    Title precedes each track and a new selection (stream ID change) cuts
+    in at the next frame boundary instead of waiting for the track to end.
+    Runs on the event loop in asyncio mode, so a track that isn't indexed
+    yet is sent whole while its index is built in the background.
+    """
+    pacer = Pacer(config.STREAM_LEAD_SECONDS) if config.STREAM_PACING else None
+    stream_id = config.STREAM_ID
+    while True:
+        upcoming = playlist.following(name)
+        if upcoming:
+            playlist.prepare(track_file(upcoming, kbps))
+
+        index = get_index(path, build=False)
+        if index is not None and index.frame_count == 0:
+            break
+        size = index.data_end if index else os.path.getsize(path)
+        source = open_track(path, size)
+        try:
+            if index is None:
+                start = start or 0
+            elif start is None:
+                start = audio_start(source, index)
+            if follow:
+                yield Title(name)
+            if index is None:
+                # Still being indexed: the whole file, unpaced, rather than a scan on this thread
+                yield region(source, start, size - start)
+            elif pacer or follow:
+                for item in paced_file_body(source, index, start, index.data_end, pacer):
+                    yield item
+                    if follow and config.STREAM_ID != stream_id:
+                        break
+            elif start < index.data_end:
+                yield region(source, start, index.data_end - start)
+        finally:
+            close_track(source)
+
+        if follow and config.STREAM_ID != stream_id:
+            stream_id = config.STREAM_ID
+            if not config.CURRENT_TRACK:
+                break
+            name = os.path.basename(config.CURRENT_TRACK)
+            path = track_file(name, kbps)
+            if not os.path.exists(path):
+                break
+            print(f"Streamer: Switching to '{name}' in-band (ID: {stream_id}).")
+            start = None
+            continue
+
+        next_name = playlist.next_for(name)
+        if next_name is None:
+            break
+        path = track_file(next_name, kbps)
+        if not os.path.exists(path):
+            break
+        playlist.advance(name, next_name)
+        name = next_name
+        start = None
+
+    print(f"Streamer: Playlist ended after '{name}' (ID: {config.STREAM_ID}).")
+
+def auto_rendition_body(ladder, indexes, start_seconds):
+    """
+    Body that starts on the top of the ladder and steps down one rendition
+    when less than STREAM_AUTO_MIN_LEAD of audio is queued ahead of playback
+    and that lead shrank over the last STREAM_AUTO_WINDOW - the client is
+    draining slower than real time. Switches land on
+    a frame boundary at the same playback position, and every rendition has
+    the same sample rate, so the decoder only sees a bitrate change.
+    indexes are the ladder's frame indexes, built before the body starts.
+    """
+    pacer = Pacer(config.STREAM_LEAD_SECONDS)
+    position = start_seconds
+    window_start = 0.0
+    window_lead = None   # Lead at the start of the current window
+    level = 0
+    source = None
+    yield SendBuffer(config.STREAM_AUTO_SNDBUF)
+    try:
+        while True:
+            kbps, path = ladder[level]
+            index = indexes[level]
+            offsets = index.offsets
+            times = index.times
+            source = open_track(path)
+
+            i = index.frame_at_time(position)
+            step_down = False
+            while i < index.frame_count and not step_down:
+                j = i + 1
+                while j < index.frame_count and offsets[j] - offsets[i] < CHUNK_SIZE:
+                    j += 1
+                yield region(source, offsets[i], offsets[j] - offsets[i])
+                pacer.advance(times[j] - times[i])
+                i = j
+
+                if config.STREAM_PACING:
+                    delay = pacer.delay()
+                    if delay > 0:
+                        yield Pause(delay)
+
+                elapsed = pacer.elapsed()
+                if elapsed - window_start >= config.STREAM_AUTO_WINDOW:
+                    lead = pacer.lead()
+                    step_down = (level + 1 < len(ladder) and lead < config.STREAM_AUTO_MIN_LEAD
+                                 and window_lead is not None and lead < window_lead)
+                    window_start = elapsed
+                    window_lead = lead
+
+            close_track(source)
+            source = None
+            if not step_down:
+                break
+            position = times[i]
+            level += 1
+            print(f"Streamer: Client falling behind at {kbps} kbps, switching to {ladder[level][0]} kbps")
+
+        print(f"Streamer: Finished streaming '{ladder[0][1]}' (ID: {config.STREAM_ID}).")
+    finally:
+        if source is not None:
+            close_track(source)
+
+def broadcast_body():
+    """Body that follows the shared broadcast ring buffer."""
+    cursor = broadcaster.join()
+    try:
+        while broadcaster.running:
+            chunks, cursor = broadcaster.read(cursor)
+            if not chunks:
+                yield WaitFor(broadcaster, cursor, timeout=5)
+                continue
+            yield from chunks
+
+        print(f"Streamer: Broadcast ended (ID: {config.STREAM_ID}).")
+    finally:
+        broadcaster.leave()
+
+def open_live_stream(params=None, headers=None):
+    """Return (status, headers, body) for /live, the browser microphone broadcast."""
+    if not audio_streamer.is_streaming:
+        return 404, [], None
+    response_headers = [('Content-type', 'audio/mp3'), ('Cache-Control', 'no-cache')]
+    return 200, response_headers, live_body()
+
+def live_body():
+    """Body that relays encoded frames from AudioStreamer until the stream ends."""
+    client_queue = audio_streamer.add_stream_client()
+    if client_queue is None:
+        return
+    try:
+        while True:
+            try:
+                chunk = client_queue.get_nowait()
+            except queue.Empty:
+                yield WaitFor(audio_streamer, client_queue, timeout=5)
+                continue
+            if chunk is None:
+                break
+            yield chunk
+
+        print("Streamer: Live stream ended.")
+    finally:
+        audio_streamer.remove_stream_client(client_queue)
+
+def open_event_stream(params=None, headers=None):
+    """Return (status, headers, body) for /events, the UI's Server-Sent Events channel."""
+    try:
+        last_event_id = int(headers.get('Last-Event-ID')) if headers and headers.get('Last-Event-ID') else None
+    except ValueError:
+        last_event_id = None
+    response_headers = [
+        ('Content-type', 'text/event-stream'),
+        ('Cache-Control', 'no-cache'),
+        ('X-Accel-Buffering', 'no'),
+    ]
+    return 200, response_headers, event_body(last_event_id)
+
+def event_body(last_event_id):
+    """Body that relays bus events, with a comment line as heartbeat while idle."""
+    cursor, resumed = event_bus.join(last_event_id)
+    try:
+        yield f"retry: {config.EVENTS_RETRY_MS}\n\n".encode('utf-8')
+        if not resumed:
+            # New or too far behind to replay: start from the current state
+            yield format_event(cursor - 1, 'state', json.dumps(current_state()))
+
+        idle = False
+        while True:
+            events, cursor = event_bus.read(cursor)
+            if events:
+                yield b''.join(format_event(*event) for event in events)
+                idle = False
+                continue
+            if idle:
+                yield b': heartbeat\n\n'
+            yield WaitFor(event_bus, cursor, timeout=config.EVENTS_HEARTBEAT)
+            idle = True
+    finally:
+        event_bus.leave()
+
+# GET paths served as long-lived responses, by both server cores
+STREAM_ROUTES = {
+    '/stream': open_audio_stream,
+    '/live': open_live_stream,
+    '/events': open_event_stream,
+}
+
+# Open-ended responses that may use chunked encoding (browser and EventSource clients)
+CHUNKED_ROUTES = {'/live', '/events'}
@@ -1,141 +1,250 @@
 """
 Real-time audio streaming manager with MP3 encoding
 """
+import asyncio
 import threading
 import queue
 import subprocess
-import os
-from config import FFMPEG_PATH, UPLOAD_DIR
+import time
+from config import FFMPEG_PATH, LIVE_CLIENT_QUEUE_CHUNKS
 from datetime import datetime
+from mp3 import split_complete_frames
+from utils import wake_async_waiters
 
 class AudioStreamer:
     def __init__(self):
         self.is_streaming = False
         self.stream_queue = queue.Queue()
         self.clients = []
-        self.lock = threading.Lock()
+        self.lock = threading.Lock()         # Guards clients and stream state
+        self.cond = threading.Condition(self.lock)   # Signalled when client queues gain data
+        self.input_lock = threading.Lock()   # Serialises writes to the encoder's stdin
+        self.async_waiters = []              # (loop, future) pairs parked in wait_async()
         self.stream_id = 0
         self.stream_name = ""
         self.ffmpeg_process = None
-        self.temp_wav_file = None
-    
+        self.pump_thread = None
+        self._reset_counters()
+
+    def _reset_counters(self):
+        self.started_at = None
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.chunks_out = 0
+        self.chunks_dropped = 0
+        self.max_queue_depth = 0
+
     def start_stream(self, stream_name):
         """Start a new real-time stream with MP3 encoding."""
         with self.lock:
             if self.is_streaming:
                 return False, "Already streaming"
-            
+
             self.is_streaming = True
             self.stream_id += 1
             self.stream_name = stream_name
             self.stream_queue = queue.Queue()
             self.clients = []
-            
-            # Start FFmpeg process to encode WAV to MP3
-            self.temp_wav_file = os.path.join(UPLOAD_DIR, "stream_input.wav")
-            mp3_output = "pipe:1"  # Output to stdout
-            
+            self._reset_counters()
+            self.started_at = time.time()
+
+            # Start FFmpeg: whatever the browser sends (WebM/Opus, Ogg, WAV) on stdin, MP3 on stdout
             try:
                 self.ffmpeg_process = subprocess.Popen([
                     FFMPEG_PATH,
-                    "-f", "wav",
-                    "-i", self.temp_wav_file,
+                    "-loglevel", "error",
+                    "-fflags", "nobuffer",      # Don't hold input packets back
+                    "-probesize", "32768",      # Start encoding after the first timeslice,
+                    "-analyzeduration", "0",    # not after seconds of probing
+                    "-i", "pipe:0",
                     "-ac", "1",           # Mono
                     "-ar", "22050",       # Sample rate
                     "-b:a", "48k",        # 48 kbps bitrate
+                    "-write_xing", "0",   # Live output has no length to record
+                    "-flush_packets", "1",
                     "-f", "mp3",
-                    "-loglevel", "error",
-                    mp3_output
-                ], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                
+                    "pipe:1"
+                ], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+                # Drain encoder output on its own thread so producers never wait on it
+                self.pump_thread = threading.Thread(
+                    target=self._pump_output, args=(self.ffmpeg_process,),
+                    name="stream-pump", daemon=True
+                )
+                self.pump_thread.start()
+
                 print(f"Stream started: {stream_name} (ID: {self.stream_id})")
                 return True, f"Stream '{stream_name}' started"
             except Exception as e:
                 print(f"FFmpeg error: {e}")
                 self.is_streaming = False
                 return False, f"Failed to start FFmpeg: {str(e)}"
-    
+
     def add_stream_client(self):
         """Register a client listening to the stream."""
         with self.lock:
             if not self.is_streaming:
                 return None
-            
-            client_queue = queue.Queue()
+
+            # Bounded: a stalled client loses its oldest audio instead of growing forever
+            client_queue = queue.Queue(maxsize=LIVE_CLIENT_QUEUE_CHUNKS)
             self.clients.append(client_queue)
             print(f"Stream client connected (Total: {len(self.clients)})")
             return client_queue
-    
+
+    def remove_stream_client(self, client_queue):
+        """Unregister a client (call when its connection closes)."""
+        with self.lock:
+            if client_queue in self.clients:
+                self.clients.remove(client_queue)
+                print(f"Stream client disconnected (Total: {len(self.clients)})")
+
     def push_audio_chunk(self, chunk):
-        """Push audio chunk for MP3 encoding."""
+        """Push audio chunk for MP3 encoding (output is delivered by the pump thread)."""
+        process = self.ffmpeg_process
+        if not self.is_streaming or not process:
+            return
+
+        try:
+            with self.input_lock:
+                process.stdin.write(chunk)
+                process.stdin.flush()
+                self.bytes_in += len(chunk)
+        except Exception as e:
+            print(f"Stream push error: {e}")
+
+    def _pump_output(self, process):
+        """Read encoded MP3 as it appears and fan whole frames out to every client."""
+        pending = b''
+        while True:
+            try:
+                data = process.stdout.read1(4096)
+            except (OSError, ValueError):
+                break
+            if not data:
+                break
+
+            frames, pending = split_complete_frames(pending + data)
+            if frames:
+                self._deliver(frames)
+
+        if pending:
+            self._deliver(pending)
+        if self.is_streaming:
+            print(f"Stream: Encoder exited while '{self.stream_name}' is live")
+
+    def _deliver(self, mp3_chunk):
         with self.lock:
-            if not self.is_streaming or not self.ffmpeg_process:
+            self.bytes_out += len(mp3_chunk)
+            self.chunks_out += 1
+            for client_queue in self.clients:
+                self._put_drop_oldest(client_queue, mp3_chunk)
+                depth = client_queue.qsize()
+                if depth > self.max_queue_depth:
+                    self.max_queue_depth = depth
+            self._notify()
+
+    def _notify(self):
+        """Wake blocked and parked listeners (call with self.lock held)."""
+        self.cond.notify_all()
+        if self.async_waiters:
+            wake_async_waiters(self.async_waiters)
+            self.async_waiters = []
+
+    def wait(self, client_queue, timeout=None):
+        """Block until client_queue has something to read."""
+        with self.cond:
+            self.cond.wait_for(lambda: not client_queue.empty(), timeout)
+
+    async def wait_async(self, client_queue, timeout=None):
+        """Event-loop version of wait()."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self.cond:
+            if not client_queue.empty():
                 return
-            
+            self.async_waiters.append((loop, future))
+
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self.cond:
+                if (loop, future) in self.async_waiters:
+                    self.async_waiters.remove((loop, future))
+
+    def _put_drop_oldest(self, client_queue, item):
+        """Queue item, discarding the oldest entry when the client is behind.
+        Entries are whole MP3 frames, so the client skips audio but never
+        receives a torn frame."""
+        while True:
             try:
-                # Write WAV data to FFmpeg stdin
-                self.ffmpeg_process.stdin.write(chunk)
-                self.ffmpeg_process.stdin.flush()
-                
-                # Read MP3 output from FFmpeg stdout
+                client_queue.put_nowait(item)
+                return
+            except queue.Full:
                 try:
-                    mp3_chunk = self.ffmpeg_process.stdout.read(4096)
-                    if mp3_chunk:
-                        # Send MP3 chunk to all connected clients
-                        for client_queue in self.clients:
-                            try:
-                                client_queue.put_nowait(mp3_chunk)
-                            except queue.Full:
-                                pass
-                except:
+                    client_queue.get_nowait()
+                    self.chunks_dropped += 1
+                except queue.Empty:
                     pass
-            except Exception as e:
-                print(f"Stream push error: {e}")
-    
+
     def stop_stream(self):
         """Stop the current stream."""
         with self.lock:
             if not self.is_streaming:
                 return False, "Not streaming"
-            
+
             self.is_streaming = False
             stream_name = self.stream_name
-            
-            # Close FFmpeg process
+            process = self.ffmpeg_process
+            self.ffmpeg_process = None
+
+        # Close FFmpeg process (outside the lock: the pump still delivers its last frames)
+        if process:
             try:
-                if self.ffmpeg_process:
-                    self.ffmpeg_process.stdin.close()
-                    self.ffmpeg_process.wait(timeout=2)
-                    self.ffmpeg_process = None
-            except:
-                pass
-            
-            # Clean up temp file
-            if self.temp_wav_file and os.path.exists(self.temp_wav_file):
-                try:
-                    os.remove(self.temp_wav_file)
-                except:
-                    pass
-            
-            # Send end-of-stream marker to all clients
+                with self.input_lock:
+                    process.stdin.close()
+            except OSError:
+                pass   # Encoder already gone (broken pipe on the final flush)
+            try:
+                process.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                print(f"Stream: Encoder for '{stream_name}' didn't exit, killing it")
+                process.kill()
+                process.wait()
+        if self.pump_thread:
+            self.pump_thread.join(timeout=2)
+            self.pump_thread = None
+
+        # Send end-of-stream marker to all clients
+        with self.lock:
             for client_queue in self.clients:
-                try:
-                    client_queue.put_nowait(None)  # None signals end of stream
-                except queue.Full:
-                    pass
-            
-            print(f"Stream stopped: {stream_name}")
-            return True, f"Stream '{stream_name}' ended"
-    
+                self._put_drop_oldest(client_queue, None)  # None signals end of stream
+            self._notify()
+
+        print(f"Stream stopped: {stream_name}")
+        return True, f"Stream '{stream_name}' ended"
+
     def get_stream_status(self):
         """Get current stream status."""
         with self.lock:
+            elapsed = time.time() - self.started_at if self.started_at else 0
+            depths = [client_queue.qsize() for client_queue in self.clients]
             return {
                 "is_streaming": self.is_streaming,
                 "stream_id": self.stream_id,
                 "stream_name": self.stream_name,
-                "client_count": len(self.clients)
+                "client_count": len(self.clients),
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "encoded_kbps": round(self.bytes_out * 8 / elapsed / 1000, 1) if elapsed else 0,
+                "chunks_out": self.chunks_out,
+                "chunks_dropped": self.chunks_dropped,
+                "queue_depths": depths,
+                "max_queue_depth": self.max_queue_depth,
+                "queue_limit": LIVE_CLIENT_QUEUE_CHUNKS
             }
 
 # Global streamer instance
-audio_streamer = AudioStreamer()
\ No newline at end of file
+audio_streamer = AudioStreamer()
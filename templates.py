@@ -1,30 +1,46 @@
 """
 HTML template generation for MP3 Streamer web interface - UPDATED WITH RECORDING.
+The page is static: the current track comes from /status and the track list
+from /library, so it is rendered and compressed once and served with an ETag.
 """
-import os
-from config import UPLOAD_DIR
-from utils import escape_html
-
-def generate_html_page(current_track):
+import gzip
+import hashlib
+from config import LIVE_TIMESLICE_MS
+
+try:
+    import brotli
+except ImportError:
+    brotli = None   # Optional: gzip only
+
+class StaticPage:
+    """A rendered page with its compressed variants and their ETags, built once."""
+    def __init__(self, html):
+        body = html.encode('utf-8')
+        digest = hashlib.sha256(body).hexdigest()[:16]
+        self.variants = {'identity': (body, f'"{digest}"')}
+        self.variants['gzip'] = (gzip.compress(body, 9), f'"{digest}-gz"')
+        if brotli:
+            self.variants['br'] = (brotli.compress(body), f'"{digest}-br"')
+
+    def negotiate(self, accept_encoding):
+        """Return (encoding, body, etag) for the best variant the client accepts."""
+        accepted = set()
+        for part in accept_encoding.split(','):
+            name, _, params = part.partition(';')
+            params = params.strip().replace(' ', '')
+            try:
+                q = float(params[2:]) if params.startswith('q=') else 1.0
+            except ValueError:
+                q = 0.0
+            if q > 0:
+                accepted.add(name.strip().lower())
+        for encoding in ('br', 'gzip'):
+            if encoding in self.variants and encoding in accepted:
+                return (encoding,) + self.variants[encoding]
+        return ('identity',) + self.variants['identity']
+
+def generate_html_page():
     """Generate the web interface HTML."""
-    current_filename = os.path.basename(current_track) if current_track else None
-    
-    files_html = "".join([
-        f"""
-        <div class="flex justify-between items-center p-3 bg-gray-50 rounded-lg border border-gray-200 hover:bg-gray-100 transition duration-150 ease-in-out">
-            <span class="text-gray-800 font-medium text-lg truncate pr-4">{escape_html(f)}</span>
-            <div class="flex space-x-2 flex-shrink-0">
-                {'<button class="stop-btn bg-red-600 hover:bg-red-700 text-white font-semibold py-2 px-4 rounded-full shadow-md transition duration-150 ease-in-out" onclick="controlAction(\'/stop\')"><i class="fas fa-stop mr-2"></i>Stop</button>' if f == current_filename else f'<button class="play-btn bg-blue-600 hover:bg-blue-700 text-white font-semibold py-2 px-4 rounded-full shadow-md transition duration-150 ease-in-out" onclick="controlAction(\'/play\', \'{escape_html(f)}\')"><i class="fas fa-play mr-2"></i>Play</button>'}
-                <button class="delete-btn bg-gray-400 hover:bg-gray-500 text-white font-semibold py-2 px-4 rounded-full shadow-md transition duration-150 ease-in-out" onclick="controlAction(\'/delete\', \'{escape_html(f)}\')"><i class="fas fa-trash-alt"></i></button>
-            </div>
-        </div>
-        """
-        for f in os.listdir(UPLOAD_DIR) if f.endswith(".mp3")
-    ])
-
-    initial_track_display = 'None' if not current_filename else current_filename
-    initial_status_class = "bg-yellow-50 border-yellow-500 text-yellow-700" if not current_filename else "bg-green-50 border-green-500 text-green-700"
-
     return f"""
     <!DOCTYPE html>
     <html>
@@ -57,18 +73,45 @@ def generate_html_page(current_track):
             </header>
             
             <div id="current-track-status" 
-                 class="p-4 rounded-lg text-center font-bold text-lg border-2 {initial_status_class}"
-                 data-current-track="{initial_track_display}">
-                Current Track: <strong>{initial_track_display}</strong>
+                 class="p-4 rounded-lg text-center font-bold text-lg border-2 bg-yellow-50 border-yellow-500 text-yellow-700">
+                Current Track: <strong id="current-track-name">...</strong>
             </div>
 
             <section class="space-y-4">
                 <h2 class="text-2xl font-semibold text-gray-700 border-l-4 border-blue-500 pl-3">
-                    <i class="fas fa-list-music mr-2"></i> Track List ({len(os.listdir(UPLOAD_DIR))} total)
+                    <i class="fas fa-list-music mr-2"></i> Track List (<span id="trackCount">...</span> total)
+                </h2>
+                <div class="flex space-x-2">
+                    <input type="search" id="trackSearch" placeholder="Search tracks" class="flex-grow px-4 py-2 text-sm text-gray-700 border border-gray-300 rounded-lg focus:outline-none focus:ring-2 focus:ring-blue-500">
+                    <select id="trackSort" class="px-3 py-2 text-sm text-gray-700 border border-gray-300 rounded-lg focus:outline-none focus:ring-2 focus:ring-blue-500">
+                        <option value="name:asc">Name</option>
+                        <option value="added:desc">Newest</option>
+                        <option value="duration:desc">Longest</option>
+                        <option value="size:desc">Largest</option>
+                    </select>
+                </div>
+                <div id="trackList" class="track-list space-y-2"></div>
+                <p id="trackSentinel" class="text-sm text-gray-400 text-center py-2">Loading tracks...</p>
+            </section>
+
+            <section class="space-y-4 pt-4 border-t border-gray-200">
+                <h2 class="text-2xl font-semibold text-gray-700 border-l-4 border-blue-500 pl-3">
+                    <i class="fas fa-stream mr-2"></i> Playlist
                 </h2>
-                <div class="track-list space-y-2">
-                    {files_html}
+                <div class="flex items-center space-x-2">
+                    <label class="flex items-center space-x-2 text-sm text-gray-700 flex-grow">
+                        <input type="checkbox" id="playlistShuffle"> <span>Shuffle</span>
+                    </label>
+                    <select id="playlistRepeat" class="px-3 py-2 text-sm text-gray-700 border border-gray-300 rounded-lg focus:outline-none focus:ring-2 focus:ring-blue-500">
+                        <option value="off">Repeat off</option>
+                        <option value="all">Repeat all</option>
+                        <option value="one">Repeat one</option>
+                    </select>
+                    <button id="nextButton" class="bg-blue-600 hover:bg-blue-700 text-white font-semibold py-2 px-4 rounded-lg shadow-md"><i class="fas fa-forward mr-2"></i>Next</button>
+                    <button id="playlistClear" class="bg-gray-400 hover:bg-gray-500 text-white font-semibold py-2 px-4 rounded-lg shadow-md">Clear</button>
                 </div>
+                <ol id="playlistTracks" class="space-y-1 text-gray-700"></ol>
+                <p id="playlistEmpty" class="text-sm text-gray-400 text-center">Add tracks with <i class="fas fa-plus"></i> to play them back to back.</p>
             </section>
 
             <section class="space-y-4 pt-4 border-t border-gray-200">
@@ -82,6 +125,11 @@ def generate_html_page(current_track):
                         <span id="recordButtonText">Start Recording</span>
                     </button>
                     <p id="recordingStatus" class="text-sm text-gray-500 text-center hidden">Recording in progress...</p>
+                    <button id="liveButton" class="w-full bg-purple-600 hover:bg-purple-700 text-white font-bold py-3 px-4 rounded-lg shadow-md transition duration-150 ease-in-out flex items-center justify-center space-x-2">
+                        <i class="fas fa-broadcast-tower"></i>
+                        <span id="liveButtonText">Go Live</span>
+                    </button>
+                    <p id="liveStatus" class="text-sm text-gray-500 text-center hidden">Live on <strong>/live</strong></p>
                 </div>
             </section>
 
@@ -112,6 +160,15 @@ def generate_html_page(current_track):
             let mediaRecorder = null;
             let audioChunks = [];
             let audioStream = null;
+            let liveRecorder = null;
+            let currentFilename = null;
+            const TRACK_PAGE_SIZE = 50;
+            let trackOffset = 0;
+            let trackTotal = null;
+            let trackLoading = false;
+            let trackQuery = 0;      // Bumped on search/sort so stale pages are dropped
+            let searchTimer = null;
+            let livePush = Promise.resolve();
 
             function showModal(title, message, isSuccess) {{
                 const overlay = document.getElementById('modalOverlay');
@@ -142,10 +199,27 @@ def generate_html_page(current_track):
                 setTimeout(() => {{
                     overlay.classList.remove('flex');
                     overlay.classList.add('hidden');
-                    window.location.reload(); 
+                    refreshPage();
                 }}, 300);
             }}
 
+            async function waitForJob(jobId, onProgress = null) {{
+                if (!jobId) {{
+                    return {{ status: 'done' }};  // Served from the transcode cache
+                }}
+                while (true) {{
+                    const response = await fetch(`/jobs/${{jobId}}`);
+                    const job = await response.json();
+                    if (job.status === 'done' || job.status === 'failed') {{
+                        return job;
+                    }}
+                    if (onProgress) {{
+                        onProgress(job);
+                    }}
+                    await new Promise(resolve => setTimeout(resolve, 500));
+                }}
+            }}
+
             async function handleRecordButton() {{
                 const recordButton = document.getElementById('recordButton');
                 const recordingStatus = document.getElementById('recordingStatus');
@@ -195,7 +269,14 @@ def generate_html_page(current_track):
                                 body: audioBlob
                             }});
 
-                            const result = await response.json();
+                            let result = await response.json();
+
+                            if (result.success) {{
+                                const job = await waitForJob(result.job_id);
+                                if (job.status !== 'done') {{
+                                    result = {{ success: false, message: job.error || 'Conversion failed' }};
+                                }}
+                            }}
 
                             if (result.success) {{
                                 isRecording = false;
@@ -225,6 +306,59 @@ def generate_html_page(current_track):
                 }}
             }}
 
+            async function handleLiveButton() {{
+                const liveButton = document.getElementById('liveButton');
+                const liveButtonText = document.getElementById('liveButtonText');
+                const liveStatus = document.getElementById('liveStatus');
+                const recordingName = document.getElementById('recordingName');
+
+                if (!liveRecorder) {{
+                    // Go Live
+                    let liveStream = null;
+                    try {{
+                        liveStream = await navigator.mediaDevices.getUserMedia({{ audio: true }});
+                        const name = recordingName.value.trim() || 'live';
+                        const response = await fetch(`/live/start?name=${{encodeURIComponent(name)}}`, {{ method: 'POST' }});
+                        const result = await response.json();
+                        if (!result.success) {{
+                            throw new Error(result.message);
+                        }}
+                    }} catch (error) {{
+                        if (liveStream) liveStream.getTracks().forEach(track => track.stop());
+                        console.error('Live start error:', error);
+                        showModal('Live Error', 'Unable to go live: ' + error.message, false);
+                        return;
+                    }}
+
+                    liveRecorder = new MediaRecorder(liveStream);
+                    liveRecorder.ondataavailable = (event) => {{
+                        if (event.data.size === 0) return;
+                        const chunk = event.data;
+                        // Chain pushes so timeslices reach the encoder in order
+                        livePush = livePush
+                            .then(() => fetch('/live/push', {{ method: 'POST', body: chunk }}))
+                            .catch(error => console.error('Live push error:', error));
+                    }};
+                    liveRecorder.onstop = () => {{
+                        liveStream.getTracks().forEach(track => track.stop());
+                        livePush = livePush.then(() => fetch('/live/stop', {{ method: 'POST' }}));
+                    }};
+                    liveRecorder.start({LIVE_TIMESLICE_MS});
+
+                    liveButton.classList.add('recording-pulse');
+                    liveButtonText.textContent = 'Stop Live';
+                    liveStatus.innerHTML = `Live on <strong>http://${{location.host}}/live</strong>`;
+                    liveStatus.classList.remove('hidden');
+                }} else {{
+                    // End Live
+                    liveRecorder.stop();
+                    liveRecorder = null;
+                    liveButton.classList.remove('recording-pulse');
+                    liveButtonText.textContent = 'Go Live';
+                    liveStatus.classList.add('hidden');
+                }}
+            }}
+
             async function handleUpload(event) {{
                 event.preventDefault(); 
 
@@ -248,7 +382,14 @@ def generate_html_page(current_track):
                     const result = await response.json();
 
                     if (response.ok && result.success) {{
-                        showModal('Upload Successful!', `File <strong>${{result.filename}}</strong> has been uploaded.`, true);
+                        const job = await waitForJob(result.job_id, (job) => {{
+                            button.innerHTML = `<i class="fas fa-spinner fa-spin mr-2"></i> Converting... ${{Math.round(job.progress * 100)}}%`;
+                        }});
+                        if (job.status === 'done') {{
+                            showModal('Upload Successful!', `File <strong>${{result.filename}}</strong> has been uploaded.`, true);
+                        }} else {{
+                            showModal('Conversion Failed!', `Error: ${{job.error || 'Unknown ffmpeg error.'}}`, false);
+                        }}
                     }} else {{
                         showModal('Upload Failed!', `Error: ${{result.error || 'Unknown server error.'}}`, false);
                     }}
@@ -262,32 +403,181 @@ def generate_html_page(current_track):
                 }}
             }}
 
+            function formatDuration(seconds) {{
+                const minutes = Math.floor(seconds / 60);
+                return `${{minutes}}:${{String(Math.floor(seconds % 60)).padStart(2, '0')}}`;
+            }}
+
+            function renderTrack(track) {{
+                const row = document.createElement('div');
+                row.className = 'flex justify-between items-center p-3 bg-gray-50 rounded-lg border border-gray-200 hover:bg-gray-100 transition duration-150 ease-in-out';
+
+                const name = document.createElement('span');
+                name.className = 'text-gray-800 font-medium text-lg truncate pr-4 flex-grow';
+                name.textContent = track.name;
+
+                const details = document.createElement('span');
+                details.className = 'text-sm text-gray-500 pr-4 flex-shrink-0';
+                details.textContent = `${{formatDuration(track.duration)}} · ${{track.bitrate}} kbps`;
+
+                const buttons = document.createElement('div');
+                buttons.className = 'flex space-x-2 flex-shrink-0';
+                const play = document.createElement('button');
+                if (track.name === currentFilename) {{
+                    play.className = 'stop-btn bg-red-600 hover:bg-red-700 text-white font-semibold py-2 px-4 rounded-full shadow-md transition duration-150 ease-in-out';
+                    play.innerHTML = '<i class="fas fa-stop mr-2"></i>Stop';
+                    play.onclick = () => controlAction('/stop');
+                }} else {{
+                    play.className = 'play-btn bg-blue-600 hover:bg-blue-700 text-white font-semibold py-2 px-4 rounded-full shadow-md transition duration-150 ease-in-out';
+                    play.innerHTML = '<i class="fas fa-play mr-2"></i>Play';
+                    play.onclick = () => controlAction('/play', track.name);
+                }}
+                const queue = document.createElement('button');
+                queue.className = 'bg-gray-200 hover:bg-gray-300 text-gray-700 font-semibold py-2 px-4 rounded-full shadow-md transition duration-150 ease-in-out';
+                queue.title = 'Add to playlist';
+                queue.innerHTML = '<i class="fas fa-plus"></i>';
+                queue.onclick = () => playlistAction('add', track.name);
+                const remove = document.createElement('button');
+                remove.className = 'delete-btn bg-gray-400 hover:bg-gray-500 text-white font-semibold py-2 px-4 rounded-full shadow-md transition duration-150 ease-in-out';
+                remove.innerHTML = '<i class="fas fa-trash-alt"></i>';
+                remove.onclick = () => controlAction('/delete', track.name);
+
+                buttons.append(play, queue, remove);
+                row.append(name, details, buttons);
+                return row;
+            }}
+
+            async function loadTracks(reset = false) {{
+                const trackList = document.getElementById('trackList');
+                const sentinel = document.getElementById('trackSentinel');
+                if (reset) {{
+                    trackQuery++;
+                    trackOffset = 0;
+                    trackTotal = null;
+                    trackList.innerHTML = '';
+                }} else if (trackLoading || (trackTotal !== null && trackOffset >= trackTotal)) {{
+                    return;
+                }}
+
+                const query = trackQuery;
+                const [sort, order] = document.getElementById('trackSort').value.split(':');
+                const params = new URLSearchParams({{
+                    offset: trackOffset, limit: TRACK_PAGE_SIZE, sort: sort, order: order,
+                    q: document.getElementById('trackSearch').value.trim()
+                }});
+                trackLoading = true;
+                try {{
+                    const response = await fetch(`/library?${{params}}`);
+                    const data = await response.json();
+                    if (query !== trackQuery) return;   // A newer search replaced this one
+
+                    data.tracks.forEach(track => trackList.appendChild(renderTrack(track)));
+                    trackOffset += data.tracks.length;
+                    trackTotal = data.total;
+                    if (!params.get('q')) document.getElementById('trackCount').textContent = data.total;
+                    sentinel.textContent = trackOffset < trackTotal ? 'Loading tracks...' : (trackTotal ? '' : 'No tracks found.');
+                }} catch (error) {{
+                    console.error('Error loading tracks:', error);
+                    sentinel.textContent = 'Could not load tracks.';
+                }} finally {{
+                    if (query === trackQuery) {{
+                        trackLoading = false;
+                        // Re-observe so a still-visible sentinel pulls the next page
+                        trackObserver.unobserve(sentinel);
+                        trackObserver.observe(sentinel);
+                    }}
+                }}
+            }}
+
+            const trackObserver = new IntersectionObserver(entries => {{
+                if (entries.some(entry => entry.isIntersecting)) loadTracks();
+            }});
+
+            function applyStatus(data) {{
+                const statusElement = document.getElementById('current-track-status');
+                const isPlaying = data.currentTrack !== 'None';
+                
+                document.getElementById('current-track-name').textContent = data.currentTrack;
+                
+                const baseClasses = 'p-4 rounded-lg text-center font-bold text-lg border-2';
+                if (isPlaying) {{
+                    statusElement.className = `${{baseClasses}} bg-green-50 border-green-500 text-green-700`;
+                }} else {{
+                    statusElement.className = `${{baseClasses}} bg-yellow-50 border-yellow-500 text-yellow-700`;
+                }}
+
+                const playing = isPlaying ? data.currentTrack : null;
+                if (playing !== currentFilename) {{
+                    // Re-render rows so the Play/Stop buttons follow the new track
+                    currentFilename = playing;
+                    loadTracks(true);
+                    loadPlaylist();
+                }}
+            }}
+
             function updateStatus() {{
                 fetch('/status')
                 .then(response => response.json())
-                .then(data => {{
-                    const statusElement = document.getElementById('current-track-status');
-                    const isPlaying = data.currentTrack !== 'None';
-                    
-                    statusElement.innerHTML = `Current Track: <strong>${{data.currentTrack}}</strong>`;
-                    
-                    const baseClasses = 'p-4 rounded-lg text-center font-bold text-lg border-2';
-                    if (isPlaying) {{
-                        statusElement.className = `${{baseClasses}} bg-green-50 border-green-500 text-green-700`;
-                    }} else {{
-                        statusElement.className = `${{baseClasses}} bg-yellow-50 border-yellow-500 text-yellow-700`;
-                    }}
-
-                    const currentTrackName = statusElement.getAttribute('data-current-track');
-                    
-                    if (currentTrackName != data.currentTrack) {{
-                        statusElement.setAttribute('data-current-track', data.currentTrack);
-                        window.location.reload(); 
-                    }}
-                }})
+                .then(applyStatus)
                 .catch(error => console.error('Error fetching status:', error));
             }}
 
+            let libraryTimer = null;
+
+            function subscribeEvents() {{
+                // The server pushes state changes; EventSource reconnects (with Last-Event-ID) by itself
+                const events = new EventSource('/events');
+                events.addEventListener('state', event => applyStatus(JSON.parse(event.data)));
+                events.addEventListener('playlist', event => renderPlaylist(JSON.parse(event.data)));
+                events.addEventListener('library', () => {{
+                    // A rescan can publish a burst of changes; reload the list once
+                    clearTimeout(libraryTimer);
+                    libraryTimer = setTimeout(() => loadTracks(true), 500);
+                }});
+            }}
+
+            function renderPlaylist(data) {{
+                document.getElementById('playlistShuffle').checked = data.shuffle;
+                document.getElementById('playlistRepeat').value = data.repeat;
+                const list = document.getElementById('playlistTracks');
+                list.innerHTML = '';
+                data.order.forEach(name => {{
+                    const item = document.createElement('li');
+                    item.className = 'flex items-center justify-between p-2 bg-gray-50 rounded-lg';
+                    const label = document.createElement('span');
+                    label.className = 'truncate pr-4';
+                    label.textContent = name === data.next ? `${{name}} (next)` : name;
+                    const remove = document.createElement('button');
+                    remove.className = 'text-gray-400 hover:text-red-600';
+                    remove.innerHTML = '<i class="fas fa-times"></i>';
+                    remove.onclick = () => playlistAction('remove', name);
+                    item.append(label, remove);
+                    list.appendChild(item);
+                }});
+                document.getElementById('playlistEmpty').classList.toggle('hidden', data.order.length > 0);
+            }}
+
+            function loadPlaylist() {{
+                fetch('/playlist')
+                .then(response => response.json())
+                .then(renderPlaylist)
+                .catch(error => console.error('Error loading playlist:', error));
+            }}
+
+            function playlistAction(action, filename = null, query = null) {{
+                const params = new URLSearchParams(query || {{}});
+                if (filename) params.set('file', filename);
+                fetch(`/playlist/${{action}}?${{params}}`, {{method: 'POST'}})
+                .then(response => response.json())
+                .then(renderPlaylist)
+                .catch(error => console.error('Error updating playlist:', error));
+            }}
+
+            function refreshPage() {{
+                updateStatus();
+                loadTracks(true);
+            }}
+
             function controlAction(endpoint, filename = null) {{
                 let url = endpoint;
                 if (filename) {{
@@ -297,18 +587,37 @@ def generate_html_page(current_track):
                 .then(response => response.text())
                 .then(text => {{
                     console.log(text);
-                    window.location.reload(); 
+                    refreshPage();
                 }})
                 .catch(error => console.error('Error during control action:', error));
             }}
 
             document.getElementById('recordButton').addEventListener('click', handleRecordButton);
+            document.getElementById('liveButton').addEventListener('click', handleLiveButton);
+            document.getElementById('trackSort').addEventListener('change', () => loadTracks(true));
+            document.getElementById('trackSearch').addEventListener('input', () => {{
+                clearTimeout(searchTimer);
+                searchTimer = setTimeout(() => loadTracks(true), 250);
+            }});
+            trackObserver.observe(document.getElementById('trackSentinel'));
+            document.getElementById('playlistShuffle').addEventListener('change', event => playlistAction('mode', null, {{shuffle: event.target.checked ? '1' : '0'}}));
+            document.getElementById('playlistRepeat').addEventListener('change', event => playlistAction('mode', null, {{repeat: event.target.value}}));
+            document.getElementById('playlistClear').addEventListener('click', () => playlistAction('clear'));
+            document.getElementById('nextButton').addEventListener('click', () => controlAction('/next'));
 
             window.addEventListener('load', () => {{
-                updateStatus();
-                setInterval(updateStatus, 2000); 
+                loadPlaylist();
+                if (window.EventSource) {{
+                    subscribeEvents();
+                }} else {{
+                    updateStatus();
+                    setInterval(updateStatus, 2000);
+                }}
             }});
         </script>
     </body>
     </html>
-    """
\ No newline at end of file
+    """
+
+# Rendered once at import; nothing on the page depends on request or library state
+index_page = StaticPage(generate_html_page())
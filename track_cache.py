@@ -0,0 +1,130 @@
+"""
+In-memory track cache for MP3 Streamer
+Keeps the bytes of recently streamed tracks within a TRACK_CACHE_MB budget,
+least recently used first out, so the hot tracks most listeners share are
+served from memory instead of being opened and read per request. A miss
+never blocks a stream: the request is served from disk while the track is
+read in the background for the next one. Entries are checked against the
+file's inode, size and mtime on every lookup, so a re-upload (the name is
+relinked to a new blob) or a delete is never served stale; blob_store also
+drops them eagerly to free the memory. A track that doesn't fit (or any
+track, with the cache disabled) still gets its start read ahead into the
+page cache.
+"""
+import os
+import threading
+from collections import OrderedDict
+from config import TRACK_CACHE_MB
+from utils import advise_sequential
+
+READAHEAD_BYTES = 1024 * 1024   # Start of an upcoming track pre-read when it isn't cached in memory
+
+class TrackCache:
+    def __init__(self, budget_mb=TRACK_CACHE_MB):
+        self.budget = int(budget_mb * 1024 * 1024)
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()   # path -> ((ino, size, mtime_ns), data)
+        self.resident = 0
+        self.loading = set()
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.evictions = 0
+        self.readaheads = 0
+
+    def get(self, path):
+        """Cached bytes of path, or None (and a background load) on a miss."""
+        if self.budget <= 0:
+            return None
+        identity = _identity(path)
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry and entry[0] == identity:
+                self.entries.move_to_end(path)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        self.prefetch(path)
+        return None
+
+    def prefetch(self, path):
+        """Read path into the cache in the background if it fits and isn't cached already; otherwise read ahead its start."""
+        identity = _identity(path)
+        if identity is None:
+            return
+        if identity[1] > self.budget:
+            self._read_ahead(path)
+            return
+        with self.lock:
+            entry = self.entries.get(path)
+            if path in self.loading or (entry and entry[0] == identity):
+                return
+            self.loading.add(path)
+        threading.Thread(target=self._load, args=(path,), name="track-cache", daemon=True).start()
+
+    def invalidate(self, path):
+        """Drop path (track re-uploaded or deleted)."""
+        with self.lock:
+            entry = self.entries.pop(path, None)
+            if entry:
+                self.resident -= len(entry[1])
+
+    def get_status(self):
+        """Hit ratio and resident size, for sizing TRACK_CACHE_MB."""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "tracks": len(self.entries),
+                "residentBytes": self.resident,
+                "budgetBytes": self.budget,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRatio": round(self.hits / lookups, 3) if lookups else None,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "readaheads": self.readaheads
+            }
+
+    def _read_ahead(self, path):
+        """Have the kernel read the start of path into the page cache (returns without waiting for it)."""
+        try:
+            with open(path, 'rb') as f:
+                advise_sequential(f, READAHEAD_BYTES)
+        except OSError:
+            return
+        with self.lock:
+            self.readaheads += 1
+
+    def _load(self, path):
+        try:
+            with open(path, 'rb') as f:
+                identity = _identity_of(os.fstat(f.fileno()))
+                data = f.read()
+            with self.lock:
+                old = self.entries.pop(path, None)
+                if old:
+                    self.resident -= len(old[1])
+                self.entries[path] = (identity, data)
+                self.resident += len(data)
+                self.loads += 1
+                while self.resident > self.budget:
+                    _, (_, evicted) = self.entries.popitem(last=False)
+                    self.resident -= len(evicted)
+                    self.evictions += 1
+        except OSError as e:
+            print(f"Track cache: Could not read '{path}': {e}")
+        finally:
+            with self.lock:
+                self.loading.discard(path)
+
+def _identity(path):
+    try:
+        return _identity_of(os.stat(path))
+    except OSError:
+        return None
+
+def _identity_of(st):
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+# Global track cache instance
+track_cache = TrackCache()
@@ -0,0 +1,127 @@
+"""
+ffmpeg transcoding helpers for MP3 Streamer
+"""
+import hashlib
+import io
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+from collections import deque
+from config import FFMPEG_PATH, UPLOAD_MEMORY_SPOOL
+
+# Uploads are stored as 64 kbps mono MP3, browser recordings as 48 kbps
+UPLOAD_ENCODE_ARGS = ["-ac", "1", "-ar", "22050", "-b:a", "64k", "-f", "mp3"]
+RECORDING_ENCODE_ARGS = ["-ac", "1", "-ar", "22050", "-b:a", "48k", "-f", "mp3"]
+
+def rendition_args(kbps):
+    """Output args for a /stream?br= rendition. Same rate and channels as the
+    library file, so players can switch between renditions mid-stream."""
+    return ["-ac", "1", "-ar", "22050", "-b:a", f"{kbps}k", "-f", "mp3"]
+
+# Low-CPU device formats: WAV at the library rate, decodable without an MP3 decoder
+DEVICE_FORMAT_ARGS = {
+    'adpcm': ["-ac", "1", "-ar", "22050", "-c:a", "adpcm_ima_wav", "-f", "wav"],   # 4 bits/sample, 1024-byte blocks
+    'ulaw': ["-ac", "1", "-ar", "22050", "-c:a", "pcm_mulaw", "-f", "wav"],
+    'pcm8': ["-ac", "1", "-ar", "22050", "-c:a", "pcm_u8", "-f", "wav"],
+}
+
+# Containers whose index may sit at the end of the file can't be read from a pipe
+SEEKABLE_INPUT_EXTS = ('.m4a', '.mp4', '.mov', '.3gp')
+
+DURATION_RE = re.compile(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)')
+OUT_TIME_RE = re.compile(r'out_time=(\d+):(\d+):(\d+(?:\.\d+)?)')
+
+def _seconds(match):
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+def spool_upload(chunks, suffix):
+    """
+    Collect an upload for ffmpeg; returns (path, data, sha256 hex) with exactly
+    one of path/data set. Small uploads stay in memory and are piped to ffmpeg;
+    larger ones (and containers ffmpeg must seek in) roll over to a unique
+    anonymous temp file.
+    """
+    digest = hashlib.sha256()
+    buf = bytearray()
+    in_memory = not suffix.lower().endswith(SEEKABLE_INPUT_EXTS)
+    chunks = iter(chunks)
+
+    if in_memory:
+        for chunk in chunks:
+            digest.update(chunk)
+            buf += chunk
+            if len(buf) > UPLOAD_MEMORY_SPOOL:
+                break
+        else:
+            return None, bytes(buf), digest.hexdigest()
+
+    fd, temp_path = tempfile.mkstemp(suffix=suffix)
+    try:
+        with os.fdopen(fd, 'wb') as temp:
+            temp.write(buf)
+            for chunk in chunks:
+                digest.update(chunk)
+                temp.write(chunk)
+    except Exception:
+        os.remove(temp_path)
+        raise
+    return temp_path, None, digest.hexdigest()
+
+def ffmpeg_command(input_path, args, output_path):
+    """ffmpeg command line for one conversion (input_path None reads stdin)."""
+    return [FFMPEG_PATH, "-y", "-nostats", "-progress", "pipe:2",
+            "-i", input_path or "pipe:0"] + list(args) + [output_path]
+
+def run_ffmpeg(input_path, args, output_path, input_data=None, on_progress=None):
+    """
+    Run one ffmpeg conversion. Reads input_path, or input_data over stdin when
+    input_path is None. on_progress(fraction) is called as ffmpeg reports
+    progress. Raises CalledProcessError (with ffmpeg's last lines) on failure.
+    """
+    process = subprocess.Popen(ffmpeg_command(input_path, args, output_path),
+                               stdin=subprocess.PIPE if input_data is not None else subprocess.DEVNULL,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    wait_ffmpeg(process, input_data, on_progress)
+
+def wait_ffmpeg(process, input_data=None, on_progress=None):
+    """
+    Drive a started ffmpeg to completion: feed input_data (bytes or an open
+    file) to its stdin, report progress and raise CalledProcessError on failure.
+    """
+    if input_data is not None:
+        # Feed stdin from a helper thread so a full stderr pipe can't deadlock us
+        threading.Thread(target=_feed_stdin, args=(process, input_data), daemon=True).start()
+
+    duration = None
+    tail = deque(maxlen=20)
+    for line in io.TextIOWrapper(process.stderr, encoding='utf-8', errors='replace'):
+        tail.append(line.rstrip())
+        if duration is None:
+            match = DURATION_RE.search(line)
+            if match:
+                duration = _seconds(match)
+        match = OUT_TIME_RE.match(line)
+        if match and duration and on_progress:
+            on_progress(min(1.0, _seconds(match) / duration))
+
+    returncode = process.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, FFMPEG_PATH, stderr="\n".join(tail))
+
+def _feed_stdin(process, data):
+    try:
+        if hasattr(data, 'read'):
+            shutil.copyfileobj(data, process.stdin)
+        else:
+            process.stdin.write(data)
+    except (BrokenPipeError, OSError):
+        pass  # ffmpeg exited early; its return code says why
+    finally:
+        try:
+            process.stdin.close()
+        except OSError:
+            pass
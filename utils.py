@@ -1,7 +1,9 @@
 """
 Utility functions for MP3 Streamer project.
 """
+import os
 import socket
+import time
 
 def get_local_ip():
     """Utility function to reliably get the local IP address."""
@@ -17,4 +19,61 @@ def get_local_ip():
 
 def escape_html(text):
     """Escape HTML special characters."""
-    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
\ No newline at end of file
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
+
+def advise_sequential(f, length=0):
+    """Hint the kernel that a file will be read front to back (no-op where unsupported)."""
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        fd = f.fileno()
+        os.posix_fadvise(fd, 0, length, os.POSIX_FADV_SEQUENTIAL)
+        os.posix_fadvise(fd, 0, length, os.POSIX_FADV_WILLNEED)
+    except OSError:
+        pass
+
+def wake_async_waiters(waiters):
+    """Resolve (loop, future) pairs from another thread with one callback per loop."""
+    by_loop = {}
+    for loop, future in waiters:
+        by_loop.setdefault(loop, []).append(future)
+
+    for loop, futures in by_loop.items():
+        try:
+            loop.call_soon_threadsafe(_resolve_all, futures)
+        except RuntimeError:
+            pass  # Loop already closed
+
+def _resolve_all(futures):
+    for future in futures:
+        if not future.done():
+            future.set_result(None)
+
+class Pacer:
+    """Keeps media sent within a fixed lead of real time; delay() is how long to wait."""
+    def __init__(self, lead_seconds):
+        self.lead_seconds = lead_seconds
+        self.started = None
+        self.media_seconds = 0.0
+
+    def advance(self, seconds):
+        """Record that another `seconds` of audio has been sent."""
+        if self.started is None:
+            self.started = time.monotonic()
+        self.media_seconds += seconds
+
+    def elapsed(self):
+        """Wall-clock seconds since the first advance()."""
+        if self.started is None:
+            return 0.0
+        return time.monotonic() - self.started
+
+    def lead(self):
+        """Seconds of audio sent ahead of real time."""
+        return self.media_seconds - self.elapsed()
+
+    def delay(self):
+        """Seconds to wait before sending more to stay within the lead."""
+        if self.started is None:
+            return 0.0
+        return self.lead() - self.lead_seconds
\ No newline at end of file
@@ -0,0 +1,68 @@
+"""
+WAV block parsing for MP3 Streamer
+Device-format renditions (IMA-ADPCM, u-law, 8-bit PCM) are WAV files. Their
+audio is cut into fixed-size blocks the way MP3 is cut into frames, so the
+frame index, seeking, resume and pacing work on them unchanged.
+"""
+import os
+import struct
+
+WAVE_FORMAT_IMA_ADPCM = 0x11
+PCM_BLOCK_BYTES = 1024   # Formats whose natural block is a single sample are indexed in runs of about this size
+HEADER_SCAN = 4096
+
+def is_wav(data):
+    return len(data) >= 12 and data[:4] == b'RIFF' and data[8:12] == b'WAVE'
+
+def parse_header(data):
+    """
+    Parse the start of a WAV file.
+    Returns (data_offset, data_size, block_length, block_duration) or None if it is not a WAV we can index.
+    """
+    if not is_wav(data):
+        return None
+
+    layout = None
+    pos = 12
+    while pos + 8 <= len(data):
+        chunk_id, size = struct.unpack_from('<4sI', data, pos)
+        body = pos + 8
+        if chunk_id == b'fmt ' and size >= 16 and body + size <= len(data):
+            tag, channels, sample_rate, _, block_align, bits = struct.unpack_from('<HHIIHH', data, body)
+            if tag == WAVE_FORMAT_IMA_ADPCM and size >= 20:
+                samples = struct.unpack_from('<H', data, body + 18)[0]   # wSamplesPerBlock
+            else:
+                samples = 1
+            if block_align == 0 or sample_rate == 0 or samples == 0:
+                return None
+            runs = max(1, PCM_BLOCK_BYTES // block_align)
+            layout = (block_align * runs, samples * runs / sample_rate)
+        elif chunk_id == b'data':
+            if layout is None:
+                return None
+            return body, size, layout[0], layout[1]
+        pos = body + size + (size & 1)
+    return None
+
+def sized_header(header, data_size):
+    """header (everything before the audio) with the RIFF and data sizes set for data_size bytes of audio."""
+    patched = bytearray(header)
+    struct.pack_into('<I', patched, 4, len(header) - 8 + data_size)
+    struct.pack_into('<I', patched, len(header) - 4, data_size)
+    return bytes(patched)
+
+def iter_blocks(path):
+    """Yield (offset, length, duration) for every complete audio block in the WAV file at path."""
+    with open(path, 'rb') as f:
+        parsed = parse_header(f.read(HEADER_SCAN))
+        file_size = os.fstat(f.fileno()).st_size
+    if parsed is None:
+        return
+
+    offset, data_size, length, duration = parsed
+    # A size of 0 or 0xFFFFFFFF means the writer couldn't seek back to fill it in
+    end = offset + data_size if 0 < data_size < 0xFFFFFFFF else file_size
+    end = min(end, file_size)
+    while offset + length <= end:
+        yield offset, length, duration
+        offset += length